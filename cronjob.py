@@ -1,6 +1,14 @@
-import requests
+import argparse
+import datetime
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
 CVAT_API_URL = os.environ.get("CVAT_API_URL")
@@ -8,48 +16,199 @@ CVAT_API_TOKEN = os.environ.get("CVAT_API_TOKEN")
 AGS_API_URL = os.environ.get("AGS_API_URL")
 AGS_API_TOKEN = os.environ.get("AGS_API_TOKEN")
 
-def get_missing_scans():
+CRON_CONCURRENCY = int(os.environ.get("CRON_CONCURRENCY", 8))
+CRON_BATCH_SIZE = int(os.environ.get("CRON_BATCH_SIZE", 100))
+CRON_CHECKPOINT_PATH = os.environ.get("CRON_CHECKPOINT_PATH", "/home/cronjob.checkpoint.json")
+CRON_LOOKUP_ATTEMPTS = int(os.environ.get("CRON_LOOKUP_ATTEMPTS", 3))
+CRON_LOOKUP_RETRY_DELAY = float(os.environ.get("CRON_LOOKUP_RETRY_DELAY", 5))
+
+ORIENTATIONS = ('front', 'back')
+
+def create_session(concurrency):
+    session = requests.Session()
+    # Every worker and the log flusher may hold a connection at the same time
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency + 2)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                count, total, worst = self._stages.get(stage, (0, 0.0, 0.0))
+                self._stages[stage] = (count + 1, total + elapsed, max(worst, elapsed))
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._started
+        processed = sum(self._counters.values())
+        lines = ["Processed {} items in {:.1f}s ({:.2f} items/sec)".format(
+            processed, elapsed, processed / elapsed if elapsed else 0.0)]
+        for name, value in sorted(self._counters.items()):
+            lines.append("  {}: {}".format(name, value))
+        for stage, (count, total, worst) in sorted(self._stages.items()):
+            lines.append("  {:<16} calls={:<6} avg={:.3f}s max={:.3f}s total={:.1f}s".format(
+                stage, count, total / count, worst, total))
+        return "\n".join(lines)
+
+class Checkpoint:
+    """Remembers processed certificates so that an interrupted run can be resumed.
+    Marks count against the daily quota, so a checkpoint of another day is discarded."""
+
+    def __init__(self, path, date=None):
+        self._path = path
+        self._date = (date or datetime.date.today()).isoformat()
+        self._lock = threading.Lock()
+        self._done = {orientation: {} for orientation in ORIENTATIONS}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('date') == self._date:
+                for orientation in ORIENTATIONS:
+                    self._done[orientation].update(saved.get(orientation, {}))
+            else:
+                print("Discarding the checkpoint of {}".format(saved.get('date')))
+
+    def get(self, cert_id, orientation):
+        with self._lock:
+            return self._done[orientation].get(str(cert_id))
+
+    def scanned(self, orientation):
+        with self._lock:
+            return len(self._done[orientation])
+
+    def mark(self, cert_id, orientation, status):
+        with self._lock:
+            self._done[orientation][str(cert_id)] = status
+
+    def flush(self):
+        """Saves the marks, it is called once per batch"""
+        if not self._path:
+            return
+        with self._lock:
+            tmp_path = self._path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(self._done, date=self._date), f)
+            os.replace(tmp_path, self._path)
+
+    def remove(self):
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
+
+class ScanLogBatcher:
+    """Collects cron scan logs and sends them from a background thread,
+    so workers never wait for the logging endpoint"""
+
+    def __init__(self, session, stats, batch_size=50, flush_interval=2.0):
+        self._session = session
+        self._stats = stats
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, certificate_id, orientation, status, image_type=None, order_id=None):
+        with self._cond:
+            self._queue.append((certificate_id, orientation, status, image_type, order_id))
+            if len(self._queue) >= self._batch_size:
+                self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self._batch_size:
+                    self._cond.wait(self._flush_interval)
+                batch, self._queue = self._queue, []
+                closed = self._closed
+            for entry in batch:
+                try:
+                    with self._stats.measure('scan_log'):
+                        post_cron_scan_logs(*entry, session=self._session)
+                except requests.exceptions.RequestException as err:
+                    print("Failed to post a scan log for {}: {}".format(entry[0], err))
+            if closed and not batch:
+                return
+
+def get_missing_scans(session=requests):
     url = f"{AGS_API_URL}/missing-scans/"
     headers = {
         'Authorization': f'Bearer {AGS_API_TOKEN}',
     }
-    response = requests.request("GET", url, headers=headers, data={})
+    response = session.request("GET", url, headers=headers, data={})
     response = response.json()
     daily_scan_amount = response.get("daily_scan_amount")
     front_missing_list = response.get("front_missing_list")
     back_missing_list = response.get("back_missing_list")
     return daily_scan_amount, front_missing_list, back_missing_list
 
-def get_grade_parameters(cert_id, orientation):
+def get_grade_parameters(cert_id, orientation, session=requests):
     url = f"{CVAT_API_URL}/v1/grade-parameters"
     headers = {
         'Content-Type': 'application/x-www-form-urlencoded',
         'Authorization': f'Basic {CVAT_API_TOKEN}'
     }
     payload = f"certificate_id={cert_id}&orientation={orientation}&task_status=completed"
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = session.request("POST", url, headers=headers, data=payload)
     response = response.json()
     order_id = response.get("order_id")
     certificate_id = response.get("certificate_id")
     result = response.get("result")
     return order_id, certificate_id, result
 
-def post_cvat_to_grade(filename, payload, orientation, certificate_id, image_type, image_path):
+def get_grade_parameters_bulk(cert_ids, orientation, session=requests):
+    url = f"{CVAT_API_URL}/v1/grade-parameters-bulk"
+    headers = {
+        'Authorization': f'Basic {CVAT_API_TOKEN}'
+    }
+    payload = {
+        "certificates": [{"certificate_id": cert_id, "orientation": orientation} for cert_id in cert_ids],
+        "task_status": "completed",
+    }
+    response = session.request("POST", url, headers=headers, json=payload)
+    response.raise_for_status()
+    return response.json().get("results")
+
+def post_cvat_to_grade(filename, payload, orientation, certificate_id, image_type, image_path, session=requests):
     try:
         url = f"{AGS_API_URL}/cvat-to-grade/"
-        fields={'payload': payload, 'orientation': orientation, 'certificate_id': certificate_id, 'image_type': image_type}
-        fields['image'] = (filename, open(image_path,'rb'),'image/png')
-        multipart_form_data = MultipartEncoder(fields=fields)
-        headers = {
-            'Authorization': f'Bearer {AGS_API_TOKEN}',
-            'Content-Type': multipart_form_data.content_type,
-        }
-        response = requests.post(url, data=multipart_form_data, headers=headers)
+        with open(image_path, 'rb') as image_file:
+            fields={'payload': payload, 'orientation': orientation, 'certificate_id': certificate_id, 'image_type': image_type}
+            fields['image'] = (filename, image_file, 'image/png')
+            multipart_form_data = MultipartEncoder(fields=fields)
+            headers = {
+                'Authorization': f'Bearer {AGS_API_TOKEN}',
+                'Content-Type': multipart_form_data.content_type,
+            }
+            response = session.post(url, data=multipart_form_data, headers=headers)
         response.raise_for_status()
     except requests.exceptions.HTTPError as err:
         raise ValueError(err)
 
-def post_cron_scan_logs(certificate_id, orientation, status, image_type=None, order_id=None):
+def post_cron_scan_logs(certificate_id, orientation, status, image_type=None, order_id=None, session=requests):
     url = f"{AGS_API_URL}/cron-scan-logs/"
     headers = {
         'Content-Type': 'application/x-www-form-urlencoded',
@@ -60,68 +219,127 @@ def post_cron_scan_logs(certificate_id, orientation, status, image_type=None, or
         payload += f"&image_type={image_type}"
     if order_id:
         payload += f"&order_id={order_id}"
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = session.request("POST", url, headers=headers, data=payload)
 
-def scan_one_side(cert_id, orientation):
-    try:
-        order_id, certificate_id, result = get_grade_parameters(cert_id=cert_id, orientation=orientation)
-        if result is None:
-            return True
-    except Exception as e:
-        post_cron_scan_logs(
-            certificate_id=cert_id,
-            orientation=orientation,
-            status='cvat-missing'
-        )
-        return
+def upload_one_side(item, orientation, session, scan_logs, stats):
+    order_id = item.get("order_id")
+    certificate_id = item.get("certificate_id")
+    result = item.get("result")
+    image_type = result.get("image_type")
     try:
         filename = result.get("payload").get("filename")
         payload = json.dumps(result.get("payload"))
         orientation = result.get("orientation")
-        image_type = result.get("image_type")
         image_path = result.get("image_path")
-        post_cron_scan_logs(
-            certificate_id=certificate_id,
-            orientation=orientation,
-            status='in-progress',
-            image_type=image_type,
-            order_id=order_id
-        )
-        post_cvat_to_grade(
-            filename=filename, 
-            payload=payload, 
-            orientation=orientation, 
-            certificate_id=certificate_id,
-            image_type=image_type,
-            image_path=image_path
-        )
-        post_cron_scan_logs(
-            certificate_id=certificate_id,
-            orientation=orientation,
-            status='completed',
-            image_type=image_type,
-            order_id=order_id
-        )
+        scan_logs.add(certificate_id, orientation, 'in-progress', image_type, order_id)
+        with stats.measure('upload'):
+            post_cvat_to_grade(
+                filename=filename,
+                payload=payload,
+                orientation=orientation,
+                certificate_id=certificate_id,
+                image_type=image_type,
+                image_path=image_path,
+                session=session,
+            )
+        scan_logs.add(certificate_id, orientation, 'completed', image_type, order_id)
+        return 'completed'
     except Exception as e:
-        post_cron_scan_logs(
-            certificate_id=certificate_id,
-            orientation=orientation,
-            status='error',
-            image_type=image_type,
-            order_id=order_id
-        )
-
-daily_scan_amount, front_missing_list, back_missing_list = get_missing_scans()
-front_not_completed = 0
-back_not_completed = 0
-for i in range(daily_scan_amount + front_not_completed):
-    if i < len(front_missing_list):
-        skip = scan_one_side(cert_id=front_missing_list[i], orientation='front')
-        if skip == True:
-            front_not_completed += 1
-
-for i in range(daily_scan_amount + back_not_completed):
-    if i < len(back_missing_list):
-        skip = scan_one_side(cert_id=back_missing_list[i], orientation='back')
-        if skip == True:
-            back_not_completed += 1
\ No newline at end of file
+        scan_logs.add(certificate_id, orientation, 'error', image_type, order_id)
+        return 'error'
+
+def scan_batches(pending, orientation, daily_scan_amount, executor, session, scan_logs, checkpoint, stats, batch_size):
+    """Processes the certificates batch by batch until the quota is reached.
+    Returns the certificates of batches whose lookup failed, they are not marked."""
+
+    failed = []
+    position = 0
+    while position < len(pending):
+        remaining = daily_scan_amount - checkpoint.scanned(orientation)
+        if remaining <= 0:
+            break
+        # Every certificate in a batch may count, so never take more than the remaining quota
+        batch = pending[position:position + min(batch_size, remaining)]
+        position += len(batch)
+
+        try:
+            with stats.measure('lookup'):
+                items = get_grade_parameters_bulk(batch, orientation, session=session)
+        except Exception as e:
+            print("Failed to get grade parameters for a batch of {} certificates: {}".format(len(batch), e))
+            failed.extend(batch)
+            continue
+
+        futures = []
+        for cert_id, item in zip(batch, items):
+            if item.get("error"):
+                scan_logs.add(cert_id, orientation, 'cvat-missing')
+                checkpoint.mark(cert_id, orientation, 'cvat-missing')
+                stats.count('cvat-missing')
+            elif item.get("result") is None:
+                # The task isn't completed yet, check it again on the next run
+                stats.count('skipped')
+            else:
+                futures.append((cert_id, executor.submit(
+                    upload_one_side, item, orientation, session, scan_logs, stats)))
+
+        for cert_id, future in futures:
+            status = future.result()
+            checkpoint.mark(cert_id, orientation, status)
+            stats.count(status)
+        checkpoint.flush()
+
+    return failed
+
+def scan_side(missing_list, orientation, daily_scan_amount, executor, session, scan_logs, checkpoint, stats, batch_size):
+    """Uploads up to daily_scan_amount certificates of one side. Certificates
+    whose task is not completed yet don't count towards the limit."""
+
+    pending = [cert_id for cert_id in missing_list if checkpoint.get(cert_id, orientation) is None]
+    for attempt in range(CRON_LOOKUP_ATTEMPTS):
+        if attempt:
+            # A failed lookup is a problem of the request, not of the certificates
+            print("Retrying the lookup of {} certificates".format(len(pending)))
+            time.sleep(CRON_LOOKUP_RETRY_DELAY)
+        pending = scan_batches(pending, orientation, daily_scan_amount, executor, session,
+            scan_logs, checkpoint, stats, batch_size)
+        if not pending:
+            break
+
+    for _ in pending:
+        stats.count('lookup-failed')
+    if pending:
+        print("{} {} certificates are left for the next run".format(len(pending), orientation))
+
+def main():
+    parser = argparse.ArgumentParser(description='Send completed CVAT annotations of missing scans to AGS')
+    parser.add_argument('--concurrency', type=int, default=CRON_CONCURRENCY,
+        help='Number of parallel uploads (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=CRON_BATCH_SIZE,
+        help='Number of certificates requested from CVAT at once (default: %(default)s)')
+    parser.add_argument('--checkpoint', default=CRON_CHECKPOINT_PATH,
+        help='Path to the file used to resume an interrupted run (default: %(default)s)')
+    args = parser.parse_args()
+
+    stats = Stats()
+    session = create_session(args.concurrency)
+    checkpoint = Checkpoint(args.checkpoint)
+
+    with stats.measure('missing_scans'):
+        daily_scan_amount, front_missing_list, back_missing_list = get_missing_scans(session=session)
+
+    scan_logs = ScanLogBatcher(session, stats)
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for orientation, missing_list in zip(ORIENTATIONS, (front_missing_list, back_missing_list)):
+                scan_side(missing_list or [], orientation, daily_scan_amount, executor, session,
+                    scan_logs, checkpoint, stats, args.batch_size)
+    finally:
+        scan_logs.close()
+        checkpoint.flush()
+
+    checkpoint.remove()
+    print(stats.summary())
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,11 @@
 #
 # SPDX-License-Identifier: MIT
 
+import heapq
 from copy import copy, deepcopy
 
 import numpy as np
-from itertools import chain
+from itertools import chain, groupby
 from scipy.optimize import linear_sum_assignment
 from shapely import geometry
 
@@ -161,6 +162,26 @@ class AnnotationManager:
 
         return shapes + tracks.to_shapes(end_frame)
 
+    def iter_shapes_by_frame(self, end_frame):
+        """Yields (frame, shapes) in the order of frames. Shapes of a frame
+        are in the same order as in to_shapes(). Tracks are interpolated lazily
+        and merged by a heap, so only shapes of the current frame are kept."""
+        def iter_labeled_shapes():
+            # sorted() is stable, so shapes of a frame keep their order
+            for position, shape in enumerate(sorted(self.data.shapes,
+                    key=lambda shape: shape["frame"])):
+                yield shape["frame"], -1, position, shape
+
+        def iter_tracked_shapes(idx, track):
+            for shape in TrackManager.iter_track_shapes(idx, track, end_frame):
+                yield shape["frame"], idx, 0, shape
+
+        # (frame, track index, position) is unique, so shapes are never compared
+        merged_shapes = heapq.merge(iter_labeled_shapes(),
+            *(iter_tracked_shapes(idx, track) for idx, track in enumerate(self.data.tracks)))
+        for frame, items in groupby(merged_shapes, key=lambda item: item[0]):
+            yield frame, [item[-1] for item in items]
+
     def to_tracks(self):
         tracks = self.data.tracks
         shapes = ShapeManager(self.data.shapes)
@@ -199,6 +220,17 @@ class ObjectManager:
     def _modify_unmached_object(obj, end_frame):
         raise NotImplementedError()
 
+    @classmethod
+    def _calc_cost_matrix(cls, objects0, objects1, start_frame, overlap):
+        cost_matrix = np.empty(shape=(len(objects0), len(objects1)),
+            dtype=float)
+        for i, obj0 in enumerate(objects0):
+            for j, obj1 in enumerate(objects1):
+                cost_matrix[i][j] = 1 - cls._calc_objects_similarity(
+                    obj0, obj1, start_frame, overlap)
+
+        return cost_matrix
+
     def merge(self, objects, start_frame, overlap):
         # 1. Split objects on two parts: new and which can be intersected
         # with existing objects.
@@ -232,13 +264,9 @@ class ObjectManager:
             if frame in old_objects_by_frame:
                 int_objects = int_objects_by_frame[frame]
                 old_objects = old_objects_by_frame[frame]
-                cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
-                    dtype=float)
                 # 5.1 Construct cost matrix for the frame.
-                for i, int_obj in enumerate(int_objects):
-                    for j, old_obj in enumerate(old_objects):
-                        cost_matrix[i][j] = 1 - self._calc_objects_similarity(
-                            int_obj, old_obj, start_frame, overlap)
+                cost_matrix = self._calc_cost_matrix(int_objects, old_objects,
+                    start_frame, overlap)
 
                 # 6. Find optimal solution using Hungarian algorithm.
                 row_ind, col_ind = linear_sum_assignment(cost_matrix)
@@ -320,17 +348,18 @@ class ShapeManager(ObjectManager):
         return 0.25
 
     @staticmethod
-    def _calc_objects_similarity(obj0, obj1, start_frame, overlap):
-        def _calc_polygons_similarity(p0, p1):
-            if p0.is_valid and p1.is_valid: # check validity of polygons
-                overlap_area = p0.intersection(p1).area
-                if p0.area == 0 or p1.area == 0: # a line with many points
-                    return 0
-                else:
-                    return overlap_area / (p0.area + p1.area - overlap_area)
+    def _calc_polygons_similarity(p0, p1):
+        if p0.is_valid and p1.is_valid: # check validity of polygons
+            overlap_area = p0.intersection(p1).area
+            if p0.area == 0 or p1.area == 0: # a line with many points
+                return 0
             else:
-                return 0 # if there's invalid polygon, assume similarity is 0
+                return overlap_area / (p0.area + p1.area - overlap_area)
+        else:
+            return 0 # if there's invalid polygon, assume similarity is 0
 
+    @staticmethod
+    def _calc_objects_similarity(obj0, obj1, start_frame, overlap):
         has_same_type  = obj0["type"] == obj1["type"]
         has_same_label = obj0.get("label_id") == obj1.get("label_id")
         if has_same_type and has_same_label:
@@ -338,16 +367,91 @@ class ShapeManager(ObjectManager):
                 p0 = geometry.box(*obj0["points"])
                 p1 = geometry.box(*obj1["points"])
 
-                return _calc_polygons_similarity(p0, p1)
+                return ShapeManager._calc_polygons_similarity(p0, p1)
             elif obj0["type"] == ShapeType.POLYGON:
                 p0 = geometry.Polygon(pairwise(obj0["points"]))
                 p1 = geometry.Polygon(pairwise(obj1["points"]))
 
-                return _calc_polygons_similarity(p0, p1)
+                return ShapeManager._calc_polygons_similarity(p0, p1)
             else:
                 return 0 # FIXME: need some similarity for points and polylines
         return 0
 
+    @staticmethod
+    def _get_kinds(shapes, kinds):
+        # Only shapes of the same kind (type and label) can be similar.
+        # Shapes without a similarity measure get -1.
+        return np.array([
+            kinds.setdefault((str(shape["type"]), shape.get("label_id")), len(kinds))
+            if shape["type"] in (ShapeType.RECTANGLE, ShapeType.POLYGON) else -1
+            for shape in shapes
+        ], dtype=int)
+
+    @staticmethod
+    def _get_boxes(shapes):
+        # Bounding boxes are used as a spatial prefilter for polygons
+        # and give the exact IoU for rectangles
+        boxes = np.zeros((len(shapes), 4))
+        for i, shape in enumerate(shapes):
+            if shape["type"] in (ShapeType.RECTANGLE, ShapeType.POLYGON):
+                points = np.reshape(shape["points"], (-1, 2))
+                boxes[i, :2] = points.min(axis=0)
+                boxes[i, 2:] = points.max(axis=0)
+        return boxes
+
+    @staticmethod
+    def _calc_boxes_intersection(boxes0, boxes1):
+        sizes = np.minimum(boxes0[..., 2:], boxes1[..., 2:]) - \
+            np.maximum(boxes0[..., :2], boxes1[..., :2])
+        return np.prod(np.clip(sizes, 0, None), axis=-1)
+
+    @staticmethod
+    def _calc_pairs_similarity(shapes0, shapes1, rows, cols, boxes0, boxes1):
+        """Computes the similarity of shapes0[rows[k]] and shapes1[cols[k]] for
+        each k. The shapes of a pair must be of the same kind."""
+        boxes0 = boxes0[rows]
+        boxes1 = boxes1[cols]
+        intersection = ShapeManager._calc_boxes_intersection(boxes0, boxes1)
+        area0 = np.prod(boxes0[:, 2:] - boxes0[:, :2], axis=1)
+        area1 = np.prod(boxes1[:, 2:] - boxes1[:, :2], axis=1)
+        similarity = np.zeros(len(rows))
+        np.divide(intersection, area0 + area1 - intersection, out=similarity,
+            where=(area0 > 0) & (area1 > 0))
+
+        # The IoU of bounding boxes is exact for rectangles only. Polygons are
+        # compared by shapely, but only if their bounding boxes intersect.
+        polygons0, polygons1 = {}, {}
+        for k, (i, j) in enumerate(zip(rows, cols)):
+            if shapes0[i]["type"] != ShapeType.POLYGON or not intersection[k]:
+                continue
+            if i not in polygons0:
+                polygons0[i] = geometry.Polygon(pairwise(shapes0[i]["points"]))
+            if j not in polygons1:
+                polygons1[j] = geometry.Polygon(pairwise(shapes1[j]["points"]))
+            similarity[k] = ShapeManager._calc_polygons_similarity(
+                polygons0[i], polygons1[j])
+
+        return similarity
+
+    @classmethod
+    def _calc_cost_matrix(cls, objects0, objects1, start_frame, overlap):
+        kinds = {}
+        kinds0 = cls._get_kinds(objects0, kinds)
+        kinds1 = cls._get_kinds(objects1, kinds)
+        boxes0 = cls._get_boxes(objects0)
+        boxes1 = cls._get_boxes(objects1)
+
+        # Shapes of different kinds or with disjoint bounding boxes
+        # can't be similar, so only the rest pairs are compared
+        candidates = (kinds0[:, None] == kinds1[None, :]) & (kinds0[:, None] >= 0) & \
+            (cls._calc_boxes_intersection(boxes0[:, None], boxes1[None, :]) > 0)
+        rows, cols = np.nonzero(candidates)
+        similarity = np.zeros(candidates.shape)
+        similarity[rows, cols] = cls._calc_pairs_similarity(objects0, objects1,
+            rows, cols, boxes0, boxes1)
+
+        return 1 - similarity
+
     @staticmethod
     def _unite_objects(obj0, obj1):
         # TODO: improve the trivial implementation
@@ -361,14 +465,18 @@ class TrackManager(ObjectManager):
     def to_shapes(self, end_frame):
         shapes = []
         for idx, track in enumerate(self.objects):
-            for shape in TrackManager.get_interpolated_shapes(track, 0, end_frame):
-                shape["label_id"] = track["label_id"]
-                shape["group"] = track["group"]
-                shape["track_id"] = idx
-                shape["attributes"] += track["attributes"]
-                shapes.append(shape)
+            shapes.extend(TrackManager.iter_track_shapes(idx, track, end_frame))
         return shapes
 
+    @staticmethod
+    def iter_track_shapes(idx, track, end_frame):
+        for shape in TrackManager.iter_interpolated_shapes(track, 0, end_frame):
+            shape["label_id"] = track["label_id"]
+            shape["group"] = track["group"]
+            shape["track_id"] = idx
+            shape["attributes"] += track["attributes"]
+            yield shape
+
     @staticmethod
     def _get_objects_by_frame(objects, start_frame):
         # Just for unification. All tracks are assigned on the same frame
@@ -418,6 +526,90 @@ class TrackManager(ObjectManager):
         else:
             return 0
 
+    @staticmethod
+    def _get_track_window(track, start_frame, end_frame, kinds):
+        """Interpolates the track once and returns its shapes on the frames
+        [start_frame; end_frame) along with their kinds, outside flags
+        and bounding boxes as arrays indexed by frame - start_frame."""
+        shapes = [None] * (end_frame - start_frame)
+        for shape in TrackManager.iter_interpolated_shapes(track, start_frame, end_frame):
+            if start_frame <= shape["frame"] < end_frame:
+                shapes[shape["frame"] - start_frame] = shape
+
+        present = np.array([shape is not None for shape in shapes], dtype=bool)
+        present_frames = np.flatnonzero(present)
+        present_shapes = [shapes[i] for i in present_frames]
+        window_kinds = np.full(len(shapes), -1, dtype=int)
+        window_kinds[present_frames] = ShapeManager._get_kinds(present_shapes, kinds)
+        outside = np.zeros(len(shapes), dtype=bool)
+        outside[present_frames] = [shape["outside"] for shape in present_shapes]
+        boxes = np.zeros((len(shapes), 4))
+        boxes[present_frames] = ShapeManager._get_boxes(present_shapes)
+
+        return {
+            "shapes": shapes,
+            "present": present,
+            "kinds": window_kinds,
+            "outside": outside,
+            "boxes": boxes,
+        }
+
+    @staticmethod
+    def _calc_windows_similarity(window0, window1):
+        # The same measure as in _calc_objects_similarity(): a frame with
+        # a single shape or with different outside flags gives the error 1,
+        # otherwise the error is 1 - similarity of the shapes.
+        both = window0["present"] & window1["present"]
+        count = np.count_nonzero(window0["present"] | window1["present"])
+        comparable = np.flatnonzero(both & (window0["outside"] == window1["outside"]) &
+            (window0["kinds"] == window1["kinds"]) & (window0["kinds"] >= 0))
+        similarity = ShapeManager._calc_pairs_similarity(
+            window0["shapes"], window1["shapes"], comparable, comparable,
+            window0["boxes"], window1["boxes"])
+
+        error = count - similarity.sum()
+        return 1 - error / count
+
+    @classmethod
+    def _calc_cost_matrix(cls, objects0, objects1, start_frame, overlap):
+        # Here start_frame is the start frame of next segment
+        # and stop_frame is the stop frame of current segment
+        # end_frame == stop_frame + 1
+        end_frame = start_frame + overlap
+        kinds = {}
+        windows0 = [cls._get_track_window(obj, start_frame, end_frame, kinds)
+            for obj in objects0]
+        windows1 = [cls._get_track_window(obj, start_frame, end_frame, kinds)
+            for obj in objects1]
+
+        def get_bounds(windows):
+            # The bounding box of all comparable shapes of a track in the window
+            bounds = np.zeros((len(windows), 4))
+            has_bounds = np.zeros(len(windows), dtype=bool)
+            for i, window in enumerate(windows):
+                boxes = window["boxes"][window["kinds"] >= 0]
+                if len(boxes):
+                    bounds[i, :2] = boxes[:, :2].min(axis=0)
+                    bounds[i, 2:] = boxes[:, 2:].max(axis=0)
+                    has_bounds[i] = True
+            return bounds, has_bounds
+
+        bounds0, has_bounds0 = get_bounds(windows0)
+        bounds1, has_bounds1 = get_bounds(windows1)
+        labels0 = np.array([obj["label_id"] for obj in objects0])
+        labels1 = np.array([obj["label_id"] for obj in objects1])
+
+        # If the shapes of two tracks never intersect in the window,
+        # the error is 1 on every frame and the tracks can't be matched
+        candidates = (labels0[:, None] == labels1[None, :]) & \
+            has_bounds0[:, None] & has_bounds1[None, :] & \
+            (ShapeManager._calc_boxes_intersection(bounds0[:, None], bounds1[None, :]) > 0)
+        cost_matrix = np.ones(candidates.shape)
+        for i, j in zip(*np.nonzero(candidates)):
+            cost_matrix[i, j] = 1 - cls._calc_windows_similarity(windows0[i], windows1[j])
+
+        return cost_matrix
+
     @staticmethod
     def _modify_unmached_object(obj, end_frame):
         shape = obj["shapes"][-1]
@@ -429,14 +621,22 @@ class TrackManager(ObjectManager):
 
     @staticmethod
     def get_interpolated_shapes(track, start_frame, end_frame):
+        return list(TrackManager.iter_interpolated_shapes(track, start_frame, end_frame))
+
+    @staticmethod
+    def iter_interpolated_shapes(track, start_frame, end_frame):
+        """Yields keyframes of the track and shapes interpolated between them
+        frame by frame. Interpolated shapes are built lazily, so a long track
+        is never expanded in memory at once."""
         def copy_shape(source, frame, points=None, rotation=None):
-            copied = deepcopy(source)
+            # Only mutable fields are copied, the rest values are immutable
+            copied = copy(source)
+            copied["attributes"] = [copy(attr) for attr in source["attributes"]]
+            copied["points"] = list(source["points"]) if points is None else points
             copied["keyframe"] = False
             copied["frame"] = frame
             if rotation is not None:
                 copied["rotation"] = rotation
-            if points is not None:
-                copied["points"] = points
             return copied
 
         def find_angle_diff(right_angle, left_angle):
@@ -449,33 +649,34 @@ class TrackManager(ObjectManager):
 
             return angle_diff
 
+        def get_offsets(shape0, shape1):
+            frames = range(shape0["frame"] + 1, shape1["frame"])
+            offsets = (np.arange(frames.start, frames.stop) - shape0["frame"]) / \
+                (shape1["frame"] - shape0["frame"])
+            return frames, offsets
+
         def simple_interpolation(shape0, shape1):
-            shapes = []
-            distance = shape1["frame"] - shape0["frame"]
+            frames, offsets = get_offsets(shape0, shape1)
             diff = np.subtract(shape1["points"], shape0["points"])
 
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                offset = (frame - shape0["frame"]) / distance
-                rotation = (shape0["rotation"] + find_angle_diff(
-                    shape1["rotation"], shape0["rotation"],
-                ) * offset + 360) % 360
-                points = shape0["points"] + diff * offset
+            # Positions for all frames between the keyframes are computed at once
+            rotations = shape0["rotation"] + find_angle_diff(
+                shape1["rotation"], shape0["rotation"],
+            ) * offsets
+            rotations = (rotations + 360) % 360
+            points = np.add(shape0["points"], np.outer(offsets, diff))
 
-                shapes.append(copy_shape(shape0, frame, points.tolist(), rotation))
-
-            return shapes
+            for frame, frame_points, rotation in zip(frames, points, rotations):
+                yield copy_shape(shape0, frame, frame_points.tolist(), rotation.item())
 
         def points_interpolation(shape0, shape1):
             if len(shape0["points"]) == 2 and len(shape1["points"]) == 2:
-                return simple_interpolation(shape0, shape1)
+                yield from simple_interpolation(shape0, shape1)
             else:
-                shapes = []
                 for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                    shapes.append(copy_shape(shape0, frame))
-
-            return shapes
+                    yield copy_shape(shape0, frame)
 
-        def interpolate_position(left_position, right_position, offset):
+        def interpolate_positions(left_position, right_position, offsets):
             def to_array(points):
                 return np.asarray(
                     list(map(lambda point: [point["x"], point["y"]], points))
@@ -653,45 +854,47 @@ class TrackManager(ObjectManager):
                 left_offset_vec, right_offset_vec, matching
             )
 
-            interpolated_points = []
-            for left_point_index, left_point in enumerate(left_points):
-                for right_point_index in completed_matching[left_point_index]:
-                    right_point = right_points[right_point_index]
-                    interpolated_points.append({
-                        "x": left_point["x"] + (right_point["x"] - left_point["x"]) * offset,
-                        "y": left_point["y"] + (right_point["y"] - left_point["y"]) * offset
-                    })
-
-            reducedPoints = reduce_interpolation(
-                interpolated_points,
-                completed_matching,
-                left_points,
-                right_points
-            )
+            # The matching doesn't depend on the offset,
+            # so matched points are interpolated for all offsets at once
+            matched_points = [(left_point, right_points[right_point_index])
+                for left_point_index, left_point in enumerate(left_points)
+                for right_point_index in completed_matching[left_point_index]]
+            left = np.array([[left_point["x"], left_point["y"]]
+                for left_point, _ in matched_points]).reshape(1, -1, 2)
+            right = np.array([[right_point["x"], right_point["y"]]
+                for _, right_point in matched_points]).reshape(1, -1, 2)
+
+            # Offsets are processed by batches to keep memory bounded for long gaps
+            batch_size = 256
+            for batch_start in range(0, len(offsets), batch_size):
+                batch_offsets = offsets[batch_start : batch_start + batch_size]
+                for frame_points in left + (right - left) * np.reshape(batch_offsets, (-1, 1, 1)):
+                    interpolated_points = [{"x": x, "y": y} for x, y in frame_points]
+
+                    reducedPoints = reduce_interpolation(
+                        interpolated_points,
+                        completed_matching,
+                        left_points,
+                        right_points
+                    )
 
-            return to_array(reducedPoints).tolist()
+                    yield to_array(reducedPoints).tolist()
 
         def polyshape_interpolation(shape0, shape1):
-            shapes = []
             is_polygon = shape0["type"] == ShapeType.POLYGON
+            left_position = {"points": shape0["points"]}
+            right_position = {"points": shape1["points"]}
             if is_polygon:
-                shape0["points"].extend(shape0["points"][:2])
-                shape1["points"].extend(shape1["points"][:2])
-
-            distance = shape1["frame"] - shape0["frame"]
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                offset = (frame - shape0["frame"]) / distance
-                points = interpolate_position(shape0, shape1, offset)
-
-                shapes.append(copy_shape(shape0, frame, points))
-
-            if is_polygon:
-                shape0["points"] = shape0["points"][:-2]
-                shape1["points"] = shape1["points"][:-2]
-                for shape in shapes:
-                    shape["points"] = shape["points"][:-2]
+                # A polygon is interpolated as a closed polyline
+                left_position["points"] = shape0["points"] + shape0["points"][:2]
+                right_position["points"] = shape1["points"] + shape1["points"][:2]
 
-            return shapes
+            frames, offsets = get_offsets(shape0, shape1)
+            for frame, points in zip(frames,
+                    interpolate_positions(left_position, right_position, offsets)):
+                if is_polygon:
+                    points = points[:-2]
+                yield copy_shape(shape0, frame, points)
 
         def interpolate(shape0, shape1):
             is_same_type = shape0["type"] == shape1["type"]
@@ -704,19 +907,15 @@ class TrackManager(ObjectManager):
             if not is_same_type:
                 raise NotImplementedError()
 
-            shapes = []
             if is_rectangle or is_cuboid:
-                shapes = simple_interpolation(shape0, shape1)
+                return simple_interpolation(shape0, shape1)
             elif is_points:
-                shapes = points_interpolation(shape0, shape1)
+                return points_interpolation(shape0, shape1)
             elif is_polygon or is_polyline:
-                shapes = polyshape_interpolation(shape0, shape1)
+                return polyshape_interpolation(shape0, shape1)
             else:
                 raise NotImplementedError()
 
-            return shapes
-
-        shapes = []
         curr_frame = track["shapes"][0]["frame"]
         prev_shape = {}
         for shape in track["shapes"]:
@@ -726,23 +925,23 @@ class TrackManager(ObjectManager):
                     if attr["spec_id"] not in map(lambda el: el["spec_id"], shape["attributes"]):
                         shape["attributes"].append(deepcopy(attr))
                 if not prev_shape["outside"]:
-                    shapes.extend(interpolate(prev_shape, shape))
+                    yield from interpolate(prev_shape, shape)
 
             shape["keyframe"] = True
-            shapes.append(shape)
             curr_frame = shape["frame"]
-            prev_shape = shape
+            # The yielded keyframe can be modified by the caller
+            # before the next shapes are interpolated from it
+            prev_shape = copy_shape(shape, curr_frame)
+            yield shape
 
             # keep at least 1 shape
             if end_frame <= curr_frame:
                 break
 
         if not prev_shape["outside"]:
-            shape = deepcopy(prev_shape)
+            shape = copy(prev_shape)
             shape["frame"] = end_frame
-            shapes.extend(interpolate(prev_shape, shape))
-
-        return shapes
+            yield from interpolate(prev_shape, shape)
 
     @staticmethod
     def _unite_objects(obj0, obj1):
@@ -3,9 +3,11 @@
 #
 # SPDX-License-Identifier: MIT
 
+import heapq
 import os.path as osp
 import sys
 from collections import namedtuple
+from itertools import groupby
 from pathlib import Path
 from typing import (Any, Callable, DefaultDict, Dict, List, Literal, Mapping,
     NamedTuple, OrderedDict, Tuple, Union)
@@ -121,6 +123,30 @@ class InstanceLabelData:
         return exported_attributes
 
 
+def _iter_frame_annotations(frame_ids, annotation_ir, end_frame):
+    """Yields (frame, shapes, tags) in the order of frames for each frame
+    with annotations and each frame from the sorted frame_ids. Shapes of
+    a frame are sorted by z_order, tracks are interpolated lazily."""
+    tags_by_frame = groupby(sorted(annotation_ir.tags, key=lambda tag: tag['frame']),
+        key=lambda tag: tag['frame'])
+    # (frame, source) is unique, so the objects are never compared
+    annotations = heapq.merge(
+        ((frame, 0, None) for frame in frame_ids),
+        ((frame, 1, shapes) for frame, shapes in
+            AnnotationManager(annotation_ir).iter_shapes_by_frame(end_frame)),
+        ((frame, 2, list(tags)) for frame, tags in tags_by_frame),
+    )
+    for frame, items in groupby(annotations, key=lambda item: item[0]):
+        frame_shapes = []
+        frame_tags = []
+        for _, source, objects in items:
+            if source == 1:
+                frame_shapes = sorted(objects, key=lambda shape: shape.get("z_order", 0))
+            elif source == 2:
+                frame_tags = objects
+        yield frame, frame_shapes, frame_tags
+
+
 class TaskData(InstanceLabelData):
     Shape = namedtuple("Shape", 'id, label_id')  # 3d
     LabeledShape = namedtuple(
@@ -312,56 +338,45 @@ class TaskData(InstanceLabelData):
         )
 
     def group_by_frame(self, include_empty=False):
-        frames = {}
-        def get_frame(idx):
-            frame_info = self._frame_info[idx]
-            frame = self.abs_frame_id(idx)
-            if frame not in frames:
-                frames[frame] = TaskData.Frame(
-                    idx=idx,
-                    id=frame_info.get('id',0),
-                    frame=frame,
-                    name=frame_info['path'],
-                    height=frame_info["height"],
-                    width=frame_info["width"],
-                    labeled_shapes=[],
-                    tags=[],
-                    shapes=[],
-                    labels={}
-                )
-            return frames[frame]
-
-        if include_empty:
-            for idx in self._frame_info:
-                get_frame(idx)
-
-        anno_manager = AnnotationManager(self._annotation_ir)
-        shape_data = ''
-        for shape in sorted(anno_manager.to_shapes(self._db_task.data.size),
-                key=lambda shape: shape.get("z_order", 0)):
-            if shape['frame'] not in self._frame_info:
+        frame_ids = sorted(self._frame_info) if include_empty else []
+        for idx, shapes, tags in _iter_frame_annotations(frame_ids,
+                self._annotation_ir, self._db_task.data.size):
+            if idx not in self._frame_info:
                 # After interpolation there can be a finishing frame
                 # outside of the task boundaries. Filter it out to avoid errors.
                 # https://github.com/openvinotoolkit/cvat/issues/2827
                 continue
-            if 'track_id' in shape:
-                if shape['outside']:
-                    continue
-                exported_shape = self._export_tracked_shape(shape)
-            else:
-                exported_shape = self._export_labeled_shape(shape)
-                shape_data = self._export_shape(shape)
-            get_frame(shape['frame']).labeled_shapes.append(exported_shape)
-            if shape_data:
-                get_frame(shape['frame']).shapes.append(shape_data)
-                for label in self._label_mapping.values():
-                    label = self._export_label(label)
-                    get_frame(shape['frame']).labels.update({label.id: label})
 
-        for tag in self._annotation_ir.tags:
-            get_frame(tag['frame']).tags.append(self._export_tag(tag))
+            frame_info = self._frame_info[idx]
+            frame = TaskData.Frame(
+                idx=idx,
+                id=frame_info.get('id',0),
+                frame=self.abs_frame_id(idx),
+                name=frame_info['path'],
+                height=frame_info["height"],
+                width=frame_info["width"],
+                labeled_shapes=[],
+                tags=[],
+                shapes=[],
+                labels={}
+            )
+            for shape in shapes:
+                if 'track_id' in shape:
+                    if shape['outside']:
+                        continue
+                    frame.labeled_shapes.append(self._export_tracked_shape(shape))
+                else:
+                    frame.labeled_shapes.append(self._export_labeled_shape(shape))
+                    frame.shapes.append(self._export_shape(shape))
+                    for label in self._label_mapping.values():
+                        label = self._export_label(label)
+                        frame.labels.update({label.id: label})
+
+            for tag in tags:
+                frame.tags.append(self._export_tag(tag))
 
-        return iter(frames.values())
+            if include_empty or frame.labeled_shapes or frame.tags:
+                yield frame
 
     @property
     def shapes(self):
@@ -683,47 +698,41 @@ class ProjectData(InstanceLabelData):
         )
 
     def group_by_frame(self, include_empty=False):
-        frames: Dict[Tuple[str, int], ProjectData.Frame] = {}
-        def get_frame(task_id: int, idx: int) -> ProjectData.Frame:
-            frame_info = self._frame_info[(task_id, idx)]
-            abs_frame = self.abs_frame_id(task_id, idx)
-            if (frame_info["subset"], abs_frame) not in frames:
-                frames[(frame_info["subset"], abs_frame)] = ProjectData.Frame(
-                    task_id=task_id,
+        for task in self._db_tasks.values():
+            frame_ids = sorted(idx for task_id, idx in self._frame_info
+                if task_id == task.id) if include_empty else []
+            for idx, shapes, tags in _iter_frame_annotations(frame_ids,
+                    self._annotation_irs[task.id], task.data.size):
+                if (task.id, idx) not in self._frame_info:
+                    continue
+
+                frame_info = self._frame_info[(task.id, idx)]
+                frame = ProjectData.Frame(
+                    task_id=task.id,
                     subset=frame_info["subset"],
                     idx=idx,
                     id=frame_info.get('id',0),
-                    frame=abs_frame,
+                    frame=self.abs_frame_id(task.id, idx),
                     name=frame_info["path"],
                     height=frame_info["height"],
                     width=frame_info["width"],
                     labeled_shapes=[],
                     tags=[],
                 )
-            return frames[(frame_info["subset"], abs_frame)]
-
-        if include_empty:
-            for ident in self._frame_info:
-                get_frame(*ident)
-
-        for task in self._db_tasks.values():
-            anno_manager = AnnotationManager(self._annotation_irs[task.id])
-            for shape in sorted(anno_manager.to_shapes(task.data.size),
-                    key=lambda shape: shape.get("z_order", 0)):
-                if (task.id, shape['frame']) not in self._frame_info:
-                    continue
-                if 'track_id' in shape:
-                    if shape['outside']:
-                        continue
-                    exported_shape = self._export_tracked_shape(shape, task.id)
-                else:
-                    exported_shape = self._export_labeled_shape(shape, task.id)
-                get_frame(task.id, shape['frame']).labeled_shapes.append(exported_shape)
+                for shape in shapes:
+                    if 'track_id' in shape:
+                        if shape['outside']:
+                            continue
+                        exported_shape = self._export_tracked_shape(shape, task.id)
+                    else:
+                        exported_shape = self._export_labeled_shape(shape, task.id)
+                    frame.labeled_shapes.append(exported_shape)
 
-            for tag in self._annotation_irs[task.id].tags:
-                get_frame(task.id, tag['frame']).tags.append(self._export_tag(tag, task.id))
+                for tag in tags:
+                    frame.tags.append(self._export_tag(tag, task.id))
 
-        return iter(frames.values())
+                if include_empty or frame.labeled_shapes or frame.tags:
+                    yield frame
 
     @property
     def shapes(self):
@@ -0,0 +1,241 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cvat.apps.engine import models, serializers
+from cvat.apps.dataset_manager.task import JobAnnotation, _merge_table_rows
+
+
+# The loader which was used before the columnar one. Tags, shapes and tracks
+# are read by a single query each which joins objects with their attributes.
+def _init_tags_joined(annotation):
+    db_tags = list(annotation.db_job.labeledimage_set.values(
+        'id',
+        'frame',
+        'label_id',
+        'group',
+        'source',
+        'labeledimageattributeval__spec_id',
+        'labeledimageattributeval__value',
+        'labeledimageattributeval__id',
+    ).order_by('frame'))
+    rows = len(db_tags)
+
+    db_tags = _merge_table_rows(
+        rows=db_tags,
+        keys_for_merge={
+            "labeledimageattributeval_set": [
+                'labeledimageattributeval__spec_id',
+                'labeledimageattributeval__value',
+                'labeledimageattributeval__id',
+            ],
+        },
+        field_id='id',
+    )
+
+    for db_tag in db_tags:
+        annotation._extend_attributes(db_tag.labeledimageattributeval_set,
+            annotation.db_attributes[db_tag.label_id]["all"].values())
+
+    annotation.ir_data.tags = serializers.LabeledImageSerializer(db_tags, many=True).data
+    return rows
+
+def _init_shapes_joined(annotation):
+    db_shapes = list(annotation.db_job.labeledshape_set.values(
+        'id',
+        'label_id',
+        'type',
+        'frame',
+        'group',
+        'source',
+        'occluded',
+        'z_order',
+        'rotation',
+        'points',
+        'labeledshapeattributeval__spec_id',
+        'labeledshapeattributeval__value',
+        'labeledshapeattributeval__id',
+    ).order_by('frame'))
+    rows = len(db_shapes)
+
+    db_shapes = _merge_table_rows(
+        rows=db_shapes,
+        keys_for_merge={
+            'labeledshapeattributeval_set': [
+                'labeledshapeattributeval__spec_id',
+                'labeledshapeattributeval__value',
+                'labeledshapeattributeval__id',
+            ],
+        },
+        field_id='id',
+    )
+    for db_shape in db_shapes:
+        annotation._extend_attributes(db_shape.labeledshapeattributeval_set,
+            annotation.db_attributes[db_shape.label_id]["all"].values())
+
+    annotation.ir_data.shapes = serializers.LabeledShapeSerializer(db_shapes, many=True).data
+    return rows
+
+def _init_tracks_joined(annotation):
+    db_tracks = list(annotation.db_job.labeledtrack_set.values(
+        "id",
+        "frame",
+        "label_id",
+        "group",
+        "source",
+        "labeledtrackattributeval__spec_id",
+        "labeledtrackattributeval__value",
+        "labeledtrackattributeval__id",
+        "trackedshape__type",
+        "trackedshape__occluded",
+        "trackedshape__z_order",
+        "trackedshape__rotation",
+        "trackedshape__points",
+        "trackedshape__id",
+        "trackedshape__frame",
+        "trackedshape__outside",
+        "trackedshape__trackedshapeattributeval__spec_id",
+        "trackedshape__trackedshapeattributeval__value",
+        "trackedshape__trackedshapeattributeval__id",
+    ).order_by('id', 'trackedshape__frame'))
+    rows = len(db_tracks)
+
+    db_tracks = _merge_table_rows(
+        rows=db_tracks,
+        keys_for_merge={
+            "labeledtrackattributeval_set": [
+                "labeledtrackattributeval__spec_id",
+                "labeledtrackattributeval__value",
+                "labeledtrackattributeval__id",
+            ],
+            "trackedshape_set":[
+                "trackedshape__type",
+                "trackedshape__occluded",
+                "trackedshape__z_order",
+                "trackedshape__points",
+                "trackedshape__rotation",
+                "trackedshape__id",
+                "trackedshape__frame",
+                "trackedshape__outside",
+                "trackedshape__trackedshapeattributeval__spec_id",
+                "trackedshape__trackedshapeattributeval__value",
+                "trackedshape__trackedshapeattributeval__id",
+            ],
+        },
+        field_id="id",
+    )
+
+    for db_track in db_tracks:
+        db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
+            'trackedshapeattributeval_set': [
+                'trackedshapeattributeval__value',
+                'trackedshapeattributeval__spec_id',
+                'trackedshapeattributeval__id',
+            ]
+        }, 'id')
+
+        db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
+        annotation._extend_attributes(db_track.labeledtrackattributeval_set,
+            annotation.db_attributes[db_track.label_id]["immutable"].values())
+
+        default_attribute_values = annotation.db_attributes[db_track.label_id]["mutable"].values()
+        for db_shape in db_track["trackedshape_set"]:
+            db_shape["trackedshapeattributeval_set"] = list(
+                set(db_shape["trackedshapeattributeval_set"])
+            )
+            annotation._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
+            default_attribute_values = db_shape["trackedshapeattributeval_set"]
+
+    annotation.ir_data.tracks = serializers.LabeledTrackSerializer(db_tracks, many=True).data
+    return rows
+
+def _init_joined(annotation):
+    return _init_tags_joined(annotation) + _init_shapes_joined(annotation) + \
+        _init_tracks_joined(annotation)
+
+def _init_columnar(annotation):
+    with CaptureQueriesContext(connection) as queries:
+        annotation._init_tags_from_db()
+        annotation._init_shapes_from_db()
+        annotation._init_tracks_from_db()
+    return len(queries)
+
+def _count_rows(db_job):
+    # The columnar loader reads rows of every table once, so the number
+    # of rows is the number of stored objects and attribute values
+    return sum(db_queryset.count() for db_queryset in (
+        db_job.labeledimage_set.all(),
+        models.LabeledImageAttributeVal.objects.filter(image__job_id=db_job.id),
+        db_job.labeledshape_set.all(),
+        models.LabeledShapeAttributeVal.objects.filter(shape__job_id=db_job.id),
+        db_job.labeledtrack_set.all(),
+        models.LabeledTrackAttributeVal.objects.filter(track__job_id=db_job.id),
+        models.TrackedShape.objects.filter(track__job_id=db_job.id),
+        models.TrackedShapeAttributeVal.objects.filter(shape__track__job_id=db_job.id),
+    ))
+
+def _normalize(data):
+    """Makes results of both loaders comparable, the order of
+    attribute values isn't defined by the joined loader"""
+    data = json.loads(json.dumps(data))
+    for objects in (data['tags'], data['shapes'], data['tracks']):
+        for obj in objects:
+            obj['attributes'].sort(key=lambda attr: attr['spec_id'])
+            for shape in obj.get('shapes', []):
+                shape['attributes'].sort(key=lambda attr: attr['spec_id'])
+    return data
+
+def _measure(loader, annotation):
+    annotation.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = loader(annotation)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+class Command(BaseCommand):
+    help = 'Compare the joined and the columnar annotation loaders of jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_id', type=int, nargs='+')
+        parser.add_argument('--repeat', type=int, default=3,
+            help='Number of runs of each loader, the best one is reported')
+
+    def handle(self, *args, **options):
+        for job_id in options['job_id']:
+            with transaction.atomic():
+                try:
+                    annotation = JobAnnotation(job_id)
+                except models.Job.DoesNotExist:
+                    raise CommandError('Job #{} does not exist'.format(job_id))
+
+                joined = []
+                columnar = []
+                for _ in range(max(options['repeat'], 1)):
+                    joined.append(_measure(_init_joined, annotation))
+                    joined_data = _normalize(annotation.ir_data.data)
+                    columnar.append(_measure(_init_columnar, annotation))
+                    columnar_data = _normalize(annotation.ir_data.data)
+                columnar_rows = _count_rows(annotation.db_job)
+
+            if joined_data != columnar_data:
+                raise CommandError('Job #{}: the loaders returned different annotations'.format(job_id))
+
+            joined_rows, joined_time, joined_peak = min(joined, key=lambda run: run[1])
+            queries, columnar_time, columnar_peak = min(columnar, key=lambda run: run[1])
+            self.stdout.write('Job #{}: {} tags, {} shapes, {} tracks'.format(job_id,
+                len(joined_data['tags']), len(joined_data['shapes']), len(joined_data['tracks'])))
+            self.stdout.write('  {:<10} rows={:<10} time={:.3f}s peak memory={:.1f}MB'.format(
+                'joined', joined_rows, joined_time, joined_peak / 2**20))
+            self.stdout.write('  {:<10} rows={:<10} time={:.3f}s peak memory={:.1f}MB queries={}'.format(
+                'columnar', columnar_rows, columnar_time, columnar_peak / 2**20, queries))
@@ -0,0 +1,76 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from cvat.apps.dataset_manager.annotation import (ObjectManager, ShapeManager,
+    TrackManager)
+
+
+def _make_rectangle(rng, frame, width, height):
+    x, y = rng.uniform(0, width - 50), rng.uniform(0, height - 50)
+    w, h = rng.uniform(10, 50, 2)
+    return {
+        "frame": frame,
+        "label_id": int(rng.integers(0, 3)),
+        "points": [x, y, x + w, y + h],
+        "rotation": 0,
+        "type": "rectangle",
+        "occluded": False,
+        "outside": False,
+        "z_order": 0,
+        "attributes": [],
+    }
+
+def _make_objects(kind, count, start_frame, overlap, seed):
+    rng = np.random.default_rng(seed)
+    if kind == 'shape':
+        return [_make_rectangle(rng, start_frame, 1920, 1080) for _ in range(count)]
+
+    tracks = []
+    for _ in range(count):
+        shape0 = _make_rectangle(rng, start_frame, 1920, 1080)
+        shape1 = _make_rectangle(rng, start_frame + overlap, 1920, 1080)
+        shape1["label_id"] = shape0["label_id"]
+        tracks.append({
+            "frame": start_frame,
+            "label_id": shape0.pop("label_id"),
+            "group": None,
+            "source": "manual",
+            "attributes": [],
+            "shapes": [shape0, shape1],
+        })
+        shape1.pop("label_id")
+    return tracks
+
+class Command(BaseCommand):
+    help = 'Measure building of the cost matrix used to merge annotations of overlapping jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=300)
+        parser.add_argument('--overlap', type=int, default=5)
+        parser.add_argument('--type', default='shape', choices=['shape', 'track'])
+
+    def handle(self, *args, **options):
+        manager = ShapeManager if options['type'] == 'shape' else TrackManager
+        start_frame, overlap = 100, options['overlap']
+
+        def measure(build_cost_matrix):
+            objects0 = _make_objects(options['type'], options['objects'], start_frame, overlap, 0)
+            objects1 = _make_objects(options['type'], options['objects'], start_frame, overlap, 1)
+            start = time.perf_counter()
+            cost_matrix = build_cost_matrix.__func__(manager, objects0, objects1, start_frame, overlap)
+            return cost_matrix, time.perf_counter() - start
+
+        expected, pairwise_time = measure(ObjectManager._calc_cost_matrix)
+        actual, batched_time = measure(manager._calc_cost_matrix)
+        assert np.allclose(expected, actual)
+
+        self.stdout.write('{0} x {0} {1}s, overlap {2}'.format(
+            options['objects'], options['type'], overlap))
+        self.stdout.write('  pairwise time={:.3f}s'.format(pairwise_time))
+        self.stdout.write('  batched  time={:.3f}s'.format(batched_time))
@@ -0,0 +1,111 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import tracemalloc
+from copy import deepcopy
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from cvat.apps.dataset_manager.annotation import TrackManager
+
+
+def _make_track(frames, keyframe_step, shape_type, points_count):
+    rng = np.random.default_rng(0)
+    shapes = []
+    for frame in range(0, frames, keyframe_step):
+        shapes.append({
+            "frame": frame,
+            "points": rng.uniform(0, 1000, points_count * 2).tolist(),
+            "rotation": 0 if shape_type != "rectangle" else float(rng.uniform(0, 360)),
+            "type": shape_type,
+            "occluded": False,
+            "outside": False,
+            "z_order": 0,
+            "attributes": [{"spec_id": 1, "value": "value"}],
+        })
+    shapes[-1]["outside"] = True
+    return {
+        "frame": 0,
+        "label_id": 0,
+        "group": None,
+        "source": "manual",
+        "attributes": [],
+        "shapes": shapes,
+    }
+
+def _interpolate_by_frame(track, end_frame):
+    # The reference implementation for rectangles: every shape
+    # is deep copied and computed separately
+    shapes = []
+    prev_shape = None
+    for shape in track["shapes"]:
+        if prev_shape is not None and not prev_shape["outside"]:
+            distance = shape["frame"] - prev_shape["frame"]
+            diff = np.subtract(shape["points"], prev_shape["points"])
+            angle_diff = ((shape["rotation"] - prev_shape["rotation"] + 180) % 360) - 180
+            for frame in range(prev_shape["frame"] + 1, shape["frame"]):
+                offset = (frame - prev_shape["frame"]) / distance
+                copied = deepcopy(prev_shape)
+                copied["keyframe"] = False
+                copied["frame"] = frame
+                copied["rotation"] = (prev_shape["rotation"] + angle_diff * offset + 360) % 360
+                copied["points"] = (prev_shape["points"] + diff * offset).tolist()
+                shapes.append(copied)
+        shape["keyframe"] = True
+        shapes.append(shape)
+        prev_shape = shape
+    return shapes
+
+def _measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+class Command(BaseCommand):
+    help = 'Measure interpolation of a synthetic long track'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=50000)
+        parser.add_argument('--keyframe-step', type=int, default=100)
+        parser.add_argument('--type', default='rectangle',
+            choices=['rectangle', 'polygon', 'polyline', 'points'])
+        parser.add_argument('--points', type=int, default=None,
+            help='Number of points of a shape (default: 2 for rectangles, 10 for others)')
+
+    def handle(self, *args, **options):
+        points_count = options['points'] or (2 if options['type'] == 'rectangle' else 10)
+        frames = options['frames']
+
+        def make_track():
+            return _make_track(frames, options['keyframe_step'], options['type'], points_count)
+
+        def consume():
+            count = 0
+            for _ in TrackManager.iter_interpolated_shapes(make_track(), 0, frames):
+                count += 1
+            return count
+
+        results = [
+            ('lazy', *_measure(consume)),
+            ('list', *_measure(lambda: len(TrackManager.get_interpolated_shapes(make_track(), 0, frames)))),
+        ]
+        if options['type'] == 'rectangle':
+            expected = _interpolate_by_frame(make_track(), frames)
+            actual = TrackManager.get_interpolated_shapes(make_track(), 0, frames)
+            for expected_shape, actual_shape in zip(expected, actual):
+                assert expected_shape["frame"] == actual_shape["frame"]
+                assert np.allclose(expected_shape["points"], actual_shape["points"])
+            results.append(('by frame', *_measure(lambda: len(_interpolate_by_frame(make_track(), frames)))))
+
+        self.stdout.write('{} track, {} frames, a keyframe every {} frames'.format(
+            options['type'], frames, options['keyframe_step']))
+        for name, count, elapsed, peak in results:
+            self.stdout.write('  {:<10} shapes={:<8} time={:.3f}s peak memory={:.1f}MB'.format(
+                name, count, elapsed, peak / 2**20))
@@ -7,7 +7,7 @@ from typing import Callable
 from django.db import transaction
 
 from cvat.apps.engine import models
-from cvat.apps.dataset_manager.task import TaskAnnotation
+from cvat.apps.dataset_manager.task import TaskAnnotation, load_job_irs
 
 from .annotation import AnnotationIR
 from .bindings import ProjectData
@@ -54,10 +54,13 @@ class ProjectAnnotation:
     def init_from_db(self):
         self.reset()
 
-        for task in self.db_tasks:
-            annotation = TaskAnnotation(pk=task.id)
-            annotation.init_from_db()
-            self.annotation_irs[task.id] = annotation.ir_data
+        # Jobs of all tasks are loaded together to lock and query them at once
+        annotations = [TaskAnnotation(pk=task.id) for task in self.db_tasks]
+        db_jobs = [db_job for annotation in annotations for db_job in annotation.db_jobs]
+        job_irs = iter(load_job_irs(db_jobs))
+        for annotation in annotations:
+            annotation.init_from_job_irs(next(job_irs) for _ in annotation.db_jobs)
+            self.annotation_irs[annotation.db_task.id] = annotation.ir_data
 
     def export(self, dst_file: str, exporter: Callable, host: str='', **options):
         project_data = ProjectData(
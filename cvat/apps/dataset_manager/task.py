@@ -3,14 +3,18 @@
 #
 # SPDX-License-Identifier: MIT
 
+import io
+import json
 from collections import OrderedDict
 from enum import Enum
 
 from django.conf import settings
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max, Q
 from django.utils import timezone
 
-from cvat.apps.engine import models, serializers
+from cvat.apps.engine import models
 from cvat.apps.engine.plugins import plugin_decorator
 from cvat.apps.profiler import silk_profile
 
@@ -39,10 +43,13 @@ class PatchAction(str, Enum):
     def __str__(self):
         return self.value
 
+def is_postgresql():
+    return 'postgresql' in settings.DATABASES["default"]["ENGINE"]
+
 def bulk_create(db_model, objects, flt_param):
     if objects:
         if flt_param:
-            if 'postgresql' in settings.DATABASES["default"]["ENGINE"]:
+            if is_postgresql():
                 return db_model.objects.bulk_create(objects)
             else:
                 ids = list(db_model.objects.filter(**flt_param).values_list('id', flat=True))
@@ -54,6 +61,58 @@ def bulk_create(db_model, objects, flt_param):
 
     return []
 
+# Annotations with at least this number of objects are saved by COPY on PostgreSQL
+COPY_MIN_OBJECTS = 1000
+COPY_BATCH_SIZE = 100000
+
+def allocate_ids(db_model, count):
+    """Reserves ids for new rows of the table (PostgreSQL only)"""
+    if not count:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)", [db_model._meta.db_table, count])
+        return [row[0] for row in cursor.fetchall()]
+
+def _get_copy_value(field, row):
+    """Renders the value of the field as a CSV field for COPY"""
+    value = field.get_prep_value(row[field.attname]
+        if field.attname in row else field.get_default())
+    if value is None:
+        # only an unquoted empty field is NULL, a quoted one is an empty string
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, int):
+        return str(int(value))
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (bytes, memoryview)):
+        # bytea in the hex format
+        value = '\\x' + bytes(value).hex()
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+def _get_copy_line(fields, row):
+    return ','.join(_get_copy_value(field, row) for field in fields) + '\n'
+
+def copy_create(db_model, rows):
+    """Inserts rows (dicts with values of model fields by attribute names,
+    ids included) by COPY statements. It is much faster than INSERT for big
+    amounts of rows, but is supported by PostgreSQL only."""
+    fields = db_model._meta.concrete_fields
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        connection.ops.quote_name(db_model._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields))
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), COPY_BATCH_SIZE):
+            buffer = io.StringIO()
+            buffer.writelines(_get_copy_line(fields, row)
+                for row in rows[start:start + COPY_BATCH_SIZE])
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+
 def _merge_table_rows(rows, keys_for_merge, field_id):
     # It is necessary to keep a stable order of original rows
     # (e.g. for tracked boxes). Otherwise prev_box.frame can be bigger
@@ -82,19 +141,39 @@ def _merge_table_rows(rows, keys_for_merge, field_id):
 
     return list(merged_rows.values())
 
-class JobAnnotation:
-    def __init__(self, pk):
-        self.db_job = models.Job.objects.select_related('segment__task') \
-            .select_for_update().get(id=pk)
+# Snapshots of job annotations are kept in the cache together with the commit
+# version they correspond to, so a snapshot is valid while the version is the same.
+def _get_snapshot_key(job_id):
+    return 'annotations/job/{}'.format(job_id)
 
-        db_segment = self.db_job.segment
-        self.start_frame = db_segment.start_frame
-        self.stop_frame = db_segment.stop_frame
-        self.ir_data = AnnotationIR()
+def _get_job_version(job_id):
+    db_commit = models.JobCommit.objects.filter(job_id=job_id).order_by('id').last()
+    return db_commit.version if db_commit else 0
+
+def get_job_snapshot(job_id, version):
+    snapshot = cache.get(_get_snapshot_key(job_id))
+    if snapshot is not None:
+        snapshot = json.loads(snapshot)
+        if snapshot['version'] == version:
+            return snapshot
+    return None
+
+def _set_job_snapshot(job_id, data):
+    snapshot = json.dumps(data)
+    # A version of a rolled back transaction can be used again for other annotations
+    transaction.on_commit(lambda: cache.set(_get_snapshot_key(job_id), snapshot))
+
+def invalidate_job_snapshots(job_ids):
+    keys = [_get_snapshot_key(job_id) for job_id in job_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+class AnnotationLoader:
+    """Reads annotations of jobs from the database. Every table is read by one
+    query for all the jobs and the rows are split by jobs afterwards."""
 
-        self.db_labels = {db_label.id:db_label
-            for db_label in (db_segment.task.project.label_set.all()
-            if db_segment.task.project_id else db_segment.task.label_set.all())}
+    def __init__(self, db_labels):
+        self.db_labels = {db_label.id:db_label for db_label in db_labels}
 
         self.db_attributes = {}
         for db_label in self.db_labels.values():
@@ -115,6 +194,183 @@ class JobAnnotation:
 
                 self.db_attributes[db_label.id]["all"][db_attr.id] = default_value
 
+    @staticmethod
+    def _load_attributes(db_queryset, fk_name):
+        """Groups attribute values by the object they belong to"""
+        attributes = {}
+        for obj_id, spec_id, value in db_queryset.order_by('id') \
+                .values_list(fk_name, 'spec_id', 'value').iterator():
+            attributes.setdefault(obj_id, []).append({
+                'spec_id': spec_id,
+                'value': value,
+            })
+        return attributes
+
+    @staticmethod
+    def _fill_attributes(attributes, default_values):
+        """Adds values of the attributes which are absent, default_values
+        is a mapping spec_id -> value"""
+        specs = set(attr['spec_id'] for attr in attributes)
+        for spec_id, value in default_values.items():
+            if spec_id not in specs:
+                attributes.append({
+                    'spec_id': spec_id,
+                    'value': value,
+                })
+        return attributes
+
+    def _get_default_values(self, label_id, kind):
+        return OrderedDict((spec_id, attr.value)
+            for spec_id, attr in self.db_attributes[label_id][kind].items())
+
+    def _fill_tracked_shape_attributes(self, track):
+        # in case of trackedshapes need to interpolate attriute values and extend it
+        # by previous shape attribute values (not default values)
+        default_values = self._get_default_values(track['label_id'], 'mutable')
+        for shape in track['shapes']:
+            self._fill_attributes(shape['attributes'], default_values)
+            default_values = OrderedDict((attr['spec_id'], attr['value'])
+                for attr in shape['attributes'])
+
+    def _fill_default_attributes(self, data):
+        """Adds the absent attribute values in the same way as they are added on loading"""
+        for obj in data['tags'] + data['shapes']:
+            self._fill_attributes(obj['attributes'], self._get_default_values(obj['label_id'], 'all'))
+        for track in data['tracks']:
+            self._fill_attributes(track['attributes'],
+                self._get_default_values(track['label_id'], 'immutable'))
+            self._fill_tracked_shape_attributes(track)
+
+    # Every table is read by a separate query and the rows are stitched together
+    # by dict indexes. Joining the tables multiplies rows of objects by rows of
+    # their attributes, which is too much for long video jobs.
+    def _load_tags_from_db(self, job_ids):
+        attributes = self._load_attributes(
+            models.LabeledImageAttributeVal.objects.filter(image__job_id__in=job_ids),
+            'image_id')
+
+        tags = {}
+        for tag_id, job_id, frame, label_id, group, source in models.LabeledImage.objects \
+                .filter(job_id__in=job_ids).order_by('job_id', 'frame', 'id') \
+                .values_list('id', 'job_id', 'frame', 'label_id', 'group', 'source') \
+                .iterator():
+            tags.setdefault(job_id, []).append({
+                'id': tag_id,
+                'frame': frame,
+                'label_id': label_id,
+                'group': group,
+                'source': source,
+                'attributes': self._fill_attributes(attributes.pop(tag_id, []),
+                    self._get_default_values(label_id, 'all')),
+            })
+
+        return tags
+
+    def _load_shapes_from_db(self, job_ids):
+        attributes = self._load_attributes(
+            models.LabeledShapeAttributeVal.objects.filter(shape__job_id__in=job_ids),
+            'shape_id')
+
+        shapes = {}
+        for (shape_id, job_id, label_id, shape_type, frame, group, source, occluded,
+                z_order, rotation, points) in models.LabeledShape.objects \
+                .filter(job_id__in=job_ids).order_by('job_id', 'frame', 'id') \
+                .values_list('id', 'job_id', 'label_id', 'type', 'frame',
+                    'group', 'source', 'occluded', 'z_order', 'rotation', 'points') \
+                .iterator():
+            shapes.setdefault(job_id, []).append({
+                'type': shape_type,
+                'occluded': occluded,
+                'z_order': z_order,
+                'rotation': rotation,
+                'points': points,
+                'id': shape_id,
+                'frame': frame,
+                'label_id': label_id,
+                'group': group,
+                'source': source,
+                'attributes': self._fill_attributes(attributes.pop(shape_id, []),
+                    self._get_default_values(label_id, 'all')),
+            })
+
+        return shapes
+
+    def _load_tracks_from_db(self, job_ids):
+        track_attributes = self._load_attributes(
+            models.LabeledTrackAttributeVal.objects.filter(track__job_id__in=job_ids),
+            'track_id')
+        shape_attributes = self._load_attributes(
+            models.TrackedShapeAttributeVal.objects.filter(shape__track__job_id__in=job_ids),
+            'shape_id')
+
+        tracks = OrderedDict()
+        track_jobs = {}
+        for track_id, job_id, frame, label_id, group, source in models.LabeledTrack.objects \
+                .filter(job_id__in=job_ids).order_by('id') \
+                .values_list('id', 'job_id', 'frame', 'label_id', 'group', 'source') \
+                .iterator():
+            track_jobs[track_id] = job_id
+            tracks[track_id] = {
+                'id': track_id,
+                'frame': frame,
+                'label_id': label_id,
+                'group': group,
+                'source': source,
+                'shapes': [],
+                'attributes': self._fill_attributes(track_attributes.pop(track_id, []),
+                    self._get_default_values(label_id, 'immutable')),
+            }
+
+        for (shape_id, track_id, shape_type, occluded, z_order, rotation, points,
+                frame, outside) in models.TrackedShape.objects \
+                .filter(track__job_id__in=job_ids) \
+                .order_by('track_id', 'frame', 'id') \
+                .values_list('id', 'track_id', 'type', 'occluded', 'z_order',
+                    'rotation', 'points', 'frame', 'outside') \
+                .iterator():
+            tracks[track_id]['shapes'].append({
+                'type': shape_type,
+                'occluded': occluded,
+                'z_order': z_order,
+                'rotation': rotation,
+                'points': points,
+                'id': shape_id,
+                'frame': frame,
+                'outside': outside,
+                'attributes': shape_attributes.pop(shape_id, []),
+            })
+
+        jobs_tracks = {}
+        for track_id, track in tracks.items():
+            self._fill_tracked_shape_attributes(track)
+            jobs_tracks.setdefault(track_jobs[track_id], []).append(track)
+
+        return jobs_tracks
+
+    def load_from_db(self, job_ids):
+        """Returns tags, shapes and tracks of the jobs by job ids"""
+        tags = self._load_tags_from_db(job_ids)
+        shapes = self._load_shapes_from_db(job_ids)
+        tracks = self._load_tracks_from_db(job_ids)
+        return {job_id: {
+            'tags': tags.get(job_id, []),
+            'shapes': shapes.get(job_id, []),
+            'tracks': tracks.get(job_id, []),
+        } for job_id in job_ids}
+
+class JobAnnotation(AnnotationLoader):
+    def __init__(self, pk):
+        self.db_job = models.Job.objects.select_related('segment__task') \
+            .select_for_update().get(id=pk)
+
+        db_segment = self.db_job.segment
+        self.start_frame = db_segment.start_frame
+        self.stop_frame = db_segment.stop_frame
+        self.ir_data = AnnotationIR()
+
+        super().__init__(db_segment.task.project.label_set.all()
+            if db_segment.task.project_id else db_segment.task.label_set.all())
+
     def reset(self):
         self.ir_data.reset()
 
@@ -283,6 +539,194 @@ class JobAnnotation:
 
         self.ir_data.tags = tags
 
+    TAG_FIELDS = ('frame', 'label_id', 'group', 'source')
+    SHAPE_FIELDS = TAG_FIELDS + ('type', 'occluded', 'z_order', 'rotation', 'points')
+    TRACK_FIELDS = TAG_FIELDS
+    TRACKED_SHAPE_FIELDS = ('frame', 'type', 'occluded', 'z_order', 'rotation', 'points', 'outside')
+
+    def _get_attribute_specs(self, label_id, kind):
+        if label_id not in self.db_labels:
+            raise AttributeError("label_id `{}` is invalid".format(label_id))
+        return self.db_attributes[label_id][kind]
+
+    @staticmethod
+    def _bulk_update_changed(db_model, objects, db_rows, fields):
+        # Objects are grouped by the set of changed columns,
+        # so only these columns are written
+        changed = OrderedDict()
+        for obj in objects:
+            db_row = db_rows[obj["id"]]
+            changed_fields = tuple(field for field in fields if obj.get(field) != db_row[field])
+            if changed_fields:
+                changed.setdefault(changed_fields, []).append(db_model(id=obj["id"],
+                    **{field: obj.get(field) for field in changed_fields}))
+
+        for changed_fields, db_objects in changed.items():
+            db_model.objects.bulk_update(db_objects, changed_fields)
+
+        return bool(changed)
+
+    @staticmethod
+    def _update_attributes(db_model, fk_name, objects, db_attrvals):
+        # Pairs the requested attributes with the stored ones by spec_id,
+        # inserts the missing values and deletes the rest
+        stored = OrderedDict()
+        for db_attrval in db_attrvals:
+            stored.setdefault((db_attrval[fk_name], db_attrval["spec_id"]), []).append(db_attrval)
+
+        created = []
+        updated = []
+        for obj in objects:
+            for attr in obj["attributes"]:
+                candidates = stored.get((obj["id"], attr["spec_id"]))
+                if candidates:
+                    db_attrval = candidates.pop(0)
+                    if db_attrval["value"] != attr["value"]:
+                        updated.append(db_model(id=db_attrval["id"], value=attr["value"]))
+                else:
+                    created.append(db_model(spec_id=attr["spec_id"], value=attr["value"],
+                        **{fk_name: obj["id"]}))
+        deleted = [db_attrval["id"] for candidates in stored.values() for db_attrval in candidates]
+
+        if updated:
+            db_model.objects.bulk_update(updated, ["value"])
+        bulk_create(db_model=db_model, objects=created, flt_param={})
+        if deleted:
+            db_model.objects.filter(id__in=deleted).delete()
+
+        return bool(created or updated or deleted)
+
+    def _update_objects_in_db(self, db_queryset, db_attr_model, fk_name, objects, fields, get_specs):
+        """Writes only changed columns and attribute values of the objects
+        which are already stored in db_queryset. Returns the objects which
+        are not stored yet and whether something has been changed."""
+        ids = [obj["id"] for obj in objects if obj["id"] is not None]
+        db_rows = {db_row["id"]: db_row
+            for db_row in db_queryset.filter(id__in=ids).values("id", *fields)}
+        new_objects = [obj for obj in objects if obj["id"] not in db_rows]
+        stored_objects = [obj for obj in objects if obj["id"] in db_rows]
+
+        for obj in stored_objects:
+            specs = get_specs(obj)
+            for attr in obj["attributes"]:
+                if attr["spec_id"] not in specs:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+
+        changed = self._bulk_update_changed(db_queryset.model, stored_objects, db_rows, fields)
+        db_attrvals = db_attr_model.objects.filter(**{fk_name + "__in": list(db_rows)}) \
+            .values("id", fk_name, "spec_id", "value").order_by("id")
+        changed |= self._update_attributes(db_attr_model, fk_name, stored_objects, db_attrvals)
+
+        return new_objects, changed
+
+    def _update_tracked_shapes_in_db(self, tracks):
+        track_ids = [track["id"] for track in tracks]
+        db_shape_tracks = dict(models.TrackedShape.objects.filter(track_id__in=track_ids) \
+            .values_list("id", "track_id"))
+
+        stored_shapes = []
+        specs = {}
+        db_shapes = []
+        db_attrvals = []
+        new_shapes = []
+        for track in tracks:
+            for shape in track["shapes"]:
+                if db_shape_tracks.get(shape["id"]) == track["id"]:
+                    del db_shape_tracks[shape["id"]]
+                    stored_shapes.append(shape)
+                    specs[shape["id"]] = self._get_attribute_specs(track["label_id"], "mutable")
+                    continue
+
+                shape_attributes = shape.pop("attributes", [])
+                db_shape = models.TrackedShape(**shape)
+                # The shape can't keep an id which is unknown for the track
+                db_shape.id = None
+                db_shape.track_id = track["id"]
+                for attr in shape_attributes:
+                    db_attrval = models.TrackedShapeAttributeVal(**attr)
+                    if db_attrval.spec_id not in self._get_attribute_specs(track["label_id"], "mutable"):
+                        raise AttributeError("spec_id `{}` is invalid".format(db_attrval.spec_id))
+                    db_attrval.shape_id = len(db_shapes)
+                    db_attrvals.append(db_attrval)
+                db_shapes.append(db_shape)
+                new_shapes.append(shape)
+                shape["attributes"] = shape_attributes
+
+        _, changed = self._update_objects_in_db(
+            db_queryset=models.TrackedShape.objects.filter(track_id__in=track_ids),
+            db_attr_model=models.TrackedShapeAttributeVal,
+            fk_name="shape_id",
+            objects=stored_shapes,
+            fields=self.TRACKED_SHAPE_FIELDS,
+            get_specs=lambda shape: specs[shape["id"]],
+        )
+
+        # The rest of stored shapes were removed from the tracks
+        if db_shape_tracks:
+            models.TrackedShape.objects.filter(id__in=list(db_shape_tracks)).delete()
+            changed = True
+
+        db_shapes = bulk_create(
+            db_model=models.TrackedShape,
+            objects=db_shapes,
+            flt_param={"track__job_id": self.db_job.id}
+        )
+        for db_attrval in db_attrvals:
+            db_attrval.shape_id = db_shapes[db_attrval.shape_id].id
+        bulk_create(
+            db_model=models.TrackedShapeAttributeVal,
+            objects=db_attrvals,
+            flt_param={}
+        )
+        for shape, db_shape in zip(new_shapes, db_shapes):
+            shape["id"] = db_shape.id
+
+        return changed or bool(new_shapes)
+
+    def _update_in_db(self, data):
+        """Updates stored objects in place keeping their ids,
+        objects which are not stored yet are created"""
+        self.reset()
+
+        new_tags, tags_changed = self._update_objects_in_db(
+            db_queryset=self.db_job.labeledimage_set,
+            db_attr_model=models.LabeledImageAttributeVal,
+            fk_name="image_id",
+            objects=data["tags"],
+            fields=self.TAG_FIELDS,
+            get_specs=lambda tag: self._get_attribute_specs(tag["label_id"], "all"),
+        )
+        new_shapes, shapes_changed = self._update_objects_in_db(
+            db_queryset=self.db_job.labeledshape_set,
+            db_attr_model=models.LabeledShapeAttributeVal,
+            fk_name="shape_id",
+            objects=data["shapes"],
+            fields=self.SHAPE_FIELDS,
+            get_specs=lambda shape: self._get_attribute_specs(shape["label_id"], "all"),
+        )
+        new_tracks, tracks_changed = self._update_objects_in_db(
+            db_queryset=self.db_job.labeledtrack_set,
+            db_attr_model=models.LabeledTrackAttributeVal,
+            fk_name="track_id",
+            objects=data["tracks"],
+            fields=self.TRACK_FIELDS,
+            get_specs=lambda track: self._get_attribute_specs(track["label_id"], "immutable"),
+        )
+        new_track_ids = set(id(track) for track in new_tracks)
+        tracks_changed |= self._update_tracked_shapes_in_db(
+            [track for track in data["tracks"] if id(track) not in new_track_ids])
+
+        self._save_tags_to_db(new_tags)
+        self._save_shapes_to_db(new_shapes)
+        self._save_tracks_to_db(new_tracks)
+
+        self.ir_data.tags = data["tags"]
+        self.ir_data.shapes = data["shapes"]
+        self.ir_data.tracks = data["tracks"]
+
+        return tags_changed or shapes_changed or tracks_changed or \
+            new_tags or new_shapes or new_tracks
+
     def _commit(self):
         db_prev_commit = self.db_job.commits.last()
         db_curr_commit = models.JobCommit()
@@ -301,11 +745,73 @@ class JobAnnotation:
         db_task.updated_date = timezone.now()
         db_task.save()
 
+    @staticmethod
+    def _copy_objects_to_db(db_model, db_attr_model, fk_name, fields, items):
+        """items are tuples (object, attribute specs, values of other fields)"""
+        # Ids of the objects are kept like in bulk_create(),
+        # only the objects without them get new ones
+        new_objects = [obj for obj, _, _ in items if obj.get("id") is None]
+        for obj, obj_id in zip(new_objects, allocate_ids(db_model, len(new_objects))):
+            obj["id"] = obj_id
+
+        rows = []
+        attr_rows = []
+        for obj, specs, values in items:
+            rows.append(dict(values, id=obj["id"],
+                **{field: obj[field] for field in fields if field in obj}))
+            for attr in obj.get("attributes", []):
+                if attr["spec_id"] not in specs:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                attr_rows.append({
+                    "spec_id": attr["spec_id"],
+                    "value": attr["value"],
+                    fk_name: obj["id"],
+                })
+
+        for row, row_id in zip(attr_rows, allocate_ids(db_attr_model, len(attr_rows))):
+            row["id"] = row_id
+
+        copy_create(db_model, rows)
+        copy_create(db_attr_model, attr_rows)
+
+    def _copy_to_db(self, data):
+        """Saves annotations like the _save_*_to_db() methods, but sends all
+        rows of a table by COPY. Ids are reserved from the table sequences in
+        advance, so the rows are linked to each other before they are sent."""
+        job_values = {"job_id": self.db_job.id}
+        self._copy_objects_to_db(models.LabeledImage, models.LabeledImageAttributeVal,
+            "image_id", self.TAG_FIELDS, [
+                (tag, self._get_attribute_specs(tag["label_id"], "all"), job_values)
+                for tag in data["tags"]])
+        self._copy_objects_to_db(models.LabeledShape, models.LabeledShapeAttributeVal,
+            "shape_id", self.SHAPE_FIELDS, [
+                (shape, self._get_attribute_specs(shape["label_id"], "all"), job_values)
+                for shape in data["shapes"]])
+        self._copy_objects_to_db(models.LabeledTrack, models.LabeledTrackAttributeVal,
+            "track_id", self.TRACK_FIELDS, [
+                (track, self._get_attribute_specs(track["label_id"], "immutable"), job_values)
+                for track in data["tracks"]])
+        # Tracks already have ids here
+        self._copy_objects_to_db(models.TrackedShape, models.TrackedShapeAttributeVal,
+            "shape_id", self.TRACKED_SHAPE_FIELDS, [
+                (shape, self._get_attribute_specs(track["label_id"], "mutable"),
+                    {"track_id": track["id"]})
+                for track in data["tracks"] for shape in track["shapes"]])
+
+        self.ir_data.tags = data["tags"]
+        self.ir_data.shapes = data["shapes"]
+        self.ir_data.tracks = data["tracks"]
+
     def _save_to_db(self, data):
         self.reset()
-        self._save_tags_to_db(data["tags"])
-        self._save_shapes_to_db(data["shapes"])
-        self._save_tracks_to_db(data["tracks"])
+        objects_count = len(data["tags"]) + len(data["shapes"]) + \
+            sum(len(track["shapes"]) for track in data["tracks"])
+        if is_postgresql() and objects_count >= COPY_MIN_OBJECTS:
+            self._copy_to_db(data)
+        else:
+            self._save_tags_to_db(data["tags"])
+            self._save_shapes_to_db(data["shapes"])
+            self._save_tracks_to_db(data["tracks"])
 
         return self.ir_data.tags or self.ir_data.shapes or self.ir_data.tracks
 
@@ -314,19 +820,61 @@ class JobAnnotation:
             self._set_updated_date()
             self.db_job.save()
 
+    # Objects in a snapshot are ordered in the same way as they are loaded from DB
+    SNAPSHOT_ORDER = (('tags', 'frame'), ('shapes', 'frame'), ('tracks', 'id'))
+
+    def _save_snapshot(self):
+        """Saves the annotations which have just replaced the job ones as a snapshot"""
+        snapshot = json.loads(json.dumps(self.ir_data.data))
+        for key, order in self.SNAPSHOT_ORDER:
+            snapshot[key].sort(key=lambda obj: obj[order])
+        for track in snapshot['tracks']:
+            track['shapes'].sort(key=lambda shape: shape['frame'])
+        self._fill_default_attributes(snapshot)
+        _set_job_snapshot(self.db_job.id, snapshot)
+
+    def _patch_snapshot(self, action):
+        """Applies the saved changes to the snapshot of the previous version"""
+        snapshot = get_job_snapshot(self.db_job.id, self.ir_data.version - 1)
+        if snapshot is None:
+            return
+
+        changes = json.loads(json.dumps({
+            'tags': self.ir_data.tags,
+            'shapes': self.ir_data.shapes,
+            'tracks': self.ir_data.tracks,
+        }))
+        if action != PatchAction.DELETE:
+            self._fill_default_attributes(changes)
+
+        for key, order in self.SNAPSHOT_ORDER:
+            changed_ids = set(obj['id'] for obj in changes[key])
+            objects = [obj for obj in snapshot[key] if obj['id'] not in changed_ids]
+            if action != PatchAction.DELETE:
+                objects.extend(changes[key])
+            objects.sort(key=lambda obj: obj[order])
+            snapshot[key] = objects
+
+        snapshot['version'] = self.ir_data.version
+        _set_job_snapshot(self.db_job.id, snapshot)
+
     def create(self, data):
         self._create(data)
         self._commit()
+        self._patch_snapshot(PatchAction.CREATE)
 
     def put(self, data):
         self._delete()
         self._create(data)
         self._commit()
+        self._save_snapshot()
 
     def update(self, data):
-        self._delete(data)
-        self._create(data)
+        if self._update_in_db(data):
+            self._set_updated_date()
+            self.db_job.save()
         self._commit()
+        self._patch_snapshot(PatchAction.UPDATE)
 
     def _delete(self, data=None):
         deleted_shapes = 0
@@ -362,6 +910,15 @@ class JobAnnotation:
     def delete(self, data=None):
         self._delete(data)
         self._commit()
+        if data is None:
+            _set_job_snapshot(self.db_job.id, {
+                'version': self.ir_data.version,
+                'tags': [],
+                'shapes': [],
+                'tracks': [],
+            })
+        else:
+            self._patch_snapshot(PatchAction.DELETE)
 
     @staticmethod
     def _extend_attributes(attributeval_set, default_attribute_values):
@@ -373,168 +930,22 @@ class JobAnnotation:
                     ('value', db_attr.value),
                 ]))
 
-    def _init_tags_from_db(self):
-        db_tags = self.db_job.labeledimage_set.prefetch_related(
-            "label",
-            "labeledimageattributeval_set"
-        ).values(
-            'id',
-            'frame',
-            'label_id',
-            'group',
-            'source',
-            'labeledimageattributeval__spec_id',
-            'labeledimageattributeval__value',
-            'labeledimageattributeval__id',
-        ).order_by('frame')
-
-        db_tags = _merge_table_rows(
-            rows=db_tags,
-            keys_for_merge={
-                "labeledimageattributeval_set": [
-                    'labeledimageattributeval__spec_id',
-                    'labeledimageattributeval__value',
-                    'labeledimageattributeval__id',
-                ],
-            },
-            field_id='id',
-        )
-
-        for db_tag in db_tags:
-            self._extend_attributes(db_tag.labeledimageattributeval_set,
-                self.db_attributes[db_tag.label_id]["all"].values())
-
-        serializer = serializers.LabeledImageSerializer(db_tags, many=True)
-        self.ir_data.tags = serializer.data
-
-    def _init_shapes_from_db(self):
-        db_shapes = self.db_job.labeledshape_set.prefetch_related(
-            "label",
-            "labeledshapeattributeval_set"
-        ).values(
-            'id',
-            'label_id',
-            'type',
-            'frame',
-            'group',
-            'source',
-            'occluded',
-            'z_order',
-            'rotation',
-            'points',
-            'labeledshapeattributeval__spec_id',
-            'labeledshapeattributeval__value',
-            'labeledshapeattributeval__id',
-            ).order_by('frame')
-
-        db_shapes = _merge_table_rows(
-            rows=db_shapes,
-            keys_for_merge={
-                'labeledshapeattributeval_set': [
-                    'labeledshapeattributeval__spec_id',
-                    'labeledshapeattributeval__value',
-                    'labeledshapeattributeval__id',
-                ],
-            },
-            field_id='id',
-        )
-        for db_shape in db_shapes:
-            self._extend_attributes(db_shape.labeledshapeattributeval_set,
-                self.db_attributes[db_shape.label_id]["all"].values())
-
-        serializer = serializers.LabeledShapeSerializer(db_shapes, many=True)
-        self.ir_data.shapes = serializer.data
-
-    def _init_tracks_from_db(self):
-        db_tracks = self.db_job.labeledtrack_set.prefetch_related(
-            "label",
-            "labeledtrackattributeval_set",
-            "trackedshape_set__trackedshapeattributeval_set"
-        ).values(
-            "id",
-            "frame",
-            "label_id",
-            "group",
-            "source",
-            "labeledtrackattributeval__spec_id",
-            "labeledtrackattributeval__value",
-            "labeledtrackattributeval__id",
-            "trackedshape__type",
-            "trackedshape__occluded",
-            "trackedshape__z_order",
-            "trackedshape__rotation",
-            "trackedshape__points",
-            "trackedshape__id",
-            "trackedshape__frame",
-            "trackedshape__outside",
-            "trackedshape__trackedshapeattributeval__spec_id",
-            "trackedshape__trackedshapeattributeval__value",
-            "trackedshape__trackedshapeattributeval__id",
-        ).order_by('id', 'trackedshape__frame')
-
-        db_tracks = _merge_table_rows(
-            rows=db_tracks,
-            keys_for_merge={
-                "labeledtrackattributeval_set": [
-                    "labeledtrackattributeval__spec_id",
-                    "labeledtrackattributeval__value",
-                    "labeledtrackattributeval__id",
-                ],
-                "trackedshape_set":[
-                    "trackedshape__type",
-                    "trackedshape__occluded",
-                    "trackedshape__z_order",
-                    "trackedshape__points",
-                    "trackedshape__rotation",
-                    "trackedshape__id",
-                    "trackedshape__frame",
-                    "trackedshape__outside",
-                    "trackedshape__trackedshapeattributeval__spec_id",
-                    "trackedshape__trackedshapeattributeval__value",
-                    "trackedshape__trackedshapeattributeval__id",
-                ],
-            },
-            field_id="id",
-        )
-
-        for db_track in db_tracks:
-            db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
-                'trackedshapeattributeval_set': [
-                    'trackedshapeattributeval__value',
-                    'trackedshapeattributeval__spec_id',
-                    'trackedshapeattributeval__id',
-                ]
-            }, 'id')
-
-            # A result table can consist many equal rows for track/shape attributes
-            # We need filter unique attributes manually
-            db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
-            self._extend_attributes(db_track.labeledtrackattributeval_set,
-                self.db_attributes[db_track.label_id]["immutable"].values())
-
-            default_attribute_values = self.db_attributes[db_track.label_id]["mutable"].values()
-            for db_shape in db_track["trackedshape_set"]:
-                db_shape["trackedshapeattributeval_set"] = list(
-                    set(db_shape["trackedshapeattributeval_set"])
-                )
-                # in case of trackedshapes need to interpolate attriute values and extend it
-                # by previous shape attribute values (not default values)
-                self._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
-                default_attribute_values = db_shape["trackedshapeattributeval_set"]
-
-
-        serializer = serializers.LabeledTrackSerializer(db_tracks, many=True)
-        self.ir_data.tracks = serializer.data
-
     def _init_version_from_db(self):
         db_commit = self.db_job.commits.last()
         self.ir_data.version = db_commit.version if db_commit else 0
 
     def init_from_db(self):
-        self._init_tags_from_db()
-        self._init_shapes_from_db()
-        self._init_tracks_from_db()
         self._init_version_from_db()
+        snapshot = get_job_snapshot(self.db_job.id, self.ir_data.version)
+        if snapshot is not None:
+            self.ir_data.data = snapshot
+            return
+
+        data = self.load_from_db([self.db_job.id])[self.db_job.id]
+        self.ir_data.tags = data['tags']
+        self.ir_data.shapes = data['shapes']
+        self.ir_data.tracks = data['tracks']
+        _set_job_snapshot(self.db_job.id, self.ir_data.data)
 
     @property
     def data(self):
@@ -560,6 +971,39 @@ class JobAnnotation:
 
         self.create(task_data.data.slice(self.start_frame, self.stop_frame).serialize())
 
+def load_job_irs(db_jobs):
+    """Returns annotations of the jobs in the same order. The jobs are locked
+    and read in the transaction of the caller, like JobAnnotation does. Jobs
+    without a cached snapshot are read together, by one query per table."""
+    job_ids = [db_job.id for db_job in db_jobs]
+    # All jobs are locked by one query, in the order of ids to avoid deadlocks
+    list(models.Job.objects.select_for_update().filter(id__in=job_ids) \
+        .order_by('id').values_list('id', flat=True))
+
+    versions = dict(models.JobCommit.objects.filter(job_id__in=job_ids) \
+        .values_list('job_id').annotate(Max('version')))
+    job_irs = {}
+    for job_id in job_ids:
+        snapshot = get_job_snapshot(job_id, versions.get(job_id, 0))
+        if snapshot is not None:
+            job_irs[job_id] = AnnotationIR()
+            job_irs[job_id].data = snapshot
+
+    job_ids_to_load = [job_id for job_id in job_ids if job_id not in job_irs]
+    if job_ids_to_load:
+        db_tasks = models.Task.objects.filter(segment__job__id__in=job_ids_to_load)
+        db_labels = models.Label.objects.filter(
+            Q(task__in=db_tasks) | Q(project__tasks__in=db_tasks)) \
+            .distinct().prefetch_related('attributespec_set')
+        loaded_data = AnnotationLoader(db_labels).load_from_db(job_ids_to_load)
+        for job_id in job_ids_to_load:
+            ir_data = AnnotationIR()
+            ir_data.data = dict(loaded_data[job_id], version=versions.get(job_id, 0))
+            _set_job_snapshot(job_id, ir_data.data)
+            job_irs[job_id] = ir_data
+
+    return [job_irs[job_id] for job_id in job_ids]
+
 class TaskAnnotation:
     def __init__(self, pk):
         self.db_task = models.Task.objects.prefetch_related("data__images").get(id=pk)
@@ -614,16 +1058,26 @@ class TaskAnnotation:
 
     def init_from_db(self):
         self.reset()
-
-        for db_job in self.db_jobs:
-            annotation = JobAnnotation(db_job.id)
-            annotation.init_from_db()
-            if annotation.ir_data.version > self.ir_data.version:
-                self.ir_data.version = annotation.ir_data.version
-            db_segment = db_job.segment
-            start_frame = db_segment.start_frame
-            overlap = self.db_task.overlap
-            self._merge_data(annotation.ir_data, start_frame, overlap)
+        self.init_from_job_irs(load_job_irs(list(self.db_jobs)))
+
+    def init_from_job_irs(self, job_irs):
+        """Merges annotations of the task jobs, job_irs are in the order of self.db_jobs"""
+        db_jobs = list(self.db_jobs)
+        overlap = self.db_task.overlap
+        # Segments without overlap can't intersect, so there is nothing to match
+        # and annotations of jobs are just concatenated
+        concatenate = not overlap and all(prev_job.segment.stop_frame < next_job.segment.start_frame
+            for prev_job, next_job in zip(db_jobs, db_jobs[1:]))
+
+        for db_job, ir_data in zip(db_jobs, job_irs):
+            if ir_data.version > self.ir_data.version:
+                self.ir_data.version = ir_data.version
+            if concatenate:
+                self.ir_data.tags.extend(ir_data.tags)
+                self.ir_data.shapes.extend(ir_data.shapes)
+                self.ir_data.tracks.extend(ir_data.tracks)
+            else:
+                self._merge_data(ir_data, db_job.segment.start_frame, overlap)
 
     def export(self, dst_file, exporter, host='', **options):
         task_data = TaskData(
@@ -653,6 +1107,10 @@ class TaskAnnotation:
 @silk_profile(name="GET job data")
 @transaction.atomic
 def get_job_data(pk):
+    snapshot = get_job_snapshot(pk, _get_job_version(pk))
+    if snapshot is not None:
+        return snapshot
+
     annotation = JobAnnotation(pk)
     annotation.init_from_db()
 
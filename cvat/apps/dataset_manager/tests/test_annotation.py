@@ -2,8 +2,9 @@
 #
 # SPDX-License-Identifier: MIT
 
-from cvat.apps.dataset_manager.annotation import TrackManager
+from cvat.apps.dataset_manager.annotation import ShapeManager, TrackManager
 
+from copy import deepcopy
 from unittest import TestCase
 
 
@@ -316,3 +317,142 @@ class TrackManagerTest(TestCase):
 
         interpolated_shapes = TrackManager.get_interpolated_shapes(track, 0, 3)
         self.assertEqual(expected_shapes, interpolated_shapes)
+
+    def test_lazy_interpolation_of_long_track(self):
+        def make_track():
+            return {
+                "frame": 0,
+                "label_id": 0,
+                "group": None,
+                "source": "manual",
+                "attributes": [],
+                "shapes": [
+                    {
+                        "frame": 0,
+                        "points": [0.0, 0.0, 10.0, 10.0],
+                        "rotation": 0,
+                        "type": "rectangle",
+                        "occluded": False,
+                        "outside": False,
+                        "attributes": [{"spec_id": 1, "value": "a"}]
+                    },
+                    {
+                        "frame": 1000,
+                        "points": [1000.0, 500.0, 1010.0, 510.0],
+                        "rotation": 90,
+                        "type": "rectangle",
+                        "occluded": False,
+                        "outside": True,
+                        "attributes": []
+                    },
+                ]
+            }
+
+        expected_shapes = TrackManager.get_interpolated_shapes(make_track(), 0, 2000)
+        self.assertEqual(len(expected_shapes), 1001)
+        self.assertEqual(expected_shapes[500]["points"], [500.0, 250.0, 510.0, 260.0])
+        self.assertEqual(expected_shapes[500]["rotation"], 45.0)
+        self.assertEqual(expected_shapes[-1]["attributes"], [{"spec_id": 1, "value": "a"}])
+
+        # Changes of yielded shapes must not affect the next ones
+        interpolated_shapes = []
+        for shape in TrackManager.iter_interpolated_shapes(make_track(), 0, 2000):
+            interpolated_shapes.append(deepcopy(shape))
+            shape["attributes"].append({"spec_id": 2, "value": "b"})
+        self.assertEqual(expected_shapes, interpolated_shapes)
+
+
+class CostMatrixTest(TestCase):
+    @staticmethod
+    def _make_shape(frame, shape_type, points, label_id=0, outside=False):
+        return {
+            "frame": frame,
+            "label_id": label_id,
+            "points": points,
+            "type": shape_type,
+            "occluded": False,
+            "outside": outside,
+            "rotation": 0,
+            "attributes": []
+        }
+
+    def _check_cost_matrix(self, manager, objects0, objects1, start_frame, overlap):
+        expected = [[1 - manager._calc_objects_similarity(obj0, obj1, start_frame, overlap)
+            for obj1 in objects1] for obj0 in objects0]
+        actual = manager._calc_cost_matrix(objects0, objects1, start_frame, overlap)
+
+        self.assertEqual(actual.shape, (len(objects0), len(objects1)))
+        for expected_row, actual_row in zip(expected, actual.tolist()):
+            for expected_cost, actual_cost in zip(expected_row, actual_row):
+                self.assertAlmostEqual(expected_cost, actual_cost)
+
+    def test_shapes_cost_matrix(self):
+        shapes0 = [
+            self._make_shape(5, "rectangle", [0.0, 0.0, 10.0, 10.0]),
+            self._make_shape(5, "rectangle", [100.0, 100.0, 110.0, 120.0]),
+            self._make_shape(5, "polygon", [0.0, 0.0, 10.0, 0.0, 10.0, 10.0]),
+            self._make_shape(5, "points", [1.0, 1.0]),
+            self._make_shape(5, "rectangle", [2.0, 2.0, 2.0, 12.0]),
+        ]
+        shapes1 = [
+            self._make_shape(5, "rectangle", [5.0, 5.0, 15.0, 15.0]),
+            self._make_shape(5, "rectangle", [0.0, 0.0, 10.0, 10.0], label_id=1),
+            self._make_shape(5, "rectangle", [101.0, 99.0, 111.0, 118.0]),
+            self._make_shape(5, "polygon", [0.0, 0.0, 10.0, 10.0, 0.0, 10.0]),
+            self._make_shape(5, "polygon", [20.0, 20.0, 30.0, 20.0, 30.0, 30.0]),
+            self._make_shape(5, "points", [1.0, 1.0]),
+        ]
+
+        self._check_cost_matrix(ShapeManager, shapes0, shapes1, 0, 10)
+
+    def test_tracks_cost_matrix(self):
+        def make_track(label_id, shapes):
+            return {
+                "frame": shapes[0]["frame"],
+                "label_id": label_id,
+                "group": None,
+                "source": "manual",
+                "attributes": [],
+                "shapes": shapes,
+            }
+
+        def make_tracks():
+            tracks0 = [
+                make_track(0, [
+                    self._make_shape(0, "rectangle", [0.0, 0.0, 10.0, 10.0]),
+                    self._make_shape(8, "rectangle", [8.0, 0.0, 18.0, 10.0]),
+                ]),
+                make_track(0, [
+                    self._make_shape(2, "polygon", [0.0, 0.0, 10.0, 0.0, 10.0, 10.0]),
+                    self._make_shape(6, "polygon", [4.0, 0.0, 14.0, 0.0, 14.0, 10.0],
+                        outside=True),
+                ]),
+                make_track(1, [
+                    self._make_shape(3, "rectangle", [500.0, 500.0, 510.0, 510.0]),
+                ]),
+            ]
+            tracks1 = [
+                make_track(0, [
+                    self._make_shape(5, "rectangle", [6.0, 1.0, 16.0, 11.0]),
+                    self._make_shape(9, "rectangle", [9.0, 1.0, 19.0, 11.0], outside=True),
+                ]),
+                make_track(0, [
+                    self._make_shape(5, "polygon", [3.0, 0.0, 13.0, 0.0, 13.0, 10.0]),
+                ]),
+                make_track(1, [
+                    self._make_shape(5, "rectangle", [0.0, 0.0, 10.0, 10.0]),
+                ]),
+            ]
+            return tracks0, tracks1
+
+        tracks0, tracks1 = make_tracks()
+        expected = [[1 - TrackManager._calc_objects_similarity(track0, track1, 5, 5)
+            for track1 in tracks1] for track0 in tracks0]
+
+        tracks0, tracks1 = make_tracks()
+        actual = TrackManager._calc_cost_matrix(tracks0, tracks1, 5, 5)
+
+        self.assertEqual(actual.shape, (3, 3))
+        for expected_row, actual_row in zip(expected, actual.tolist()):
+            for expected_cost, actual_cost in zip(expected_row, actual_row):
+                self.assertAlmostEqual(expected_cost, actual_cost)
@@ -0,0 +1,309 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from copy import deepcopy
+
+from django.test import TestCase
+
+from cvat.apps.dataset_manager.annotation import AnnotationIR, AnnotationManager
+from cvat.apps.dataset_manager.bindings import ProjectData, TaskData
+from cvat.apps.engine.models import Image, Label, Project
+from cvat.apps.engine.tests.test_rest_api import create_db_task, create_db_users
+
+
+TASK_SIZE = 6
+
+def _group_task_frames_in_memory(task_data, include_empty=False):
+    """The grouping which expanded all shapes of the task at once. The frames
+    are sorted, because their order depended on the z_order of the shapes."""
+    frames = {}
+    def get_frame(idx):
+        frame_info = task_data._frame_info[idx]
+        frame = task_data.abs_frame_id(idx)
+        if frame not in frames:
+            frames[frame] = TaskData.Frame(
+                idx=idx,
+                id=frame_info.get('id',0),
+                frame=frame,
+                name=frame_info['path'],
+                height=frame_info["height"],
+                width=frame_info["width"],
+                labeled_shapes=[],
+                tags=[],
+                shapes=[],
+                labels={}
+            )
+        return frames[frame]
+
+    if include_empty:
+        for idx in task_data._frame_info:
+            get_frame(idx)
+
+    anno_manager = AnnotationManager(task_data._annotation_ir)
+    for shape in sorted(anno_manager.to_shapes(task_data._db_task.data.size),
+            key=lambda shape: shape.get("z_order", 0)):
+        if shape['frame'] not in task_data._frame_info:
+            continue
+        # A tracked shape doesn't repeat the data of the previous labeled shape
+        shape_data = ''
+        if 'track_id' in shape:
+            if shape['outside']:
+                continue
+            exported_shape = task_data._export_tracked_shape(shape)
+        else:
+            exported_shape = task_data._export_labeled_shape(shape)
+            shape_data = task_data._export_shape(shape)
+        get_frame(shape['frame']).labeled_shapes.append(exported_shape)
+        if shape_data:
+            get_frame(shape['frame']).shapes.append(shape_data)
+            for label in task_data._label_mapping.values():
+                label = task_data._export_label(label)
+                get_frame(shape['frame']).labels.update({label.id: label})
+
+    for tag in task_data._annotation_ir.tags:
+        get_frame(tag['frame']).tags.append(task_data._export_tag(tag))
+
+    return sorted(frames.values(), key=lambda frame: frame.frame)
+
+def _group_project_frames_in_memory(project_data, include_empty=False):
+    frames = {}
+    def get_frame(task_id, idx):
+        frame_info = project_data._frame_info[(task_id, idx)]
+        abs_frame = project_data.abs_frame_id(task_id, idx)
+        if (frame_info["subset"], abs_frame) not in frames:
+            frames[(frame_info["subset"], abs_frame)] = ProjectData.Frame(
+                task_id=task_id,
+                subset=frame_info["subset"],
+                idx=idx,
+                id=frame_info.get('id',0),
+                frame=abs_frame,
+                name=frame_info["path"],
+                height=frame_info["height"],
+                width=frame_info["width"],
+                labeled_shapes=[],
+                tags=[],
+            )
+        return frames[(frame_info["subset"], abs_frame)]
+
+    if include_empty:
+        for ident in project_data._frame_info:
+            get_frame(*ident)
+
+    for task in project_data._db_tasks.values():
+        anno_manager = AnnotationManager(project_data._annotation_irs[task.id])
+        for shape in sorted(anno_manager.to_shapes(task.data.size),
+                key=lambda shape: shape.get("z_order", 0)):
+            if (task.id, shape['frame']) not in project_data._frame_info:
+                continue
+            if 'track_id' in shape:
+                if shape['outside']:
+                    continue
+                exported_shape = project_data._export_tracked_shape(shape, task.id)
+            else:
+                exported_shape = project_data._export_labeled_shape(shape, task.id)
+            get_frame(task.id, shape['frame']).labeled_shapes.append(exported_shape)
+
+        for tag in project_data._annotation_irs[task.id].tags:
+            get_frame(task.id, tag['frame']).tags.append(project_data._export_tag(tag, task.id))
+
+    task_ids = list(project_data._db_tasks)
+    return sorted(frames.values(), key=lambda frame: (task_ids.index(frame.task_id), frame.frame))
+
+def _create_task(owner, project=None, subset=""):
+    db_task = create_db_task({
+        "name": "grouping task",
+        "owner": owner,
+        "overlap": 0,
+        "segment_size": TASK_SIZE,
+        "image_quality": 75,
+        "size": TASK_SIZE,
+        "project": project,
+        "subset": subset,
+        "labels": None if project else [{"name": "car"}, {"name": "person"}],
+    })
+    for frame in range(TASK_SIZE):
+        Image.objects.create(data=db_task.data, path="frame_{}.png".format(frame),
+            frame=frame, width=10, height=10)
+    return db_task
+
+def _make_shape(frame, label_id, z_order, **fields):
+    return dict({
+        "frame": frame, "label_id": label_id, "z_order": z_order,
+        "type": "rectangle", "occluded": False, "rotation": 0.0,
+        "points": [1.0, 2.0, 3.0 + frame, 4.0 + frame],
+        "group": 0, "source": "manual", "attributes": [],
+    }, **fields)
+
+def _make_track(label_id, shapes):
+    return {
+        "frame": shapes[0]["frame"], "label_id": label_id, "group": 0,
+        "source": "manual", "attributes": [], "shapes": shapes,
+    }
+
+def _make_annotations(labels):
+    car, person = labels["car"], labels["person"]
+    annotations = AnnotationIR()
+    annotations.tags = [
+        {"frame": 4, "label_id": car, "group": 0, "source": "manual", "attributes": []},
+        {"frame": 1, "label_id": person, "group": 0, "source": "manual", "attributes": []},
+        {"frame": 1, "label_id": car, "group": 0, "source": "auto", "attributes": []},
+    ]
+    annotations.shapes = [
+        _make_shape(2, car, 1, id=1),
+        _make_shape(0, person, 2, id=2),
+        _make_shape(2, person, 0, id=3),
+        _make_shape(1, car, 0, id=4),
+    ]
+    annotations.tracks = [
+        # Ordered by z_order, the tracked shapes follow the labeled shapes
+        _make_track(car, [
+            _make_shape(0, car, 3, outside=False),
+            _make_shape(2, car, 3, outside=True),
+        ]),
+        # Frame 4 has only tags and an outside shape
+        _make_track(person, [
+            _make_shape(3, person, 0, outside=False),
+            _make_shape(4, person, 0, outside=True),
+        ]),
+        # Frame 5 has only an outside shape
+        _make_track(car, [
+            _make_shape(5, car, 0, outside=True),
+        ]),
+    ]
+    return annotations
+
+def _make_annotations_past_end(labels):
+    annotations = AnnotationIR()
+    # The last keyframe is after the last frame of the task,
+    # so there are interpolated shapes past the task size as well
+    annotations.tracks = [
+        _make_track(labels["car"], [
+            _make_shape(4, labels["car"], 0, outside=False),
+            _make_shape(TASK_SIZE + 1, labels["car"], 0, outside=False),
+        ]),
+    ]
+    return annotations
+
+class TaskDataGroupByFrameTest(TestCase):
+    def setUp(self):
+        create_db_users(self)
+        self.task = _create_task(self.owner)
+        self.labels = {db_label.name: db_label.id for db_label in self.task.label_set.all()}
+
+    def _get_frames(self, annotations, include_empty):
+        # Interpolation updates the keyframes of the annotations
+        new_frames = list(TaskData(deepcopy(annotations), self.task)
+            .group_by_frame(include_empty=include_empty))
+        old_frames = _group_task_frames_in_memory(TaskData(deepcopy(annotations), self.task),
+            include_empty=include_empty)
+        return new_frames, old_frames
+
+    def test_frames_are_same_as_grouped_in_memory(self):
+        for make_annotations in [_make_annotations, _make_annotations_past_end]:
+            for include_empty in [False, True]:
+                with self.subTest(annotations=make_annotations.__name__,
+                        include_empty=include_empty):
+                    new_frames, old_frames = self._get_frames(
+                        make_annotations(self.labels), include_empty)
+
+                    self.assertEqual(new_frames, old_frames)
+
+    def test_frames_are_in_frame_order(self):
+        for include_empty, expected_frames in [
+            (False, [0, 1, 2, 3, 4]),
+            (True, list(range(TASK_SIZE))),
+        ]:
+            with self.subTest(include_empty=include_empty):
+                frames, _ = self._get_frames(_make_annotations(self.labels), include_empty)
+
+                self.assertEqual([frame.frame for frame in frames], expected_frames)
+
+    def test_frame_with_only_tags(self):
+        frames, _ = self._get_frames(_make_annotations(self.labels), False)
+
+        frame = frames[4]
+        self.assertEqual(frame.frame, 4)
+        self.assertEqual([tag.label for tag in frame.tags], ["car"])
+        self.assertEqual(frame.labeled_shapes, [])
+
+        frame = frames[1]
+        self.assertEqual([(tag.label, tag.source) for tag in frame.tags],
+            [("person", "manual"), ("car", "auto")])
+
+    def test_frame_with_only_outside_tracks(self):
+        frames, _ = self._get_frames(_make_annotations(self.labels), True)
+
+        self.assertEqual(frames[5].frame, 5)
+        self.assertEqual(frames[5].labeled_shapes, [])
+        self.assertEqual(frames[5].tags, [])
+
+    def test_shapes_are_sorted_by_z_order(self):
+        frames, _ = self._get_frames(_make_annotations(self.labels), False)
+
+        self.assertEqual([(shape.label, shape.z_order) for shape in frames[0].labeled_shapes],
+            [("person", 2), ("car", 3)])
+        self.assertEqual([(shape.label, shape.z_order) for shape in frames[2].labeled_shapes],
+            [("person", 0), ("car", 1)])
+
+    def test_shapes_have_data_of_labeled_shapes_only(self):
+        frames, _ = self._get_frames(_make_annotations(self.labels), False)
+
+        self.assertEqual([[shape.id for shape in frame.shapes] for frame in frames],
+            [[2], [4], [3, 1], [], []])
+        self.assertEqual([sorted(frame.labels) for frame in frames],
+            [sorted(self.labels.values())] * 3 + [[], []])
+
+    def test_interpolated_frames_past_task_size_are_skipped(self):
+        frames, _ = self._get_frames(_make_annotations_past_end(self.labels), False)
+
+        self.assertEqual([frame.frame for frame in frames], [4, 5])
+
+class ProjectDataGroupByFrameTest(TestCase):
+    def setUp(self):
+        create_db_users(self)
+        self.project = Project.objects.create(name="grouping project", owner=self.owner)
+        for name in ["car", "person"]:
+            Label.objects.create(project=self.project, name=name)
+        self.labels = {db_label.name: db_label.id
+            for db_label in self.project.label_set.all()}
+        self.tasks = [_create_task(self.owner, self.project, subset)
+            for subset in ["Validation", "Train", "Train"]]
+
+    def _get_annotations(self):
+        return {
+            self.tasks[0].id: _make_annotations(self.labels),
+            self.tasks[1].id: _make_annotations_past_end(self.labels),
+            self.tasks[2].id: _make_annotations(self.labels),
+        }
+
+    def _get_frames(self, include_empty):
+        new_frames = list(ProjectData(self._get_annotations(), self.project, host='')
+            .group_by_frame(include_empty=include_empty))
+        old_frames = _group_project_frames_in_memory(
+            ProjectData(self._get_annotations(), self.project, host=''),
+            include_empty=include_empty)
+        return new_frames, old_frames
+
+    def test_frames_are_same_as_grouped_in_memory(self):
+        for include_empty in [False, True]:
+            with self.subTest(include_empty=include_empty):
+                new_frames, old_frames = self._get_frames(include_empty)
+
+                self.assertEqual(new_frames, old_frames)
+
+    def test_frames_are_in_task_and_frame_order(self):
+        for include_empty, expected_frames in [
+            (False, [
+                (self.tasks[1].id, [4, 5]),
+                (self.tasks[2].id, [0, 1, 2, 3, 4]),
+                (self.tasks[0].id, [0, 1, 2, 3, 4]),
+            ]),
+            (True, [(db_task.id, list(range(TASK_SIZE)))
+                for db_task in [self.tasks[1], self.tasks[2], self.tasks[0]]]),
+        ]:
+            with self.subTest(include_empty=include_empty):
+                frames, _ = self._get_frames(include_empty)
+
+                self.assertEqual([(frame.task_id, frame.idx) for frame in frames],
+                    [(task_id, idx) for task_id, indices in expected_frames for idx in indices])
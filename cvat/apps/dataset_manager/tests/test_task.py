@@ -0,0 +1,201 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from unittest import TestCase
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from cvat.apps.dataset_manager.task import (JobAnnotation, _get_copy_line,
+    _get_job_version, _get_snapshot_key, get_job_snapshot, load_job_irs,
+    put_job_data)
+from cvat.apps.engine import models
+from cvat.apps.engine.tests.test_rest_api import create_db_task, create_db_users
+
+
+class CopyLineTest(TestCase):
+    @staticmethod
+    def _get_expected_line(db_model, values):
+        return ','.join(values[field.attname]
+            for field in db_model._meta.concrete_fields) + '\n'
+
+    def test_shape_line(self):
+        row = {
+            "id": 5, "job_id": 1, "label_id": 2, "frame": 3, "group": None,
+            "source": "manual", "type": "rectangle", "occluded": False,
+            "z_order": -1, "rotation": 0.5, "points": [1.0, 2.5],
+        }
+
+        line = _get_copy_line(models.LabeledShape._meta.concrete_fields, row)
+
+        self.assertEqual(line, self._get_expected_line(models.LabeledShape, {
+            "id": "5", "job_id": "1", "label_id": "2", "frame": "3",
+            # NULL is an unquoted empty field
+            "group": "",
+            "source": '"manual"', "type": '"rectangle"', "occluded": "f",
+            "z_order": "-1", "rotation": "0.5",
+            "points": '"\\x{}"'.format(np.array([1.0, 2.5], dtype='<f8').tobytes().hex()),
+        }))
+
+    def test_missing_values_are_defaults(self):
+        row = {"id": 5, "job_id": 1, "label_id": 2, "frame": 3, "group": 1,
+            "type": "points", "points": []}
+
+        line = _get_copy_line(models.LabeledShape._meta.concrete_fields, row)
+
+        self.assertEqual(line, self._get_expected_line(models.LabeledShape, {
+            "id": "5", "job_id": "1", "label_id": "2", "frame": "3", "group": "1",
+            "source": '"manual"', "type": '"points"', "occluded": "f",
+            "z_order": "0", "rotation": "0.0", "points": '"\\x"',
+        }))
+
+    def test_strings_are_quoted(self):
+        fields = models.LabeledShapeAttributeVal._meta.concrete_fields
+        values = {"id": "1", "spec_id": "2", "shape_id": "3"}
+
+        for value, expected in [
+            ('', '""'),
+            ('say "yes", then no', '"say ""yes"", then no"'),
+            ('two\nlines', '"two\nlines"'),
+        ]:
+            with self.subTest(value=value):
+                line = _get_copy_line(fields, {"id": 1, "spec_id": 2, "value": value, "shape_id": 3})
+                self.assertEqual(line, self._get_expected_line(
+                    models.LabeledShapeAttributeVal, dict(values, value=expected)))
+
+
+# Snapshots are saved on commit of the transaction, so the tests commit it
+class JobAnnotationTest(TransactionTestCase):
+    def setUp(self):
+        create_db_users(self)
+        self.task = create_db_task({
+            "name": "snapshot task",
+            "owner": self.owner,
+            "overlap": 0,
+            "segment_size": 10,
+            "image_quality": 75,
+            "size": 10,
+            "labels": [{
+                "name": "car",
+                "attributes": [
+                    {"name": "model", "mutable": False, "input_type": "select",
+                        "default_value": "mazda", "values": "mazda\nbmw"},
+                    {"name": "parked", "mutable": True, "input_type": "checkbox",
+                        "default_value": "false", "values": "false"},
+                ]
+            }],
+        })
+        self.job = models.Job.objects.get(segment__task_id=self.task.id)
+        self.label = self.task.label_set.get()
+        self.specs = {db_attr.name: db_attr.id
+            for db_attr in self.label.attributespec_set.all()}
+
+    def tearDown(self):
+        cache.delete(_get_snapshot_key(self.job.id))
+
+    def _get_data(self):
+        shape = {
+            "type": "rectangle", "occluded": False, "z_order": 0, "rotation": 0.0,
+            "points": [1.0, 2.0, 3.0, 4.0], "group": 0, "source": "manual",
+            "label_id": self.label.id,
+        }
+        return {
+            "version": 0,
+            "tags": [{"frame": 1, "label_id": self.label.id, "group": 0,
+                "source": "manual", "attributes": []}],
+            "shapes": [
+                dict(shape, frame=2, attributes=[
+                    {"spec_id": self.specs["parked"], "value": "true"}]),
+                dict(shape, frame=0, attributes=[]),
+            ],
+            "tracks": [{"frame": 0, "label_id": self.label.id, "group": 0,
+                "source": "manual", "attributes": [],
+                "shapes": [
+                    dict(shape, frame=3, outside=True, attributes=[]),
+                    dict(shape, frame=0, outside=False, attributes=[
+                        {"spec_id": self.specs["parked"], "value": "true"}]),
+                ],
+            }],
+        }
+
+    def _load_from_db(self):
+        cache.delete(_get_snapshot_key(self.job.id))
+        annotation = JobAnnotation(self.job.id)
+        annotation.init_from_db()
+        return annotation.data
+
+    def test_put_saves_snapshot_with_default_attributes(self):
+        put_job_data(self.job.id, self._get_data())
+
+        snapshot = get_job_snapshot(self.job.id, _get_job_version(self.job.id))
+
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(snapshot["shapes"][0]["attributes"], [
+            {"spec_id": self.specs["model"], "value": "mazda"},
+            {"spec_id": self.specs["parked"], "value": "false"},
+        ])
+        # Tracked shapes inherit values of the previous shape
+        self.assertEqual(snapshot["tracks"][0]["shapes"][1]["attributes"], [
+            {"spec_id": self.specs["parked"], "value": "true"},
+        ])
+
+    def test_put_snapshot_is_equal_to_loaded_annotations(self):
+        put_job_data(self.job.id, self._get_data())
+        snapshot = get_job_snapshot(self.job.id, _get_job_version(self.job.id))
+
+        with transaction.atomic():
+            data = self._load_from_db()
+
+        self.assertEqual(snapshot, data)
+
+    def test_load_job_irs_sees_changes_of_the_transaction(self):
+        with transaction.atomic():
+            data = put_job_data(self.job.id, self._get_data())
+            job_irs = load_job_irs([self.job])
+
+        self.assertEqual(len(job_irs), 1)
+        self.assertEqual(job_irs[0].version, data["version"])
+        self.assertEqual([shape["id"] for shape in job_irs[0].shapes],
+            [shape["id"] for shape in sorted(data["shapes"], key=lambda s: s["frame"])])
+
+    def test_load_job_irs_reads_jobs_together(self):
+        db_task = create_db_task({
+            "name": "two jobs",
+            "owner": self.owner,
+            "overlap": 0,
+            "segment_size": 5,
+            "image_quality": 75,
+            "size": 10,
+            "labels": [{"name": "car"}],
+        })
+        db_jobs = list(models.Job.objects.filter(segment__task_id=db_task.id) \
+            .order_by('id'))
+        label_id = db_task.label_set.get().id
+        for db_job, frame in zip(db_jobs, [0, 5]):
+            put_job_data(db_job.id, {
+                "version": 0,
+                "tags": [{"frame": frame, "label_id": label_id, "group": 0,
+                    "source": "manual", "attributes": []}],
+                "shapes": [],
+                "tracks": [{"frame": frame, "label_id": label_id, "group": 0,
+                    "source": "manual", "attributes": [], "shapes": [{
+                        "type": "points", "occluded": False, "z_order": 0,
+                        "rotation": 0.0, "points": [1.0, 2.0], "frame": frame,
+                        "outside": False, "attributes": []}],
+                }],
+            })
+        cache.delete_many([_get_snapshot_key(db_job.id) for db_job in db_jobs])
+
+        with transaction.atomic():
+            job_irs = load_job_irs(db_jobs)
+        cache.delete_many([_get_snapshot_key(db_job.id) for db_job in db_jobs])
+
+        for db_job, ir_data in zip(db_jobs, job_irs):
+            with transaction.atomic():
+                annotation = JobAnnotation(db_job.id)
+                annotation.init_from_db()
+            self.assertEqual(ir_data.data, annotation.data)
+            self.assertEqual(len(ir_data.tracks), 1)
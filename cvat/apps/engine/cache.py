@@ -2,20 +2,25 @@
 #
 # SPDX-License-Identifier: MIT
 
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
+import django_rq
+import rq
 from diskcache import Cache
 from django.conf import settings
-from tempfile import NamedTemporaryFile
 
 from cvat.apps.engine.log import slogger
 from cvat.apps.engine.media_extractors import (Mpeg4ChunkWriter,
     Mpeg4CompressedChunkWriter, ZipChunkWriter, ZipCompressedChunkWriter,
     ImageDatasetManifestReader, VideoDatasetManifestReader)
-from cvat.apps.engine.models import DataChoice, StorageChoice
+from cvat.apps.engine.models import Data, DataChoice, StorageChoice
 from cvat.apps.engine.models import DimensionType
-from cvat.apps.engine.cloud_provider import get_cloud_storage_instance, Credentials, Status
+from cvat.apps.engine.cloud_provider import (get_cloud_object_cache,
+    get_db_storage_instance, CloudFileReader, Status)
 from cvat.apps.engine.utils import md5_hash
 class CacheInteraction:
     def __init__(self, dimension=DimensionType.DIM_2D):
@@ -25,8 +30,15 @@ class CacheInteraction:
     def __del__(self):
         self._cache.close()
 
+    @staticmethod
+    def _get_key(db_data_id, chunk_number, quality):
+        return '{}_{}_{}'.format(db_data_id, chunk_number, quality)
+
+    def has_chunk(self, db_data_id, chunk_number, quality):
+        return self._get_key(db_data_id, chunk_number, quality) in self._cache
+
     def get_buff_mime(self, chunk_number, quality, db_data):
-        chunk, tag = self._cache.get('{}_{}_{}'.format(db_data.id, chunk_number, quality), tag=True)
+        chunk, tag = self._cache.get(self._get_key(db_data.id, chunk_number, quality), tag=True)
 
         if not chunk:
             chunk, tag = self.prepare_chunk_buff(db_data, quality, chunk_number)
@@ -57,9 +69,16 @@ class CacheInteraction:
             }[db_data.storage]
         if hasattr(db_data, 'video'):
             source_path = os.path.join(upload_dir, db_data.video.path)
+            source = source_path
+            if db_data.storage == StorageChoice.CLOUD_STORAGE:
+                db_cloud_storage = db_data.cloud_storage
+                assert db_cloud_storage, 'Cloud storage instance was deleted'
+                # only the byte ranges of the decoded key frame intervals are downloaded
+                source = CloudFileReader(get_db_storage_instance(db_cloud_storage),
+                    db_data.video.path)
 
             reader = VideoDatasetManifestReader(manifest_path=db_data.get_manifest_path(),
-                source_path=source_path, chunk_number=chunk_number,
+                source_path=source, chunk_number=chunk_number,
                 chunk_size=db_data.chunk_size, start=db_data.start_frame,
                 stop=db_data.stop_frame, step=db_data.get_frame_step())
             for frame in reader:
@@ -72,56 +91,132 @@ class CacheInteraction:
             if db_data.storage == StorageChoice.CLOUD_STORAGE:
                 db_cloud_storage = db_data.cloud_storage
                 assert db_cloud_storage, 'Cloud storage instance was deleted'
-                credentials = Credentials()
-                credentials.convert_from_db({
-                    'type': db_cloud_storage.credentials_type,
-                    'value': db_cloud_storage.credentials,
-                })
-                details = {
-                    'resource': db_cloud_storage.resource,
-                    'credentials': credentials,
-                    'specific_attributes': db_cloud_storage.get_specific_attributes()
-                }
-                try:
-                    cloud_storage_instance = get_cloud_storage_instance(cloud_provider=db_cloud_storage.provider_type, **details)
-                    for item in reader:
-                        file_name = f"{item['name']}{item['extension']}"
-                        with NamedTemporaryFile(mode='w+b', prefix='cvat', suffix=file_name.replace(os.path.sep, '#'), delete=False) as temp_file:
-                            source_path = temp_file.name
-                            buf = cloud_storage_instance.download_fileobj(file_name)
-                            temp_file.write(buf.getvalue())
-                            checksum = item.get('checksum', None)
-                            if not checksum:
-                                slogger.cloud_storage[db_cloud_storage.id].warning('A manifest file does not contain checksum for image {}'.format(item.get('name')))
-                            if checksum and not md5_hash(source_path) == checksum:
-                                slogger.cloud_storage[db_cloud_storage.id].warning('Hash sums of files {} do not match'.format(file_name))
-                            images.append((source_path, source_path, None))
-                except Exception as ex:
-                    storage_status = cloud_storage_instance.get_status()
-                    if storage_status == Status.FORBIDDEN:
-                        msg = 'The resource {} is no longer available. Access forbidden.'.format(cloud_storage_instance.name)
-                    elif storage_status == Status.NOT_FOUND:
-                        msg = 'The resource {} not found. It may have been deleted.'.format(cloud_storage_instance.name)
-                    else:
-                        # check status of last file
-                        file_status = cloud_storage_instance.get_file_status(file_name)
-                        if file_status == Status.NOT_FOUND:
-                            raise Exception("'{}' not found on the cloud storage '{}'".format(file_name, cloud_storage_instance.name))
-                        elif file_status == Status.FORBIDDEN:
-                            raise Exception("Access to the file '{}' on the '{}' cloud storage is denied".format(file_name, cloud_storage_instance.name))
-                        msg = str(ex)
-                    raise Exception(msg)
+                cloud_storage_instance = get_db_storage_instance(db_cloud_storage)
+                images = self._download_images(cloud_storage_instance, db_cloud_storage.id, reader)
             else:
                 for item in reader:
                     source_path = os.path.join(upload_dir, f"{item['name']}{item['extension']}")
                     images.append((source_path, source_path, None))
         writer.save_as_chunk(images, buff)
         buff.seek(0)
-        if db_data.storage == StorageChoice.CLOUD_STORAGE:
-            images = [image[0] for image in images if os.path.exists(image[0])]
-            for image_path in images:
-                os.remove(image_path)
         return buff, mime_type
 
+    @staticmethod
+    def _download_images(cloud_storage_instance, cloud_storage_id, items):
+        """Downloads images of a chunk into memory concurrently and checks
+        their checksums. Returns the images in the order of items."""
+        object_cache = get_cloud_object_cache()
+
+        def download(item):
+            file_name = f"{item['name']}{item['extension']}"
+            try:
+                buf = object_cache.download_fileobj(cloud_storage_id, cloud_storage_instance, file_name)
+            except Exception as ex:
+                storage_status = cloud_storage_instance.get_status()
+                if storage_status == Status.FORBIDDEN:
+                    msg = 'The resource {} is no longer available. Access forbidden.'.format(cloud_storage_instance.name)
+                elif storage_status == Status.NOT_FOUND:
+                    msg = 'The resource {} not found. It may have been deleted.'.format(cloud_storage_instance.name)
+                else:
+                    file_status = cloud_storage_instance.get_file_status(file_name)
+                    if file_status == Status.NOT_FOUND:
+                        raise Exception("'{}' not found on the cloud storage '{}'".format(file_name, cloud_storage_instance.name))
+                    elif file_status == Status.FORBIDDEN:
+                        raise Exception("Access to the file '{}' on the '{}' cloud storage is denied".format(file_name, cloud_storage_instance.name))
+                    msg = str(ex)
+                raise Exception(msg)
+
+            checksum = item.get('checksum', None)
+            if not checksum:
+                slogger.cloud_storage[cloud_storage_id].warning('A manifest file does not contain checksum for image {}'.format(item.get('name')))
+            elif not md5_hash(buf) == checksum:
+                slogger.cloud_storage[cloud_storage_id].warning('Hash sums of files {} do not match'.format(file_name))
+            buf.seek(0)
+            return (buf, file_name, None)
+
+        items = list(items)
+        if not items:
+            return []
+
+        # Images are downloaded and checked by threads, so a chunk
+        # is fetched in about the time of its slowest image
+        with ThreadPoolExecutor(max_workers=min(settings.CLOUD_STORAGE_DOWNLOAD_WORKERS, len(items))) as executor:
+            images = list(executor.map(download, items))
+        slogger.cloud_storage[cloud_storage_id].info(
+            'Cloud object cache: {hits} hits, {misses} misses, {size} bytes'.format(
+                **object_cache.stats()))
+        return images
+
     def save_chunk(self, db_data_id, chunk_number, quality, buff, mime_type):
-        self._cache.set('{}_{}_{}'.format(db_data_id, chunk_number, quality), buff, tag=mime_type)
+        self._cache.set(self._get_key(db_data_id, chunk_number, quality), buff, tag=mime_type)
+
+
+WARM_UP_JOB_PREFIX = 'chunks/warm-up/'
+# Ids of queued and running warm-up jobs, scored by the time they were enqueued
+WARM_UP_JOBS_KEY = 'chunks/warm-up/jobs'
+WARM_UP_JOB_TIMEOUT = 60 * 60
+
+def warm_up_chunks(db_data_id, chunk_numbers, quality, dimension=DimensionType.DIM_2D):
+    try:
+        db_data = Data.objects.select_related('video', 'cloud_storage').get(id=db_data_id)
+        cache = CacheInteraction(dimension=dimension)
+        for chunk_number in chunk_numbers:
+            if not cache.has_chunk(db_data.id, chunk_number, quality):
+                cache.get_buff_mime(chunk_number, quality, db_data)
+    finally:
+        job = rq.get_current_job()
+        if job is not None:
+            job.connection.zrem(WARM_UP_JOBS_KEY, job.id)
+
+def _reserve_warm_up_job(connection, job_id):
+    """Registers the job as active if it isn't active yet and the budget allows.
+    Jobs of killed workers are forgotten after the job timeout."""
+    now = time.time()
+    with connection.pipeline() as pipe:
+        pipe.zremrangebyscore(WARM_UP_JOBS_KEY, '-inf', now - WARM_UP_JOB_TIMEOUT)
+        pipe.zcard(WARM_UP_JOBS_KEY)
+        _, active_jobs = pipe.execute()
+    if active_jobs >= settings.CHUNK_WARM_UP_MAX_JOBS:
+        return False
+    return bool(connection.zadd(WARM_UP_JOBS_KEY, {job_id: now}, nx=True))
+
+def enqueue_chunk_warm_up(db_data, chunk_numbers, quality, dimension=DimensionType.DIM_2D):
+    """Schedules preparation of the chunks in the given order. The job skips
+    chunks which are already cached. Warm-up is a best effort, so nothing is
+    scheduled when the same job is active or the budget of jobs is exhausted.
+    The check costs two Redis round trips, so it can be done for every request."""
+    if not settings.CHUNK_WARM_UP_MAX_JOBS or not chunk_numbers:
+        return None
+
+    queue = django_rq.get_queue('low')
+    job_id = '{}{}/{}/{}-{}/{}'.format(WARM_UP_JOB_PREFIX, db_data.id, quality.name.lower(),
+        chunk_numbers[0], chunk_numbers[-1], len(chunk_numbers))
+    if not _reserve_warm_up_job(queue.connection, job_id):
+        return None
+
+    try:
+        return queue.enqueue_call(func=warm_up_chunks,
+            args=(db_data.id, chunk_numbers, quality, dimension), job_id=job_id,
+            timeout=WARM_UP_JOB_TIMEOUT, result_ttl=0, failure_ttl=3600)
+    except Exception:
+        queue.connection.zrem(WARM_UP_JOBS_KEY, job_id)
+        raise
+
+def enqueue_chunk_prefetch(db_data, chunk_number, quality, dimension=DimensionType.DIM_2D):
+    chunk_count = math.ceil(db_data.size / db_data.chunk_size)
+    next_chunks = range(chunk_number + 1,
+        min(chunk_number + 1 + settings.CHUNK_PREFETCH_DEPTH, chunk_count))
+    return enqueue_chunk_warm_up(db_data, list(next_chunks), quality, dimension)
+
+def enqueue_task_warm_up(db_task, quality):
+    """Prepares the chunks an annotator sees first: the first chunk of every job,
+    and then the chunks which follow them"""
+    db_data = db_task.data
+    chunk_count = math.ceil(db_data.size / db_data.chunk_size)
+    first_chunks = sorted({db_segment.start_frame // db_data.chunk_size
+        for db_segment in db_task.segment_set.all()})
+    chunk_numbers = list(first_chunks)
+    for depth in range(1, settings.CHUNK_PREFETCH_DEPTH + 1):
+        chunk_numbers.extend(chunk_number + depth for chunk_number in first_chunks
+            if chunk_number + depth < chunk_count and chunk_number + depth not in chunk_numbers)
+    return enqueue_chunk_warm_up(db_data, chunk_numbers, quality, db_task.dimension)
@@ -2,14 +2,23 @@
 #
 # SPDX-License-Identifier: MIT
 
+import hashlib
+import io
+import json
 import os
+import threading
+from collections import OrderedDict
 import boto3
 
 from abc import ABC, abstractmethod, abstractproperty
 from enum import Enum
 from io import BytesIO
 
+from diskcache import Cache
+from django.conf import settings
+
 from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from botocore.handlers import disable_signing
 
@@ -68,6 +77,10 @@ class _CloudStorage(ABC):
     def get_file_last_modified(self, key):
         pass
 
+    @abstractmethod
+    def get_file_etag(self, key):
+        pass
+
     @abstractmethod
     def initialize_content(self):
         pass
@@ -76,6 +89,15 @@ class _CloudStorage(ABC):
     def download_fileobj(self, key):
         pass
 
+    @abstractmethod
+    def get_file_size(self, key):
+        pass
+
+    @abstractmethod
+    def download_range(self, key, start, stop):
+        """Returns bytes [start, stop) of the object"""
+        pass
+
     def download_file(self, key, path):
         file_obj = self.download_fileobj(key)
         if isinstance(file_obj, BytesIO):
@@ -128,6 +150,52 @@ def get_cloud_storage_instance(cloud_provider, resource, credentials, specific_a
         raise NotImplementedError()
     return instance
 
+def _get_db_storage_hash(db_storage):
+    return hashlib.sha1(json.dumps([
+        db_storage.provider_type,
+        db_storage.resource,
+        db_storage.credentials_type,
+        db_storage.credentials,
+        db_storage.get_specific_attributes(),
+    ], sort_keys=True).encode()).hexdigest()
+
+# storage id -> (hash of the storage settings, storage instance)
+_db_storage_instances = OrderedDict()
+_db_storage_instances_lock = threading.Lock()
+
+def get_db_storage_instance(db_storage):
+    """Returns a client of the cloud storage which is shared by the process.
+    Clients keep their connections open, so requests to a storage don't
+    pay for a new session and TLS handshake. The client is created again
+    when the provider, the resource, the credentials or the specific
+    attributes of the storage are changed."""
+    storage_hash = _get_db_storage_hash(db_storage)
+    with _db_storage_instances_lock:
+        cached = _db_storage_instances.get(db_storage.id)
+        if cached is not None and cached[0] == storage_hash:
+            _db_storage_instances.move_to_end(db_storage.id)
+            return cached[1]
+
+    credentials = Credentials()
+    credentials.convert_from_db({
+        'type': db_storage.credentials_type,
+        'value': db_storage.credentials,
+    })
+    instance = get_cloud_storage_instance(cloud_provider=db_storage.provider_type,
+        resource=db_storage.resource, credentials=credentials,
+        specific_attributes=db_storage.get_specific_attributes())
+
+    with _db_storage_instances_lock:
+        _db_storage_instances[db_storage.id] = (storage_hash, instance)
+        _db_storage_instances.move_to_end(db_storage.id)
+        while len(_db_storage_instances) > settings.CLOUD_STORAGE_MAX_CLIENTS:
+            _db_storage_instances.popitem(last=False)
+    return instance
+
+def invalidate_db_storage_instance(storage_id):
+    with _db_storage_instances_lock:
+        _db_storage_instances.pop(storage_id, None)
+
 class AWS_S3(_CloudStorage):
     transfer_config = {
         'max_io_queue': 10,
@@ -139,26 +207,31 @@ class AWS_S3(_CloudStorage):
                 secret_key=None,
                 session_token=None):
         super().__init__()
+        # The pool is shared by the threads which download images of a chunk
+        config = Config(max_pool_connections=max(10,
+            settings.CLOUD_STORAGE_DOWNLOAD_WORKERS))
         if all([access_key_id, secret_key, session_token]):
             self._s3 = boto3.resource(
                 's3',
                 aws_access_key_id=access_key_id,
                 aws_secret_access_key=secret_key,
                 aws_session_token=session_token,
-                region_name=region
+                region_name=region,
+                config=config
             )
         elif access_key_id and secret_key:
             self._s3 = boto3.resource(
                 's3',
                 aws_access_key_id=access_key_id,
                 aws_secret_access_key=secret_key,
-                region_name=region
+                region_name=region,
+                config=config
             )
         elif any([access_key_id, secret_key, session_token]):
             raise Exception('Insufficient data for authorization')
         # anonymous access
         if not any([access_key_id, secret_key, session_token]):
-            self._s3 = boto3.resource('s3', region_name=region)
+            self._s3 = boto3.resource('s3', region_name=region, config=config)
             self._s3.meta.client.meta.events.register('choose-signer.s3.*', disable_signing)
         self._client_s3 = self._s3.meta.client
         self._bucket = self._s3.Bucket(bucket)
@@ -205,6 +278,17 @@ class AWS_S3(_CloudStorage):
     def get_file_last_modified(self, key):
         return self._head_file(key).get('LastModified')
 
+    def get_file_etag(self, key):
+        return self._head_file(key)['ETag']
+
+    def get_file_size(self, key):
+        return self._head_file(key)['ContentLength']
+
+    def download_range(self, key, start, stop):
+        response = self._client_s3.get_object(Bucket=self.name, Key=key,
+            Range='bytes={}-{}'.format(start, stop - 1))
+        return response['Body'].read()
+
     def upload_file(self, file_obj, file_name):
         self._bucket.upload_fileobj(
             Fileobj=file_obj,
@@ -293,6 +377,20 @@ class AzureBlobContainer(_CloudStorage):
     def get_file_last_modified(self, key):
         return self._head_file(key).last_modified
 
+    def get_file_etag(self, key):
+        return self._head_file(key).etag
+
+    def get_file_size(self, key):
+        return self._head_file(key).size
+
+    def download_range(self, key, start, stop):
+        storage_stream_downloader = self._container_client.download_blob(
+            blob=key,
+            offset=start,
+            length=stop - start,
+        )
+        return storage_stream_downloader.readall()
+
     def get_status(self):
         try:
             self._head()
@@ -437,6 +535,155 @@ class GoogleCloudStorage(_CloudStorage):
         blob.reload()
         return blob.updated
 
+    def get_file_etag(self, key):
+        return self._head_file(key)['etag']
+
+    def get_file_size(self, key):
+        return int(self._head_file(key)['size'])
+
+    def download_range(self, key, start, stop):
+        buf = BytesIO()
+        blob = self.bucket.blob(key)
+        self._storage_client.download_blob_to_file(blob, buf, start=start, end=stop - 1)
+        return buf.getvalue()
+
+class CloudFileReader(io.RawIOBase):
+    """A seekable read-only file of a cloud storage object. The object is
+    read by ranged requests in blocks, and the recently read blocks are
+    kept in memory. A video decoder can seek to a key frame with it and
+    transfer only the part of a video it decodes."""
+
+    def __init__(self, storage, key, block_size=None, max_blocks=None):
+        super().__init__()
+        self._storage = storage
+        self._key = key
+        self._size = storage.get_file_size(key)
+        self._position = 0
+        self._block_size = block_size or settings.CLOUD_STORAGE_READ_BLOCK_SIZE
+        self._max_blocks = max_blocks or settings.CLOUD_STORAGE_READ_CACHED_BLOCKS
+        self._blocks = OrderedDict()
+
+    @property
+    def name(self):
+        return self._key
+
+    @property
+    def size(self):
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError('Unsupported whence value {}'.format(whence))
+        if position < 0:
+            raise ValueError('Negative seek position {}'.format(position))
+        self._position = position
+        return position
+
+    def _get_block(self, index):
+        block = self._blocks.get(index)
+        if block is None:
+            start = index * self._block_size
+            block = self._storage.download_range(self._key, start,
+                min(start + self._block_size, self._size))
+            self._blocks[index] = block
+            if len(self._blocks) > self._max_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(index)
+        return block
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        count = 0
+        while count < len(view) and self._position < self._size:
+            index, offset = divmod(self._position, self._block_size)
+            data = self._get_block(index)[offset:offset + len(view) - count]
+            view[count:count + len(data)] = data
+            count += len(data)
+            self._position += len(data)
+        return count
+
+class CloudObjectCache:
+    """A local read-through cache of cloud storage objects. An object is
+    stored by the cloud storage id, its key and its ETag, so a modified
+    object is downloaded again. The ETag of an object is requested again only
+    after etag_ttl seconds, so a modified object can be served from the cache
+    for this time. The least recently used objects are evicted when the cache
+    exceeds the size limit."""
+
+    def __init__(self, directory, size_limit, etag_ttl):
+        self._cache = Cache(directory, size_limit=size_limit,
+            eviction_policy='least-recently-used')
+        # Hits and misses are counted by diskcache for all processes
+        self._cache.stats(enable=True)
+        # ETags are kept separately to not count their lookups as object hits
+        self._etags = Cache(os.path.join(directory, 'etags'))
+        self._etag_ttl = etag_ttl
+
+    def close(self):
+        self._cache.close()
+        self._etags.close()
+
+    @staticmethod
+    def _get_key(storage_id, key, etag):
+        return '{}/{}/{}'.format(storage_id, key, etag)
+
+    def _get_etag(self, storage_id, storage, key):
+        etag_key = '{}/{}'.format(storage_id, key)
+        etag = self._etags.get(etag_key)
+        if etag is None:
+            etag = storage.get_file_etag(key)
+            self._etags.set(etag_key, etag, expire=self._etag_ttl)
+        return etag
+
+    def download_fileobj(self, storage_id, storage, key):
+        cache_key = self._get_key(storage_id, key, self._get_etag(storage_id, storage, key))
+        content = self._cache.get(cache_key)
+        if content is None:
+            content = storage.download_fileobj(key).getvalue()
+            self._cache.set(cache_key, content)
+        return BytesIO(content)
+
+    def download_file(self, storage_id, storage, key, path):
+        file_obj = self.download_fileobj(storage_id, storage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(file_obj.getvalue())
+
+    def stats(self):
+        hits, misses = self._cache.stats()
+        return {
+            'hits': hits,
+            'misses': misses,
+            'size': self._cache.volume(),
+        }
+
+_cloud_object_cache = None
+_cloud_object_cache_lock = threading.Lock()
+
+def get_cloud_object_cache():
+    global _cloud_object_cache
+    with _cloud_object_cache_lock:
+        if _cloud_object_cache is None:
+            _cloud_object_cache = CloudObjectCache(settings.CLOUD_OBJECT_CACHE_ROOT,
+                settings.CLOUD_OBJECT_CACHE_SIZE, settings.CLOUD_OBJECT_CACHE_ETAG_TTL)
+        return _cloud_object_cache
+
 class Credentials:
     __slots__ = ('key', 'secret_key', 'session_token', 'account_name', 'key_file_path', 'credentials_type')
 
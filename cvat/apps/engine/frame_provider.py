@@ -3,15 +3,19 @@
 # SPDX-License-Identifier: MIT
 
 import math
+import os
+import threading
+from collections import OrderedDict
 from enum import Enum
 from io import BytesIO
 
 import cv2
 import numpy as np
+from django.conf import settings
 from PIL import Image
 
 from cvat.apps.engine.cache import CacheInteraction
-from cvat.apps.engine.media_extractors import VideoReader, ZipReader
+from cvat.apps.engine.media_extractors import SeekableVideoReader, VideoReader, ZipReader
 from cvat.apps.engine.mime_types import mimetypes
 from cvat.apps.engine.models import DataChoice, StorageMethodChoice, DimensionType
 
@@ -43,6 +47,95 @@ class RandomAccessIterator:
         self.iterator = iter(self.iterable)
         self.pos = -1
 
+class ChunkCache:
+    """Process-wide LRU of opened chunk readers shared by all FrameProvider
+    instances. The size is limited by the total size of the encoded chunks
+    and the frames their readers keep decoded."""
+
+    class Item:
+        def __init__(self, key, reader, size, stamp):
+            self.key = key
+            self.reader = reader
+            self.base_size = size
+            self.size = size
+            self.stamp = stamp
+            # chunk readers keep a decoding position and can't be shared
+            self.lock = threading.Lock()
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, stamp, factory):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item.stamp == stamp:
+                self._items.move_to_end(key)
+                self._hits += 1
+                return item
+            self._misses += 1
+
+        reader, size = factory()
+        item = self.Item(key, reader, size, stamp)
+        with self._lock:
+            self._remove(key)
+            if size <= self._capacity:
+                self._items[key] = item
+                self._size += size
+                while self._size > self._capacity:
+                    self._remove(next(iter(self._items)))
+                    self._evictions += 1
+        return item
+
+    def resize(self, item, extra_size):
+        """Accounts memory which a reader allocated after it had been opened"""
+        with self._lock:
+            size = item.base_size + extra_size
+            if self._items.get(item.key) is item:
+                self._size += size - item.size
+                item.size = size
+                if size > self._capacity:
+                    # the item doesn't fit alone, the others are kept
+                    self._remove(item.key)
+                    self._evictions += 1
+                while self._size > self._capacity:
+                    self._remove(next(iter(self._items)))
+                    self._evictions += 1
+            item.size = size
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._size -= item.size
+
+    def invalidate(self, data_id):
+        with self._lock:
+            for key in [key for key in self._items if key[0] == data_id]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'items': len(self._items),
+                'size': self._size,
+                'capacity': self._capacity,
+            }
+
+chunk_cache = ChunkCache(settings.FRAME_PROVIDER_CACHE_SIZE)
+
 class FrameProvider:
     VIDEO_FRAME_EXT = '.PNG'
     VIDEO_FRAME_MIME = 'image/png'
@@ -57,31 +150,36 @@ class FrameProvider:
         NUMPY_ARRAY = 2
 
     class ChunkLoader:
-        def __init__(self, reader_class, path_getter):
-            self.chunk_id = None
-            self.chunk_reader = None
+        def __init__(self, reader_class, path_getter, quality, db_data):
             self.reader_class = reader_class
             self.get_chunk_path = path_getter
-
-        def load(self, chunk_id):
-            if self.chunk_id != chunk_id:
-                self.chunk_id = chunk_id
-                self.chunk_reader = RandomAccessIterator(
-                    self.reader_class([self.get_chunk_path(chunk_id)]))
-            return self.chunk_reader
-
-    class BuffChunkLoader(ChunkLoader):
-        def __init__(self, reader_class, path_getter, quality, db_data):
-            super().__init__(reader_class, path_getter)
             self.quality = quality
             self.db_data = db_data
 
+        def _create_reader(self, source):
+            if self.reader_class is VideoReader:
+                return SeekableVideoReader(source)
+            return RandomAccessIterator(self.reader_class([source]))
+
+        def _open(self, chunk_id):
+            chunk_path = self.get_chunk_path(chunk_id)
+            return self._create_reader(chunk_path), os.path.getsize(chunk_path)
+
+        def _get_stamp(self):
+            # any change of the task data must lead to a new chunk reader
+            db_data = self.db_data
+            return (db_data.size, db_data.chunk_size, db_data.start_frame, db_data.stop_frame,
+                db_data.frame_filter, db_data.compressed_chunk_type, db_data.original_chunk_type,
+                db_data.storage_method, db_data.storage)
+
         def load(self, chunk_id):
-            if self.chunk_id != chunk_id:
-                self.chunk_id = chunk_id
-                self.chunk_reader = RandomAccessIterator(
-                    self.reader_class([self.get_chunk_path(chunk_id, self.quality, self.db_data)[0]]))
-            return self.chunk_reader
+            return chunk_cache.get((self.db_data.id, chunk_id, self.quality),
+                self._get_stamp(), lambda: self._open(chunk_id))
+
+    class BuffChunkLoader(ChunkLoader):
+        def _open(self, chunk_id):
+            buff = self.get_chunk_path(chunk_id, self.quality, self.db_data)[0]
+            return self._create_reader(buff), buff.getbuffer().nbytes
 
     def __init__(self, db_data, dimension=DimensionType.DIM_2D):
         self._db_data = db_data
@@ -108,10 +206,14 @@ class FrameProvider:
         else:
             self._loaders[self.Quality.COMPRESSED] = self.ChunkLoader(
                 reader_class[db_data.compressed_chunk_type],
-                db_data.get_compressed_chunk_path)
+                db_data.get_compressed_chunk_path,
+                self.Quality.COMPRESSED,
+                self._db_data)
             self._loaders[self.Quality.ORIGINAL] = self.ChunkLoader(
                 reader_class[db_data.original_chunk_type],
-                db_data.get_original_chunk_path)
+                db_data.get_original_chunk_path,
+                self.Quality.ORIGINAL,
+                self._db_data)
 
     def __len__(self):
         return self._db_data.size
@@ -171,8 +273,11 @@ class FrameProvider:
             out_type=Type.BUFFER):
         _, chunk_number, frame_offset = self._validate_frame_number(frame_number)
         loader = self._loaders[quality]
-        chunk_reader = loader.load(chunk_number)
-        frame, frame_name, _ = chunk_reader[frame_offset]
+        chunk = loader.load(chunk_number)
+        with chunk.lock:
+            frame, frame_name, _ = chunk.reader[frame_offset]
+            if isinstance(chunk.reader, SeekableVideoReader):
+                chunk_cache.resize(chunk, chunk.reader.decoded_nbytes)
 
         frame = self._convert_frame(frame, loader.reader_class, out_type)
         if loader.reader_class is VideoReader:
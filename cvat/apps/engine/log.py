@@ -2,10 +2,22 @@
 #
 # SPDX-License-Identifier: MIT
 
+import atexit
+import hashlib
 import logging
+import re
 import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
 from cvat.settings.base import LOGGING
-from .models import Job, Task, Project, CloudStorage
+from .models import (ActivityLog, AnnotationLog, CloudStorage, Image, Job, Label,
+    Project, Task)
 
 def _get_project(pid):
     try:
@@ -186,3 +198,179 @@ slogger = dotdict({
     'cloud_storage': CloudSourceLoggerStorage(),
     'glob': logging.getLogger('cvat.server'),
 })
+
+ActivityEvent = namedtuple('ActivityEvent',
+    ['activity_type', 'user_id', 'options', 'extra', 'time', 'label_ids'])
+AnnotationEvent = namedtuple('AnnotationEvent',
+    ['user_id', 'job_id', 'action', 'shapes'])
+
+
+class LogBuffer:
+    """Collects activity and annotation log events and writes them to the
+    database in batches from a background thread, so request handlers
+    don't wait for the log queries"""
+
+    def __init__(self, flush_interval, batch_size):
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._events = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, event):
+        if self._flush_interval <= 0:
+            _write_log_events([event])
+            return
+
+        with self._cond:
+            self._events.append(event)
+            if self._thread is None:
+                # The thread is started lazily, so it is never inherited by forks
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            if len(self._events) >= self._batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            events, self._events = self._events, []
+        if events:
+            try:
+                _write_log_events(events)
+            except Exception as err:
+                slogger.glob.warning("Failed to write {} log events\n{}".format(
+                    len(events), str(err)))
+
+    def _run(self):
+        while True:
+            # The thread must survive any error, otherwise events are only queued
+            try:
+                with self._cond:
+                    if len(self._events) < self._batch_size:
+                        self._cond.wait(self._flush_interval)
+                close_old_connections()
+                self.flush()
+            except Exception as err:
+                slogger.glob.warning("Failed to flush log events\n{}".format(str(err)))
+                time.sleep(self._flush_interval)
+
+
+log_buffer = LogBuffer(settings.LOG_BUFFER_FLUSH_INTERVAL, settings.LOG_BUFFER_BATCH_SIZE)
+
+def log_activity(activity_type, user, options=None, extra=None, label_ids=None):
+    """Enqueues an activity. If label_ids are passed, names of the labels
+    are added to the options as 'labels' when the activity is written."""
+    event = ActivityEvent(
+        activity_type=activity_type,
+        user_id=user.id,
+        options=options or {},
+        extra=extra or {},
+        time=datetime.now().isoformat(),
+        label_ids=label_ids,
+    )
+    # Nothing is logged for a rolled back transaction
+    transaction.on_commit(lambda: log_buffer.add(event))
+
+def _write_activities(events):
+    if not events:
+        return
+
+    label_ids = set(label_id for event in events for label_id in event.label_ids or [])
+    label_names = dict(Label.objects.filter(id__in=label_ids) \
+        .values_list('id', 'name')) if label_ids else {}
+
+    # Activities with the same hash are written once, like by update_or_create()
+    activities = {}
+    for event in events:
+        options = dict(event.options)
+        if event.label_ids is not None:
+            options['labels'] = [label_names[label_id]
+                for label_id in sorted(set(event.label_ids) & label_names.keys())]
+        hash_content = hashlib.sha1("{}:{}:{}".format(
+            event.activity_type, event.user_id, options).encode('utf-8')).hexdigest()
+        options['time'] = event.time
+        options = {**options, **event.extra}
+
+        activity_type = str(event.activity_type)
+        activities[(activity_type, event.user_id, hash_content)] = ActivityLog(
+            activity_type=activity_type,
+            user_id=event.user_id,
+            options=options,
+            hash=hash_content,
+        )
+
+    existing_ids = {(activity_type, user_id, hash_content): activity_id
+        for activity_id, activity_type, user_id, hash_content in ActivityLog.objects \
+            .filter(hash__in=[key[2] for key in activities]) \
+            .values_list('id', 'activity_type', 'user_id', 'hash')}
+    new_activities = []
+    updated_activities = []
+    for key, activity in activities.items():
+        if key in existing_ids:
+            activity.id = existing_ids[key]
+            updated_activities.append(activity)
+        else:
+            new_activities.append(activity)
+
+    ActivityLog.objects.bulk_update(updated_activities, ['options'])
+    ActivityLog.objects.bulk_create(new_activities)
+
+def log_annotation(user, job_id, action, shapes):
+    event = AnnotationEvent(
+        user_id=user.id,
+        job_id=job_id,
+        action=action,
+        shapes=[(shape.get('frame'), shape.get('label_id')) for shape in shapes],
+    )
+    transaction.on_commit(lambda: log_buffer.add(event))
+
+
+ANNOTATION_IMAGE_REGEX = re.compile(
+    r"^([^_+-]*)[_+-]*([^_+-]*)[_+-]*(front|back)[_-](laser|cam)\.(.*)$")
+
+def _write_annotations(events):
+    if not events:
+        return
+
+    # Images and labels of all events are resolved by one query each
+    data_ids = dict(Job.objects \
+        .filter(id__in=set(event.job_id for event in events)) \
+        .values_list('id', 'segment__task__data_id'))
+    frames = set(frame for event in events for frame, _ in event.shapes)
+    image_paths = {(data_id, frame): path
+        for data_id, frame, path in Image.objects \
+            .filter(data_id__in=set(data_ids.values()), frame__in=frames) \
+            .values_list('data_id', 'frame', 'path')}
+    label_ids = set(Label.objects \
+        .filter(id__in=set(label_id for event in events for _, label_id in event.shapes)) \
+        .values_list('id', flat=True))
+
+    db_logs = []
+    skipped = 0
+    for event in events:
+        data_id = data_ids.get(event.job_id)
+        for frame, label_id in event.shapes:
+            path = image_paths.get((data_id, frame))
+            regex_match = ANNOTATION_IMAGE_REGEX.match(path) if path else None
+            if regex_match is None or label_id not in label_ids:
+                skipped += 1
+                continue
+
+            db_logs.append(AnnotationLog(
+                order_id=regex_match[1],
+                certificate_id=regex_match[2],
+                orientation=regex_match[3],
+                user_id=event.user_id,
+                action=event.action,
+                label_id=label_id,
+            ))
+
+    AnnotationLog.objects.bulk_create(db_logs)
+    if skipped:
+        slogger.glob.warning("Skipped {} annotation log records without "
+            "a matching image or label".format(skipped))
+
+def _write_log_events(events):
+    _write_activities([event for event in events if isinstance(event, ActivityEvent)])
+    _write_annotations([event for event in events if isinstance(event, AnnotationEvent)])
@@ -0,0 +1,31 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cvat.apps.engine.models import Data, DataChoice
+from cvat.apps.engine.utils import update_certificate_index
+
+class Command(BaseCommand):
+    help = 'Fill the certificate lookup table for images of existing tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-id', type=int, nargs='*', default=None,
+            help='Rebuild the index only for the given data ids')
+
+    def handle(self, *args, **options):
+        queryset = Data.objects.filter(original_chunk_type=DataChoice.IMAGESET).order_by('id')
+        if options['data_id']:
+            queryset = queryset.filter(id__in=options['data_id'])
+
+        total = 0
+        for db_data in queryset.iterator():
+            with transaction.atomic():
+                count = update_certificate_index(db_data)
+            total += count
+            if count:
+                self.stdout.write('Data #{}: {} certificate images'.format(db_data.id, count))
+
+        self.stdout.write(self.style.SUCCESS('Indexed {} certificate images'.format(total)))
@@ -0,0 +1,71 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import time
+
+import numpy as np
+from django.apps.registry import Apps
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from cvat.apps.engine.models import FloatArrayField, PackedFloatArrayField
+
+
+def _create_model(name, points_field):
+    # The models are kept out of the app registry, they are only
+    # needed for temporary tables
+    class Meta:
+        app_label = 'engine'
+        db_table = 'benchmark_points_' + name
+        apps = Apps()
+
+    return type('BenchmarkPoints' + name.capitalize(), (models.Model,), {
+        '__module__': __name__,
+        'Meta': Meta,
+        'points': points_field,
+    })
+
+def _get_table_size(model):
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_total_relation_size(%s)', [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+class Command(BaseCommand):
+    help = 'Compare saving, loading and table size of shape points stored as text and as packed floats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shapes', type=int, default=100000)
+        parser.add_argument('--points', type=int, default=20,
+            help='Number of points of a shape (default: %(default)s)')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        shapes = rng.uniform(0, 4000, (options['shapes'], options['points'] * 2)).tolist()
+
+        self.stdout.write('{} shapes, {} points each'.format(options['shapes'], options['points']))
+        for name, field in (('text', FloatArrayField()), ('packed', PackedFloatArrayField())):
+            model = _create_model(name, field)
+            with connection.schema_editor() as schema_editor:
+                schema_editor.create_model(model)
+            try:
+                start = time.perf_counter()
+                with transaction.atomic():
+                    model.objects.bulk_create((model(points=points) for points in shapes),
+                        batch_size=1000)
+                save_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                loaded = list(model.objects.order_by('id').values_list('points', flat=True))
+                load_time = time.perf_counter() - start
+                assert loaded == shapes
+
+                size = _get_table_size(model)
+                self.stdout.write('  {:<8} save={:.3f}s load={:.3f}s size={}'.format(
+                    name, save_time, load_time,
+                    'n/a' if size is None else '{:.1f}MB'.format(size / 2**20)))
+            finally:
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.delete_model(model)
@@ -9,6 +9,7 @@ import zipfile
 import io
 import itertools
 import struct
+from bisect import bisect_right
 from abc import ABC, abstractmethod
 from contextlib import closing
 
@@ -329,7 +330,7 @@ class VideoReader(IMediaReader):
         return pos / duration if duration else None
 
     def _get_av_container(self):
-        if isinstance(self._source_path[0], io.BytesIO):
+        if isinstance(self._source_path[0], io.IOBase):
             self._source_path[0].seek(0) # required for re-reading
         return av.open(self._source_path[0])
 
@@ -367,6 +368,117 @@ class VideoReader(IMediaReader):
         image = (next(iter(self)))[0]
         return image.width, image.height
 
+class SeekableVideoReader:
+    """Random access to frames of a video chunk. Key frames are found from the
+    container packets and decoding starts from the nearest key frame on the left.
+    A GOP can be as long as the chunk, so only a few decoded frames are kept and
+    the decoder is resumed for the next frames of the same GOP."""
+
+    # Number of decoded frames which are kept for the next requests
+    MAX_DECODED_FRAMES = 8
+
+    def __init__(self, source_path):
+        self._source_path = source_path
+        if isinstance(source_path, io.BytesIO):
+            source_path.seek(0)
+        self._container = av.open(source_path)
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = 'AUTO'
+        self._rotation = int(self._stream.metadata.get('rotate', 0))
+        self._frame_pts, self._key_frames = self._read_index()
+        self._decoded_start = 0
+        self._decoded_frames = []
+        self._decoder = None
+        self._decoder_gop = None
+        self._decoder_pos = 0
+
+    def __del__(self):
+        # the container is absent if the source couldn't be opened
+        container = getattr(self, '_container', None)
+        if container is not None:
+            container.close()
+
+    def __len__(self):
+        return len(self._frame_pts)
+
+    def __getitem__(self, idx):
+        assert 0 <= idx < len(self._frame_pts), 'frame {} is out of the chunk'.format(idx)
+        if not 0 <= idx - self._decoded_start < len(self._decoded_frames):
+            self._decode_frames(idx)
+        frame = self._decoded_frames[idx - self._decoded_start]
+        return (frame, self._source_path, frame.pts)
+
+    @property
+    def decoded_nbytes(self):
+        return sum(plane.buffer_size for frame in self._decoded_frames for plane in frame.planes)
+
+    def _read_index(self):
+        packets = sorted((packet.pts, packet.is_keyframe)
+            for packet in self._container.demux(self._stream) if packet.pts is not None)
+        frame_pts = [pts for pts, _ in packets]
+        key_frames = [idx for idx, (_, is_keyframe) in enumerate(packets) if is_keyframe]
+        if not key_frames or key_frames[0] != 0:
+            key_frames.insert(0, 0)
+        return frame_pts, key_frames
+
+    def _rotate(self, frame):
+        if not self._rotation:
+            return frame
+        rotated_frame = av.VideoFrame().from_ndarray(
+            rotate_image(frame.to_ndarray(format='bgr24'), 360 - self._rotation),
+            format='bgr24'
+        )
+        rotated_frame.pts = frame.pts
+        return rotated_frame
+
+    def _decode_frames(self, start):
+        gop_idx = bisect_right(self._key_frames, start) - 1
+        gop_start = self._key_frames[gop_idx]
+        gop_stop = self._key_frames[gop_idx + 1] \
+            if gop_idx + 1 < len(self._key_frames) else len(self._frame_pts)
+
+        # release the previous frames before decoding the next ones
+        self._decoded_start = start
+        self._decoded_frames = []
+
+        if self._decoder is None or self._decoder_gop != gop_start or start < self._decoder_pos:
+            self._decoder = self._decode_gop(gop_start, gop_stop)
+            self._decoder_gop = gop_start
+            self._decoder_pos = gop_start
+
+        stop = min(start + self.MAX_DECODED_FRAMES, gop_stop)
+        for frame in self._decoder:
+            self._decoder_pos += 1
+            if start < self._decoder_pos:
+                self._decoded_frames.append(self._rotate(frame))
+            if stop <= self._decoder_pos:
+                break
+
+    def _decode_gop(self, gop_start, gop_stop):
+        """Yields frames of the GOP in order"""
+        gop_pts = self._frame_pts[gop_start:gop_stop]
+        pos = gop_start
+        self._container.seek(gop_pts[0], stream=self._stream, backward=True, any_frame=False)
+        for frame in self._container.decode(self._stream):
+            if frame.pts is None or frame.pts > gop_pts[-1]:
+                break
+            if frame.pts < gop_pts[0]:
+                continue
+            if frame.pts != self._frame_pts[pos]:
+                break
+            yield frame
+            pos += 1
+            if pos == gop_stop:
+                return
+
+        # timestamps can't be trusted, continue by decoding from the beginning
+        self._container.seek(0)
+        for idx, frame in enumerate(self._container.decode(self._stream)):
+            if idx >= gop_stop:
+                break
+            if idx >= pos:
+                yield frame
+
 class FragmentMediaReader:
     def __init__(self, chunk_number, chunk_size, start, stop, step=1):
         self._start = start
@@ -405,8 +517,10 @@ class ImageDatasetManifestReader(FragmentMediaReader):
         self._manifest.init_index()
 
     def __iter__(self):
-        for idx in self._frame_range:
-            yield self._manifest[idx]
+        if not self._frame_range:
+            return
+        yield from self._manifest.get_range(self._frame_range[0],
+            self._frame_range[-1] + 1, self._step)
 
 class VideoDatasetManifestReader(FragmentMediaReader):
     def __init__(self, manifest_path, **kwargs):
@@ -416,26 +530,9 @@ class VideoDatasetManifestReader(FragmentMediaReader):
         self._manifest.init_index()
 
     def _get_nearest_left_key_frame(self):
-        if self._start_chunk_frame_number >= \
-                self._manifest[len(self._manifest) - 1].get('number'):
-            left_border = len(self._manifest) - 1
-        else:
-            left_border = 0
-            delta = len(self._manifest)
-            while delta:
-                step = delta // 2
-                cur_position = left_border + step
-                if self._manifest[cur_position].get('number') < self._start_chunk_frame_number:
-                    cur_position += 1
-                    left_border = cur_position
-                    delta -= step + 1
-                else:
-                    delta = step
-            if self._manifest[cur_position].get('number') > self._start_chunk_frame_number:
-                left_border -= 1
-        frame_number = self._manifest[left_border].get('number')
-        timestamp = self._manifest[left_border].get('pts')
-        return frame_number, timestamp
+        numbers, timestamps = self._manifest.key_frames
+        left_border = max(bisect_right(numbers, self._start_chunk_frame_number) - 1, 0)
+        return numbers[left_border], timestamps[left_border]
 
     def __iter__(self):
         start_decode_frame_number, start_decode_timestamp = self._get_nearest_left_key_frame()
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.13 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0050_annotationlog_orientation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CertificateImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frame', models.PositiveIntegerField()),
+                ('order_id', models.CharField(max_length=64)),
+                ('certificate_id', models.CharField(max_length=64)),
+                ('orientation', models.CharField(max_length=5)),
+                ('image_type', models.CharField(max_length=5)),
+                ('data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='certificate_images', to='engine.data')),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='certificate', to='engine.image')),
+                ('job', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='certificate_images', to='engine.job')),
+            ],
+            options={
+                'default_permissions': (),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='certificateimage',
+            index=models.Index(fields=['certificate_id', 'orientation', 'image_type'], name='engine_cert_certifi_f4f972_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificateimage',
+            index=models.Index(fields=['order_id'], name='engine_cert_order_i_f1f53c_idx'),
+        ),
+    ]
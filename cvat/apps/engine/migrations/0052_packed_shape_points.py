@@ -0,0 +1,80 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:00
+
+import cvat.apps.engine.models
+from django.db import migrations
+
+BATCH_SIZE = 10000
+SHAPE_MODELS = ('labeledshape', 'trackedshape')
+
+def _copy_points(apps, src_field, dst_field):
+    for model_name in SHAPE_MODELS:
+        model = apps.get_model('engine', model_name)
+        # Shapes are converted by ranges of ids to keep memory bounded
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', src_field)[:BATCH_SIZE])
+            if not rows:
+                break
+            # FloatArrayField reads an empty text as is, not as a list
+            model.objects.bulk_update(
+                [model(id=shape_id, **{dst_field: [] if points == '' else points})
+                    for shape_id, points in rows],
+                fields=[dst_field], batch_size=BATCH_SIZE)
+            last_id = rows[-1][0]
+
+# float8send() returns big-endian bytes, so they are reversed to get
+# the little-endian values of PackedFloatArrayField
+REVERSED_BYTES = ' || '.join(
+    'substring(value_bytes.b FROM {} FOR 1)'.format(i) for i in range(8, 0, -1))
+
+PACK_POINTS_SQL = """
+    UPDATE {table} AS shape SET packed_points = COALESCE((
+        SELECT string_agg({reversed_bytes}, ''::bytea ORDER BY point.n)
+        FROM unnest(string_to_array(shape.points, ',')::float8[])
+            WITH ORDINALITY AS point(value, n),
+            LATERAL float8send(point.value) AS value_bytes(b)
+    ), ''::bytea)
+    WHERE shape.points IS NOT NULL
+"""
+
+def pack_points(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # The conversion is done by the server with one UPDATE per table.
+        # It rewrites every shape row, so it needs about as much free disk
+        # space as the tables and takes about half a minute per million shapes.
+        for model_name in SHAPE_MODELS:
+            model = apps.get_model('engine', model_name)
+            schema_editor.execute(PACK_POINTS_SQL.format(
+                table=schema_editor.quote_name(model._meta.db_table),
+                reversed_bytes=REVERSED_BYTES))
+    else:
+        # Every shape is read and written back by Python, which is
+        # several times slower
+        _copy_points(apps, 'points', 'packed_points')
+
+def unpack_points(apps, schema_editor):
+    _copy_points(apps, 'packed_points', 'points')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0051_certificateimage'),
+    ]
+
+    operations = [
+        *(migrations.AlterField(
+            model_name=model_name,
+            name='points',
+            field=cvat.apps.engine.models.FloatArrayField(null=True),
+        ) for model_name in SHAPE_MODELS),
+        *(migrations.AddField(
+            model_name=model_name,
+            name='packed_points',
+            field=cvat.apps.engine.models.PackedFloatArrayField(null=True),
+        ) for model_name in SHAPE_MODELS),
+        migrations.RunPython(
+            code=pack_points,
+            reverse_code=unpack_points,
+        ),
+    ]
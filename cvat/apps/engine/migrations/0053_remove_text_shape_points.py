@@ -0,0 +1,31 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:00
+
+import cvat.apps.engine.models
+from django.db import migrations
+
+SHAPE_MODELS = ('labeledshape', 'trackedshape')
+
+class Migration(migrations.Migration):
+    # The columns are altered in a separate migration (and transaction)
+    # after the data has been converted by the previous one
+
+    dependencies = [
+        ('engine', '0052_packed_shape_points'),
+    ]
+
+    operations = [
+        *(migrations.RemoveField(
+            model_name=model_name,
+            name='points',
+        ) for model_name in SHAPE_MODELS),
+        *(migrations.RenameField(
+            model_name=model_name,
+            old_name='packed_points',
+            new_name='points',
+        ) for model_name in SHAPE_MODELS),
+        *(migrations.AlterField(
+            model_name=model_name,
+            name='points',
+            field=cvat.apps.engine.models.PackedFloatArrayField(),
+        ) for model_name in SHAPE_MODELS),
+    ]
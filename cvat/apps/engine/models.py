@@ -4,8 +4,11 @@
 
 import os
 import re
+from base64 import b64decode, b64encode
 from enum import Enum
 
+import numpy as np
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files.storage import FileSystemStorage
@@ -152,7 +155,7 @@ class Data(models.Model):
         return os.path.join(self.get_upload_dirname(), 'manifest.jsonl')
 
     def get_index_path(self):
-        return os.path.join(self.get_upload_dirname(), 'index.json')
+        return os.path.join(self.get_upload_dirname(), 'index.bin')
 
 
 class Video(models.Model):
@@ -176,6 +179,26 @@ class Image(models.Model):
         default_permissions = ()
 
 
+class CertificateImage(models.Model):
+    """Denormalized lookup table for card scans named like
+    "<order_id>-+<certificate_id>-+<orientation>_<image_type>.<ext>"."""
+    image = models.OneToOneField(Image, on_delete=models.CASCADE, related_name="certificate")
+    data = models.ForeignKey(Data, on_delete=models.CASCADE, related_name="certificate_images")
+    job = models.ForeignKey('Job', on_delete=models.SET_NULL, null=True, related_name="certificate_images")
+    frame = models.PositiveIntegerField()
+    order_id = models.CharField(max_length=64)
+    certificate_id = models.CharField(max_length=64)
+    orientation = models.CharField(max_length=5)
+    image_type = models.CharField(max_length=5)
+
+    class Meta:
+        default_permissions = ()
+        indexes = [
+            models.Index(fields=['certificate_id', 'orientation', 'image_type']),
+            models.Index(fields=['order_id']),
+        ]
+
+
 class TrainingProject(models.Model):
     class ProjectClass(models.TextChoices):
         DETECTION = 'OD', _('Object Detection')
@@ -500,14 +523,54 @@ class FloatArrayField(models.TextField):
         return self.from_db_value(value, None, None)
 
     def get_prep_value(self, value):
+        if value is None:
+            return value
         return self.separator.join(map(str, value))
 
 
+class PackedFloatArrayField(models.BinaryField):
+    """Stores a list of floats as packed little-endian float64 values.
+    The values are kept without a loss of precision, but take less space
+    and are decoded much faster than the comma-separated text."""
+    dtype = np.dtype('<f8')
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get('editable') is True:
+            del kwargs['editable']
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return np.frombuffer(value, dtype=self.dtype).tolist()
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+        if isinstance(value, str):
+            value = b64decode(value.encode('ascii'))
+
+        return self.from_db_value(value, None, None)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, memoryview)):
+            return value
+        return np.asarray(value, dtype=self.dtype).tobytes()
+
+    def value_to_string(self, obj):
+        return b64encode(self.get_prep_value(self.value_from_object(obj))).decode('ascii')
+
+
 class Shape(models.Model):
     type = models.CharField(max_length=16, choices=ShapeType.choices())
     occluded = models.BooleanField(default=False)
     z_order = models.IntegerField(default=0)
-    points = FloatArrayField()
+    points = PackedFloatArrayField()
     rotation = FloatField(default=0)
 
     class Meta:
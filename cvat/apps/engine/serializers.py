@@ -1084,6 +1084,15 @@ class GradeParametersSerializer(serializers.Serializer):
     image_type = serializers.ChoiceField(choices=CARD_IMAGE_TYPE_CHOICES, default=LASER)
     task_status = serializers.ChoiceField(choices=TASK_STATUS_CHOICES, required=False)
 
+class GradeParametersCertificateSerializer(serializers.Serializer):
+    certificate_id = serializers.CharField(max_length=8, required=True)
+    orientation = serializers.ChoiceField(choices=CARD_ORIENTATION_CHOICES, required=True)
+
+class GradeParametersBulkSerializer(serializers.Serializer):
+    certificates = GradeParametersCertificateSerializer(many=True, allow_empty=False)
+    image_type = serializers.ChoiceField(choices=CARD_IMAGE_TYPE_CHOICES, default=LASER)
+    task_status = serializers.ChoiceField(choices=TASK_STATUS_CHOICES, required=False)
+
 class GradeParametersFromFileNameSerializer(serializers.Serializer):
     filename = serializers.CharField(required=True)
 
@@ -7,9 +7,16 @@ from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 
+from cvat.apps.dataset_manager.task import invalidate_job_snapshots
+
+from .cloud_provider import invalidate_db_storage_instance
+from .frame_provider import chunk_cache
 from .models import (
+    AttributeSpec,
+    CloudStorage,
     Data,
     Job,
+    Label,
     StatusChoice,
     Task,
     Profile,
@@ -45,3 +52,37 @@ def delete_task_files_on_delete_task(instance, **kwargs):
 @receiver(post_delete, sender=Data, dispatch_uid="delete_data_files_on_delete_data")
 def delete_data_files_on_delete_data(instance, **kwargs):
     shutil.rmtree(instance.get_data_dirname(), ignore_errors=True)
+
+
+@receiver(post_save, sender=Data, dispatch_uid="invalidate_chunk_cache_on_save_data")
+@receiver(post_delete, sender=Data, dispatch_uid="invalidate_chunk_cache_on_delete_data")
+def invalidate_chunk_cache(instance, **kwargs):
+    chunk_cache.invalidate(instance.id)
+
+
+def _invalidate_label_annotation_snapshots(task_id, project_id):
+    if project_id:
+        db_jobs = Job.objects.filter(segment__task__project_id=project_id)
+    else:
+        db_jobs = Job.objects.filter(segment__task_id=task_id)
+    invalidate_job_snapshots(list(db_jobs.values_list('id', flat=True)))
+
+# Annotation snapshots contain default values of attributes
+# and objects which are deleted together with labels
+@receiver(post_save, sender=Label, dispatch_uid="invalidate_annotation_snapshots_on_save_label")
+@receiver(post_delete, sender=Label, dispatch_uid="invalidate_annotation_snapshots_on_delete_label")
+def invalidate_label_annotation_snapshots(instance, **kwargs):
+    _invalidate_label_annotation_snapshots(instance.task_id, instance.project_id)
+
+@receiver(post_save, sender=AttributeSpec, dispatch_uid="invalidate_annotation_snapshots_on_save_attribute")
+@receiver(post_delete, sender=AttributeSpec, dispatch_uid="invalidate_annotation_snapshots_on_delete_attribute")
+def invalidate_attribute_annotation_snapshots(instance, **kwargs):
+    db_label = Label.objects.filter(id=instance.label_id).values_list('task_id', 'project_id').first()
+    # The label is deleted, the snapshots are invalidated by its own signal
+    if db_label:
+        _invalidate_label_annotation_snapshots(*db_label)
+
+@receiver(post_save, sender=CloudStorage, dispatch_uid="invalidate_cloud_storage_client_on_save")
+@receiver(post_delete, sender=CloudStorage, dispatch_uid="invalidate_cloud_storage_client_on_delete")
+def invalidate_cloud_storage_client(instance, **kwargs):
+    invalidate_db_storage_instance(instance.id)
@@ -4,30 +4,36 @@
 # SPDX-License-Identifier: MIT
 
 import itertools
+import multiprocessing
 import os
 import sys
 import rq
 import re
 import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from distutils.dir_util import copy_tree
 from traceback import print_exception
 from urllib import parse as urlparse
 from urllib import request as urlrequest
 import requests
+import django
 import django_rq
 
 from django.conf import settings
 from django.db import transaction
 
 from cvat.apps.engine import models
+from cvat.apps.engine.cache import enqueue_task_warm_up
+from cvat.apps.engine.frame_provider import FrameProvider
 from cvat.apps.engine.log import slogger
 from cvat.apps.engine.media_extractors import (MEDIA_TYPES, Mpeg4ChunkWriter, Mpeg4CompressedChunkWriter,
     ValidateDimension, ZipChunkWriter, ZipCompressedChunkWriter, get_mime)
-from cvat.apps.engine.utils import av_scan_paths
+from cvat.apps.engine.utils import av_scan_paths, update_certificate_index
 from utils.dataset_manifest import ImageManifestManager, VideoManifestManager
 from utils.dataset_manifest.core import VideoManifestValidator
 from utils.dataset_manifest.utils import detect_related_images
-from .cloud_provider import get_cloud_storage_instance, Credentials
+from .cloud_provider import get_db_storage_instance, CloudFileReader
 
 ############################# Low Level server API
 
@@ -210,6 +216,41 @@ def _download_data(urls, upload_dir):
 
     return list(local_files.keys())
 
+def _save_chunk(original_chunk_writer, compressed_chunk_writer, chunk_data,
+        original_chunk_path, compressed_chunk_path):
+    original_chunk_writer.save_as_chunk(chunk_data, original_chunk_path)
+    return compressed_chunk_writer.save_as_chunk(chunk_data, compressed_chunk_path)
+
+def _save_chunks(chunks, db_data, original_chunk_writer, compressed_chunk_writer, workers=1):
+    """Writes chunks using a pool of processes and yields
+    (chunk index, chunk data, image sizes) in the chunk order"""
+    def get_args(chunk_idx, chunk_data):
+        return (original_chunk_writer, compressed_chunk_writer, chunk_data,
+            db_data.get_original_chunk_path(chunk_idx),
+            db_data.get_compressed_chunk_path(chunk_idx))
+
+    if workers <= 1:
+        for chunk_idx, chunk_data in chunks:
+            yield chunk_idx, chunk_data, _save_chunk(*get_args(chunk_idx, chunk_data))
+        return
+
+    # The pool is created inside the transaction of the task creation, so the
+    # workers are spawned: forked ones would share the database connections.
+    # They don't use the database, but the chunk writers need Django set up.
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup,
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+        for chunk_idx, chunk_data in chunks:
+            pending.append((chunk_idx, chunk_data,
+                executor.submit(_save_chunk, *get_args(chunk_idx, chunk_data))))
+            # Limit the number of chunks kept in memory
+            if len(pending) >= 2 * workers:
+                chunk_idx, chunk_data, future = pending.popleft()
+                yield chunk_idx, chunk_data, future.result()
+        while pending:
+            chunk_idx, chunk_data, future = pending.popleft()
+            yield chunk_idx, chunk_data, future.result()
+
 def _get_manifest_frame_indexer(start_frame=0, frame_step=1):
     return lambda frame_id: start_frame + frame_id * frame_step
 
@@ -240,31 +281,25 @@ def _create_thread(tid, data, isImport=False):
         else: # cloud storage
             if not manifest_file: raise Exception('A manifest file not found')
             db_cloud_storage = db_data.cloud_storage
-            credentials = Credentials()
-            credentials.convert_from_db({
-               'type': db_cloud_storage.credentials_type,
-               'value': db_cloud_storage.credentials,
-            })
-
-            details = {
-                'resource': db_cloud_storage.resource,
-                'credentials': credentials,
-                'specific_attributes': db_cloud_storage.get_specific_attributes()
-            }
-            cloud_storage_instance = get_cloud_storage_instance(cloud_provider=db_cloud_storage.provider_type, **details)
-            first_sorted_media_image = sorted(media['image'])[0]
-            cloud_storage_instance.download_file(first_sorted_media_image, os.path.join(upload_dir, first_sorted_media_image))
-
-            # prepare task manifest file from cloud storage manifest file
-            manifest = ImageManifestManager(db_data.get_manifest_path())
-            cloud_storage_manifest = ImageManifestManager(
-                os.path.join(db_data.cloud_storage.get_storage_dirname(), manifest_file[0]),
-                db_data.cloud_storage.get_storage_dirname()
-            )
-            cloud_storage_manifest.set_index()
-            media_files = sorted(media['image'])
-            content = cloud_storage_manifest.get_subset(media_files)
-            manifest.create(content)
+            cloud_storage_instance = get_db_storage_instance(db_cloud_storage)
+            if media['video']:
+                # a video is read from the cloud storage by ranges when it is decoded,
+                # so only its manifest is downloaded
+                cloud_storage_instance.download_file(manifest_file[0], db_data.get_manifest_path())
+            else:
+                first_sorted_media_image = sorted(media['image'])[0]
+                cloud_storage_instance.download_file(first_sorted_media_image, os.path.join(upload_dir, first_sorted_media_image))
+
+                # prepare task manifest file from cloud storage manifest file
+                manifest = ImageManifestManager(db_data.get_manifest_path())
+                cloud_storage_manifest = ImageManifestManager(
+                    os.path.join(db_data.cloud_storage.get_storage_dirname(), manifest_file[0]),
+                    db_data.cloud_storage.get_storage_dirname()
+                )
+                cloud_storage_manifest.refresh_index()
+                media_files = sorted(media['image'])
+                content = cloud_storage_manifest.get_subset(media_files)
+                manifest.create(content)
 
     av_scan_paths(upload_dir)
 
@@ -293,6 +328,8 @@ def _create_thread(tid, data, isImport=False):
             if extractor is not None:
                 raise Exception('Combined data types are not supported')
             source_paths=[os.path.join(upload_dir, f) for f in media_files]
+            if media_type == 'video' and db_data.storage == models.StorageChoice.CLOUD_STORAGE:
+                source_paths = [CloudFileReader(cloud_storage_instance, media_files[0])]
             if media_type in {'archive', 'zip'} and db_data.storage == models.StorageChoice.SHARE:
                 source_paths.append(db_data.get_upload_dirname())
                 upload_dir = db_data.get_upload_dirname()
@@ -379,6 +416,9 @@ def _create_thread(tid, data, isImport=False):
         if isinstance(compressed_chunk_writer, ZipCompressedChunkWriter):
             if not (db_data.storage == models.StorageChoice.CLOUD_STORAGE):
                 w, h = extractor.get_image_size(0)
+            elif task_mode == MEDIA_TYPES['video']['mode']:
+                # the manifest of a cloud video is downloaded, the video is not
+                w, h = VideoManifestManager(db_data.get_manifest_path()).video_resolution
             else:
                 img_properties = manifest[0]
                 w, h = img_properties['width'], img_properties['height']
@@ -408,14 +448,20 @@ def _create_thread(tid, data, isImport=False):
                     os.remove(os.path.join(upload_dir, manifest_file[0]))
 
             if task_mode == MEDIA_TYPES['video']['mode']:
+                is_cloud_video = db_data.storage == models.StorageChoice.CLOUD_STORAGE
                 try:
                     manifest_is_prepared = False
                     if manifest_file:
                         try:
-                            manifest = VideoManifestValidator(source_path=os.path.join(upload_dir, media_files[0]),
-                                                              manifest_path=db_data.get_manifest_path())
+                            manifest = VideoManifestValidator(
+                                source_path=CloudFileReader(cloud_storage_instance, media_files[0]) \
+                                    if is_cloud_video else os.path.join(upload_dir, media_files[0]),
+                                manifest_path=db_data.get_manifest_path())
                             manifest.init_index()
-                            manifest.validate_seek_key_frames()
+                            # seeking to every key frame of a remote video
+                            # would download a large part of it
+                            if not is_cloud_video:
+                                manifest.validate_seek_key_frames()
                             manifest.validate_frame_numbers()
                             assert len(manifest) > 0, 'No key frames.'
 
@@ -432,6 +478,8 @@ def _create_thread(tid, data, isImport=False):
                             _update_status('{} Start prepare a valid manifest file.'.format(base_msg))
 
                     if not manifest_is_prepared:
+                        assert not is_cloud_video, \
+                            'A video from a cloud storage requires a valid manifest file.'
                         _update_status('Start prepare a manifest file')
                         manifest = VideoManifestManager(db_data.get_manifest_path())
                         manifest.link(
@@ -450,6 +498,8 @@ def _create_thread(tid, data, isImport=False):
                         if data['stop_frame'] else all_frames, all_frames), db_data.get_frame_step()))
                     video_path = os.path.join(upload_dir, media_files[0])
                 except Exception as ex:
+                    if is_cloud_video:
+                        raise
                     db_data.storage_method = models.StorageMethodChoice.FILE_SYSTEM
                     manifest.remove()
                     del manifest
@@ -466,21 +516,22 @@ def _create_thread(tid, data, isImport=False):
                         data_dir=upload_dir,
                         DIM_3D=(db_task.dimension == models.DimensionType.DIM_3D),
                     )
-                    manifest.create()
+                    manifest.create(workers=settings.MANIFEST_CREATION_WORKERS)
                 else:
                     manifest.init_index()
                 counter = itertools.count()
                 for _, chunk_frames in itertools.groupby(extractor.frame_range, lambda x: next(counter) // db_data.chunk_size):
                     chunk_paths = [(extractor.get_path(i), i) for i in chunk_frames]
-                    img_sizes = []
-
-                    for _, frame_id in chunk_paths:
-                        properties = manifest[manifest_index(frame_id)]
-                        if db_task.dimension == models.DimensionType.DIM_2D:
-                            resolution = (properties['width'], properties['height'])
-                        else:
-                            resolution = extractor.get_image_size(frame_id)
-                        img_sizes.append(resolution)
+                    if db_task.dimension == models.DimensionType.DIM_2D:
+                        # frames of a chunk are placed evenly in the manifest and read at once
+                        manifest_indices = [manifest_index(frame_id) for _, frame_id in chunk_paths]
+                        manifest_step = manifest_indices[1] - manifest_indices[0] \
+                            if len(manifest_indices) > 1 else 1
+                        img_sizes = [(properties['width'], properties['height'])
+                            for properties in manifest.get_range(manifest_indices[0],
+                                manifest_indices[-1] + 1, manifest_step)]
+                    else:
+                        img_sizes = [extractor.get_image_size(frame_id) for _, frame_id in chunk_paths]
 
                     db_images.extend([
                         models.Image(data=db_data,
@@ -492,14 +543,11 @@ def _create_thread(tid, data, isImport=False):
     if db_data.storage_method == models.StorageMethodChoice.FILE_SYSTEM or not settings.USE_CACHE:
         counter = itertools.count()
         generator = itertools.groupby(extractor, lambda x: next(counter) // db_data.chunk_size)
-        for chunk_idx, chunk_data in generator:
-            chunk_data = list(chunk_data)
-            original_chunk_path = db_data.get_original_chunk_path(chunk_idx)
-            original_chunk_writer.save_as_chunk(chunk_data, original_chunk_path)
-
-            compressed_chunk_path = db_data.get_compressed_chunk_path(chunk_idx)
-            img_sizes = compressed_chunk_writer.save_as_chunk(chunk_data, compressed_chunk_path)
-
+        generator = ((chunk_idx, list(chunk_data)) for chunk_idx, chunk_data in generator)
+        # Decoded video frames can't be passed to other processes
+        workers = settings.CHUNK_ENCODING_WORKERS if db_task.mode == 'annotation' else 1
+        for chunk_idx, chunk_data, img_sizes in _save_chunks(generator, db_data,
+                original_chunk_writer, compressed_chunk_writer, workers):
             if db_task.mode == 'annotation':
                 db_images.extend([
                     models.Image(
@@ -548,3 +596,15 @@ def _create_thread(tid, data, isImport=False):
 
     slogger.glob.info("Found frames {} for Data #{}".format(db_data.size, db_data.id))
     _save_task_to_db(db_task)
+
+    if db_task.mode == 'annotation':
+        update_certificate_index(db_data)
+
+    if settings.USE_CACHE and db_data.storage_method == models.StorageMethodChoice.CACHE:
+        transaction.on_commit(lambda: _warm_up_chunks(db_task))
+
+def _warm_up_chunks(db_task):
+    try:
+        enqueue_task_warm_up(db_task, FrameProvider.Quality.COMPRESSED)
+    except Exception as ex:
+        slogger.glob.warning("Failed to schedule chunk warm-up for task #{}: {}".format(db_task.id, ex))
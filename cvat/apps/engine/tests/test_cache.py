@@ -0,0 +1,105 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from fakeredis import FakeStrictRedis
+
+from cvat.apps.engine import cache
+from cvat.apps.engine.frame_provider import FrameProvider
+from cvat.apps.engine.models import DimensionType
+
+
+class _Queue:
+    """Records enqueued jobs instead of running them"""
+
+    def __init__(self):
+        self.connection = FakeStrictRedis()
+        self.jobs = []
+
+    def enqueue_call(self, func, args, job_id, **kwargs):
+        self.jobs.append((job_id, args))
+        return SimpleNamespace(id=job_id)
+
+@override_settings(CHUNK_WARM_UP_MAX_JOBS=2, CHUNK_PREFETCH_DEPTH=2)
+class ChunkWarmUpTest(SimpleTestCase):
+    def setUp(self):
+        self.queue = _Queue()
+        patcher = mock.patch('django_rq.get_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db_data = SimpleNamespace(id=1, size=100, chunk_size=10)
+
+    def _get_active_jobs(self):
+        return [job_id.decode() for job_id in
+            self.queue.connection.zrange(cache.WARM_UP_JOBS_KEY, 0, -1)]
+
+    def test_budget_of_jobs_is_limited(self):
+        connection = self.queue.connection
+
+        self.assertTrue(cache._reserve_warm_up_job(connection, 'a'))
+        self.assertFalse(cache._reserve_warm_up_job(connection, 'a'))
+        self.assertTrue(cache._reserve_warm_up_job(connection, 'b'))
+        self.assertFalse(cache._reserve_warm_up_job(connection, 'c'))
+
+        connection.zrem(cache.WARM_UP_JOBS_KEY, 'a')
+
+        self.assertTrue(cache._reserve_warm_up_job(connection, 'c'))
+
+    def test_jobs_of_killed_workers_are_forgotten(self):
+        connection = self.queue.connection
+        connection.zadd(cache.WARM_UP_JOBS_KEY,
+            {'a': time.time() - cache.WARM_UP_JOB_TIMEOUT - 1, 'b': time.time()})
+
+        self.assertTrue(cache._reserve_warm_up_job(connection, 'c'))
+        self.assertEqual(sorted(self._get_active_jobs()), ['b', 'c'])
+
+    def test_prefetch_enqueues_next_chunks(self):
+        job = cache.enqueue_chunk_prefetch(self.db_data, 8, FrameProvider.Quality.COMPRESSED)
+
+        self.assertEqual(self.queue.jobs, [(job.id,
+            (1, [9], FrameProvider.Quality.COMPRESSED, DimensionType.DIM_2D))])
+        self.assertEqual(self._get_active_jobs(), [job.id])
+
+    def test_same_prefetch_is_enqueued_once(self):
+        for _ in range(2):
+            cache.enqueue_chunk_prefetch(self.db_data, 3, FrameProvider.Quality.COMPRESSED)
+
+        self.assertEqual([args[1] for _, args in self.queue.jobs], [[4, 5]])
+
+    def test_prefetch_of_the_last_chunk_does_nothing(self):
+        self.assertIsNone(cache.enqueue_chunk_prefetch(self.db_data, 9,
+            FrameProvider.Quality.COMPRESSED))
+        self.assertEqual(self.queue.jobs, [])
+
+    def test_reservation_is_released_if_enqueueing_fails(self):
+        with mock.patch.object(self.queue, 'enqueue_call', side_effect=ConnectionError()), \
+                self.assertRaises(ConnectionError):
+            cache.enqueue_chunk_prefetch(self.db_data, 0, FrameProvider.Quality.COMPRESSED)
+
+        self.assertEqual(self._get_active_jobs(), [])
+
+    def test_finished_job_releases_reservation(self):
+        job = cache.enqueue_chunk_prefetch(self.db_data, 0, FrameProvider.Quality.COMPRESSED)
+        current_job = SimpleNamespace(id=job.id, connection=self.queue.connection)
+
+        with mock.patch('rq.get_current_job', return_value=current_job), \
+                mock.patch.object(cache.Data.objects, 'select_related',
+                    side_effect=cache.Data.DoesNotExist()), \
+                self.assertRaises(cache.Data.DoesNotExist):
+            cache.warm_up_chunks(self.db_data.id, [1, 2], FrameProvider.Quality.COMPRESSED)
+
+        self.assertEqual(self._get_active_jobs(), [])
+
+    def test_task_warm_up_starts_with_first_chunks_of_jobs(self):
+        db_task = SimpleNamespace(data=self.db_data, dimension=DimensionType.DIM_2D,
+            segment_set=SimpleNamespace(all=lambda: [SimpleNamespace(start_frame=start_frame)
+                for start_frame in [0, 50]]))
+
+        cache.enqueue_task_warm_up(db_task, FrameProvider.Quality.COMPRESSED)
+
+        self.assertEqual([args[1] for _, args in self.queue.jobs], [[0, 5, 1, 6, 2, 7]])
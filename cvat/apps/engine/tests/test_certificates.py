@@ -0,0 +1,200 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from io import StringIO
+
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from cvat.apps.engine.models import CertificateImage, Image, Job
+from cvat.apps.engine.tests.test_rest_api import ForceLogin, create_db_task, create_db_users
+from cvat.apps.engine.utils import update_certificate_index
+
+
+def _create_task(owner, paths, segment_size=None):
+    db_task = create_db_task({
+        "name": "certificates",
+        "owner": owner,
+        "overlap": 0,
+        "segment_size": segment_size or len(paths),
+        "image_quality": 75,
+        "size": len(paths),
+    })
+    for frame, path in enumerate(paths):
+        Image.objects.create(data=db_task.data, path=path, frame=frame, width=100, height=200)
+    return db_task
+
+class UpdateCertificateIndexTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+        cls.task = _create_task(cls.owner, [
+            "ORD1-+123-+front_laser.png",
+            "ORD1-+123-+BACK-cam.png",
+            "random.png",
+            "ORD2-+456_front_laser.jpg",
+        ], segment_size=2)
+
+    def _get_index(self):
+        return sorted(CertificateImage.objects.filter(data_id=self.task.data_id).values_list(
+            'frame', 'order_id', 'certificate_id', 'orientation', 'image_type', 'job_id'))
+
+    def test_images_are_indexed(self):
+        jobs = list(Job.objects.filter(segment__task_id=self.task.id).order_by('segment__start_frame'))
+
+        count = update_certificate_index(self.task.data)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(self._get_index(), [
+            (0, "ORD1", "123", "front", "laser", jobs[0].id),
+            (1, "ORD1", "123", "back", "cam", jobs[0].id),
+            (3, "ORD2", "456", "front", "laser", jobs[1].id),
+        ])
+
+    def test_index_is_rebuilt(self):
+        update_certificate_index(self.task.data)
+        Image.objects.filter(data_id=self.task.data_id, frame=3).update(path="ORD2-+789_back_cam.png")
+
+        update_certificate_index(self.task.data)
+
+        self.assertEqual([row[1:5] for row in self._get_index()], [
+            ("ORD1", "123", "front", "laser"),
+            ("ORD1", "123", "back", "cam"),
+            ("ORD2", "789", "back", "cam"),
+        ])
+
+    def test_backfill_command(self):
+        other_task = _create_task(self.owner, ["ORD3-+111-+front_laser.png"])
+
+        output = StringIO()
+        call_command('backfill_certificate_index', '--data-id', str(self.task.data_id), stdout=output)
+
+        self.assertEqual(len(self._get_index()), 3)
+        self.assertFalse(CertificateImage.objects.filter(data_id=other_task.data_id).exists())
+        self.assertIn('Indexed 3 certificate images', output.getvalue())
+
+        call_command('backfill_certificate_index', stdout=StringIO())
+
+        self.assertEqual(CertificateImage.objects.count(), 4)
+
+class CertificateViewsTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+        cls.task = _create_task(cls.owner, [
+            "ORD1-+123-+front_laser.png",
+            "ORD1-+123-+back_laser.png",
+            "ORD2-+456-+front_laser.png",
+        ])
+        cls.other_task = _create_task(cls.owner, [
+            "ORD3-+123-+front_laser.png",
+            # the name doesn't follow the convention, so the image isn't indexed
+            "ORD4-+456-+front.png",
+            "ORD5-+789-+back_laser.png",
+        ])
+        for db_task in [cls.task, cls.other_task]:
+            update_certificate_index(db_task.data)
+
+    def _post(self, url, data):
+        with ForceLogin(self.admin, self.client):
+            return self.client.post(url, data=data, format="json")
+
+    def test_grade_parameters(self):
+        response = self._post('/api/v1/grade-parameters', {
+            "certificate_id": "456", "orientation": "front", "image_type": "laser"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["order_id"], "ORD2")
+        self.assertEqual(response.data["result"]["payload"]["filename"], "ORD2-+456-+front_laser.png")
+        self.assertEqual(response.data["result"]["image_path"],
+            "data/data/{}/raw/ORD2-+456-+front_laser.png".format(self.task.data_id))
+
+    def test_grade_parameters_for_unknown_certificate(self):
+        response = self._post('/api/v1/grade-parameters', {
+            "certificate_id": "999", "orientation": "front"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_grade_parameters_from_file_name(self):
+        response = self._post('/api/v1/grade-parameters-filename', {
+            "filename": "ORD3-+123-+front_laser.png"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result["order_id"] for result in response.data], ["ORD3"])
+
+    def test_check_duplicate_certificates(self):
+        response = self._post('/api/v1/check-duplicate-certificates', {
+            "certificate_ids": "123,456,789,999"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # the image which isn't in the lookup table isn't counted
+        self.assertEqual(response.data["result"], [
+            {"certificate_id": "123", "duplicates": {"front": True}},
+        ])
+
+class GradeParametersBulkTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+        cls.task = _create_task(cls.owner, [
+            "ORD1-+123-+front_laser.png",
+            "ORD1-+123-+back_laser.png",
+            # the side and the type are matched case-insensitively
+            "ORD2-+321-+FRONT_Laser.png",
+        ])
+        update_certificate_index(cls.task.data)
+
+    def _post(self, certificates, **kwargs):
+        with ForceLogin(self.admin, self.client):
+            return self.client.post('/api/v1/grade-parameters-bulk',
+                data=dict(certificates=certificates, **kwargs), format="json")
+
+    def test_results_are_in_request_order(self):
+        response = self._post([
+            {"certificate_id": "123", "orientation": "back"},
+            {"certificate_id": "123", "orientation": "front"},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(item["certificate_id"], item["orientation"], item["order_id"],
+            item["result"]["payload"]["filename"]) for item in response.data["results"]], [
+            ("123", "back", "ORD1", "ORD1-+123-+back_laser.png"),
+            ("123", "front", "ORD1", "ORD1-+123-+front_laser.png"),
+        ])
+
+    def test_errors_are_reported_per_certificate(self):
+        response = self._post([
+            {"certificate_id": "999", "orientation": "front"},
+            {"certificate_id": "123", "orientation": "front"},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["error"], "not_found")
+        self.assertIsNotNone(results[1]["result"])
+        self.assertNotIn("error", results[1])
+
+    def test_upper_case_file_name(self):
+        response = self._post([{"certificate_id": "321", "orientation": "front"}])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        result = response.data["results"][0]["result"]
+        self.assertEqual((result["orientation"], result["image_type"]), ("front", "laser"))
+        self.assertEqual(result["payload"]["filename"], "ORD2-+321-+FRONT_Laser.png")
+
+    def test_task_status_filter(self):
+        response = self._post([{"certificate_id": "123", "orientation": "front"}],
+            task_status="completed")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [{"order_id": "ORD1",
+            "certificate_id": "123", "orientation": "front", "result": None}])
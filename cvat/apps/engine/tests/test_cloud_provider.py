@@ -0,0 +1,368 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from cvat.apps.engine.cloud_provider import (CloudFileReader, CloudObjectCache,
+    Status, _CloudStorage, get_db_storage_instance, invalidate_db_storage_instance)
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from cvat.apps.engine.models import (CloudProviderChoice, CloudStorage,
+    CredentialsTypeChoice, Manifest)
+from utils.dataset_manifest import ImageManifestManager
+
+
+class DirectoryStorage(_CloudStorage):
+    """A stand-in for a cloud storage which keeps objects in a local directory"""
+
+    def __init__(self, root):
+        super().__init__()
+        self._root = root
+        self.downloads = 0
+        self.etag_requests = 0
+        self.ranges = []
+
+    @property
+    def name(self):
+        return os.path.basename(self._root)
+
+    def create(self):
+        os.makedirs(self._root, exist_ok=True)
+
+    def _head(self):
+        return os.stat(self._root)
+
+    def _head_file(self, key):
+        return os.stat(os.path.join(self._root, key))
+
+    def get_status(self):
+        return Status.AVAILABLE if os.path.isdir(self._root) else Status.NOT_FOUND
+
+    def get_file_status(self, key):
+        return Status.AVAILABLE if os.path.isfile(os.path.join(self._root, key)) \
+            else Status.NOT_FOUND
+
+    def get_file_last_modified(self, key):
+        return datetime.fromtimestamp(self._head_file(key).st_mtime, tz=timezone.utc)
+
+    def get_file_etag(self, key):
+        self.etag_requests += 1
+        stat = self._head_file(key)
+        return '{}-{}'.format(stat.st_mtime_ns, stat.st_size)
+
+    def initialize_content(self):
+        self._files = [{'name': name} for name in os.listdir(self._root)]
+
+    def download_fileobj(self, key):
+        self.downloads += 1
+        with open(os.path.join(self._root, key), 'rb') as f:
+            return BytesIO(f.read())
+
+    def get_file_size(self, key):
+        return self._head_file(key).st_size
+
+    def download_range(self, key, start, stop):
+        self.ranges.append((start, stop))
+        with open(os.path.join(self._root, key), 'rb') as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+    def upload_file(self, file_obj, file_name):
+        with open(os.path.join(self._root, file_name), 'wb') as f:
+            f.write(file_obj.read())
+
+
+class CloudObjectCacheTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self.storage = DirectoryStorage(os.path.join(self._tmp_dir, 'bucket'))
+        self.storage.create()
+        self.cache = self._create_cache(etag_ttl=60)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self._tmp_dir)
+
+    def _create_cache(self, etag_ttl):
+        return CloudObjectCache(os.path.join(self._tmp_dir, 'cache'), 2 ** 20, etag_ttl)
+
+    def _upload(self, key, content, mtime):
+        self.storage.upload_file(BytesIO(content), key)
+        os.utime(os.path.join(self._tmp_dir, 'bucket', key), (mtime, mtime))
+
+    def test_repeated_downloads_hit_the_cache(self):
+        self._upload('image.jpg', b'content', 1000)
+
+        for _ in range(3):
+            self.assertEqual(self.cache.download_fileobj(1, self.storage, 'image.jpg').getvalue(),
+                b'content')
+
+        self.assertEqual(self.storage.downloads, 1)
+        # the ETag is trusted for a while, so hits don't request the storage
+        self.assertEqual(self.storage.etag_requests, 1)
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_modified_object_is_downloaded_again(self):
+        self.cache.close()
+        self.cache = self._create_cache(etag_ttl=0)
+        self._upload('image.jpg', b'old content', 1000)
+        self.cache.download_fileobj(1, self.storage, 'image.jpg')
+        self._upload('image.jpg', b'new content', 2000)
+
+        self.assertEqual(self.cache.download_fileobj(1, self.storage, 'image.jpg').getvalue(),
+            b'new content')
+        self.assertEqual(self.storage.downloads, 2)
+
+    def test_modified_object_is_cached_until_etag_expires(self):
+        self._upload('image.jpg', b'old content', 1000)
+        self.cache.download_fileobj(1, self.storage, 'image.jpg')
+        self._upload('image.jpg', b'new content', 2000)
+
+        self.assertEqual(self.cache.download_fileobj(1, self.storage, 'image.jpg').getvalue(),
+            b'old content')
+        self.assertEqual(self.storage.downloads, 1)
+
+    def test_objects_of_storages_are_cached_separately(self):
+        self._upload('image.jpg', b'content', 1000)
+
+        self.cache.download_fileobj(1, self.storage, 'image.jpg')
+        self.cache.download_fileobj(2, self.storage, 'image.jpg')
+
+        self.assertEqual(self.storage.downloads, 2)
+
+    def test_download_file(self):
+        self._upload('image.jpg', b'content', 1000)
+        path = os.path.join(self._tmp_dir, 'downloaded', 'image.jpg')
+
+        self.cache.download_file(1, self.storage, 'image.jpg', path)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'content')
+
+
+class CloudFileReaderTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self.storage = DirectoryStorage(os.path.join(self._tmp_dir, 'bucket'))
+        self.storage.create()
+        self.content = bytes(range(256)) * 40
+        self.storage.upload_file(BytesIO(self.content), 'video.mp4')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def test_read_whole_file(self):
+        reader = CloudFileReader(self.storage, 'video.mp4', block_size=1000, max_blocks=2)
+
+        self.assertEqual(reader.size, len(self.content))
+        self.assertEqual(reader.read(), self.content)
+        self.assertEqual(reader.read(), b'')
+
+    def test_seek_downloads_only_read_blocks(self):
+        reader = CloudFileReader(self.storage, 'video.mp4', block_size=1000, max_blocks=2)
+
+        reader.seek(-100, os.SEEK_END)
+        self.assertEqual(reader.read(50), self.content[-100:-50])
+        reader.seek(2500)
+        self.assertEqual(reader.read(1000), self.content[2500:3500])
+        reader.seek(2600)
+        self.assertEqual(reader.read(100), self.content[2600:2700])
+
+        self.assertEqual(self.storage.ranges, [(10000, 10240), (2000, 3000), (3000, 4000)])
+        self.assertEqual(self.storage.downloads, 0)
+
+
+class DbStorageInstanceTest(TestCase):
+    def setUp(self):
+        self.db_storage = SimpleNamespace(id=-1,
+            provider_type=CloudProviderChoice.AWS_S3, resource='bucket',
+            credentials_type=CredentialsTypeChoice.KEY_SECRET_KEY_PAIR,
+            credentials='key secret', get_specific_attributes=lambda: {})
+        patcher = mock.patch('cvat.apps.engine.cloud_provider.get_cloud_storage_instance',
+            side_effect=lambda **kwargs: mock.Mock())
+        self.get_cloud_storage_instance = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(invalidate_db_storage_instance, self.db_storage.id)
+
+    def test_client_is_reused(self):
+        client = get_db_storage_instance(self.db_storage)
+
+        self.assertIs(get_db_storage_instance(self.db_storage), client)
+        self.assertEqual(self.get_cloud_storage_instance.call_count, 1)
+
+    def test_client_is_recreated_when_credentials_change(self):
+        client = get_db_storage_instance(self.db_storage)
+        self.db_storage.credentials = 'key new_secret'
+
+        self.assertIsNot(get_db_storage_instance(self.db_storage), client)
+        self.assertEqual(self.get_cloud_storage_instance.call_count, 2)
+
+    def test_invalidated_client_is_recreated(self):
+        client = get_db_storage_instance(self.db_storage)
+        invalidate_db_storage_instance(self.db_storage.id)
+
+        self.assertIsNot(get_db_storage_instance(self.db_storage), client)
+
+
+def _make_manifest_content(names):
+    lines = ['{"version":"1.1"}', '{"type":"images"}']
+    lines.extend(json.dumps({"name": os.path.splitext(name)[0],
+        "extension": os.path.splitext(name)[1], "width": 1, "height": 1})
+        for name in names)
+    return '\n'.join(lines + ['']).encode()
+
+
+class ImageManifestNamesTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _create_manifest(self, file_name, names):
+        path = os.path.join(self._tmp_dir, file_name)
+        with open(path, 'wb') as f:
+            f.write(_make_manifest_content(names))
+        manifest = ImageManifestManager(path, self._tmp_dir)
+        manifest.refresh_index()
+        return manifest
+
+    def test_names_in_manifest_order(self):
+        manifest = self._create_manifest('manifest.jsonl', ['b/2.jpg', 'a/1.jpg', 'c.png'])
+
+        count, names = manifest.get_names()
+        self.assertEqual(count, 3)
+        self.assertEqual(list(names), ['b/2.jpg', 'a/1.jpg', 'c.png'])
+
+        count, names = manifest.get_names(start=1, stop=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(list(names), ['a/1.jpg'])
+
+    def test_names_with_prefix_are_sorted(self):
+        manifest = self._create_manifest('manifest.jsonl',
+            ['a/2.jpg', 'b/1.jpg', 'a/10.jpg', 'ab.jpg', 'a/1.jpg'])
+
+        count, names = manifest.get_names('a/')
+        self.assertEqual(count, 3)
+        self.assertEqual(list(names), ['a/1.jpg', 'a/10.jpg', 'a/2.jpg'])
+
+        count, names = manifest.get_names('a', start=1, stop=2)
+        self.assertEqual(count, 4)
+        self.assertEqual(list(names), ['a/10.jpg', 'a/2.jpg'])
+
+        count, names = manifest.get_names('z')
+        self.assertEqual(count, 0)
+        self.assertEqual(list(names), [])
+
+    def test_manifests_in_one_directory_have_own_indices(self):
+        first = self._create_manifest('first.jsonl', ['a{}.jpg'.format(i) for i in range(50)])
+        second = self._create_manifest('second.jsonl', ['z{}.jpg'.format(i) for i in range(5)])
+
+        self.assertEqual(first.get_names()[0], 50)
+        self.assertEqual(second.get_names()[0], 5)
+        count, names = second.get_names('z')
+        self.assertEqual(count, 5)
+        self.assertEqual(list(names), ['z{}.jpg'.format(i) for i in range(5)])
+        self.assertEqual(first.get_names('a4')[0], 10)
+
+    def test_index_is_rebuilt_for_modified_manifest(self):
+        manifest = self._create_manifest('manifest.jsonl', ['a.jpg'])
+        self.assertEqual(list(manifest.get_names('a')[1]), ['a.jpg'])
+
+        with open(manifest.manifest.path, 'wb') as f:
+            f.write(_make_manifest_content(['a.jpg', 'a1.jpg']))
+        os.utime(manifest.manifest.path, (time.time() + 10, time.time() + 10))
+        manifest = ImageManifestManager(manifest.manifest.path, self._tmp_dir)
+        manifest.refresh_index()
+
+        self.assertEqual(len(manifest), 2)
+        self.assertEqual(list(manifest.get_names('a')[1]), ['a.jpg', 'a1.jpg'])
+
+
+class CloudStorageContentAPITestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', email='',
+            password='admin')
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self.storage = DirectoryStorage(os.path.join(self._tmp_dir, 'bucket'))
+        self.storage.create()
+        self.db_storage = CloudStorage.objects.create(
+            provider_type=CloudProviderChoice.AWS_S3, resource='bucket',
+            display_name='bucket', owner=self.admin, credentials='key secret',
+            credentials_type=CredentialsTypeChoice.KEY_SECRET_KEY_PAIR)
+        Manifest.objects.create(cloud_storage=self.db_storage)
+        os.makedirs(self.db_storage.get_storage_dirname())
+        self.addCleanup(shutil.rmtree, self.db_storage.get_storage_dirname())
+
+        patcher = mock.patch('cvat.apps.engine.views.get_db_storage_instance',
+            return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.admin, backend='django.contrib.auth.backends.ModelBackend')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _upload_manifest(self, names, mtime):
+        self.storage.upload_file(BytesIO(_make_manifest_content(names)), 'manifest.jsonl')
+        os.utime(os.path.join(self._tmp_dir, 'bucket', 'manifest.jsonl'), (mtime, mtime))
+
+    def _get_content(self, **params):
+        response = self.client.get('/api/v1/cloudstorages/{}/content'.format(self.db_storage.id),
+            params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_content(self):
+        self._upload_manifest(['b.jpg', 'a/1.jpg', 'a/2.jpg'], 1000)
+
+        self.assertEqual(self._get_content(), ['b.jpg', 'a/1.jpg', 'a/2.jpg'])
+        self.assertEqual(self._get_content(prefix='a/'), ['a/1.jpg', 'a/2.jpg'])
+
+    def test_paginated_content(self):
+        self._upload_manifest(['{}.jpg'.format(i) for i in range(5)], 1000)
+
+        content = self._get_content(page=2, page_size=2)
+        self.assertEqual(content['count'], 5)
+        self.assertEqual(content['results'], ['2.jpg', '3.jpg'])
+        self.assertIn('page=3', content['next'])
+        self.assertIn('page=1', content['previous'])
+
+        content = self._get_content(page=3, page_size=2)
+        self.assertEqual(content['results'], ['4.jpg'])
+        self.assertIsNone(content['next'])
+
+        content = self._get_content(prefix='1', page_size=2)
+        self.assertEqual(content, {'count': 1, 'next': None, 'previous': None,
+            'results': ['1.jpg']})
+
+    def test_invalid_page(self):
+        self._upload_manifest(['a.jpg'], 1000)
+
+        response = self.client.get('/api/v1/cloudstorages/{}/content'.format(self.db_storage.id),
+            {'page': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_updated_manifest_is_downloaded_again(self):
+        self._upload_manifest(['a.jpg'], 1000)
+        self.assertEqual(self._get_content(), ['a.jpg'])
+
+        self._upload_manifest(['a.jpg', 'b.jpg'], time.time() + 100)
+        self.assertEqual(self._get_content(), ['a.jpg', 'b.jpg'])
@@ -0,0 +1,45 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from unittest import TestCase
+
+from cvat.apps.engine.frame_provider import ChunkCache
+
+
+class ChunkCacheTest(TestCase):
+    def _add(self, cache, key, size):
+        return cache.get(key, 0, lambda: (object(), size))
+
+    def _is_cached(self, cache, key):
+        # a missing item is added with no size, so other items aren't evicted
+        misses = cache.get_stats()['misses']
+        self._add(cache, key, 0)
+        return cache.get_stats()['misses'] == misses
+
+    def test_resize_evicts_least_recently_used(self):
+        cache = ChunkCache(capacity=10)
+        self._add(cache, 'a', 3)
+        self._add(cache, 'b', 3)
+        item = self._add(cache, 'c', 3)
+
+        cache.resize(item, 3)
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['items'], stats['size'], stats['evictions']), (2, 9, 1))
+        self.assertEqual([self._is_cached(cache, key) for key in ['a', 'b', 'c']],
+            [False, True, True])
+
+    def test_resize_evicts_oversized_item(self):
+        cache = ChunkCache(capacity=10)
+        self._add(cache, 'a', 3)
+        item = self._add(cache, 'b', 3)
+
+        cache.resize(item, 20)
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['items'], stats['size'], stats['evictions']), (1, 3, 1))
+        self.assertEqual([self._is_cached(cache, key) for key in ['a', 'b']], [True, False])
+
+        # the reader still can be used by the caller
+        self.assertEqual(item.size, 23)
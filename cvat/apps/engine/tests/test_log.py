@@ -0,0 +1,135 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from cvat.apps.engine.log import (ActivityEvent, AnnotationEvent, _write_activities,
+    _write_annotations, log_activity, log_annotation)
+from cvat.apps.engine.models import Activities, ActivityLog, AnnotationLog, Image, Job
+from cvat.apps.engine.tests.test_rest_api import create_db_task, create_db_users
+
+
+def _create_task(owner):
+    db_task = create_db_task({
+        "name": "log task",
+        "owner": owner,
+        "overlap": 0,
+        "segment_size": 2,
+        "image_quality": 75,
+        "size": 4,
+        "labels": [{"name": "car"}, {"name": "person"}],
+    })
+    for frame, path in enumerate(["ord1_cert1_front_laser.png", "ord1_cert1_back_cam.png",
+            "ord2_cert2_front_cam.png", "unrelated.png"]):
+        Image.objects.create(data=db_task.data, path=path, frame=frame, width=10, height=10)
+    return db_task
+
+def _make_activity(user, options, extra=None, time="2022-01-01T00:00:00", label_ids=None):
+    return ActivityEvent(
+        activity_type=Activities.TASK_ANNOTATION_CHANGED,
+        user_id=user.id,
+        options=options,
+        extra=extra or {},
+        time=time,
+        label_ids=label_ids,
+    )
+
+class WriteActivitiesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+        cls.task = _create_task(cls.owner)
+        cls.labels = {db_label.name: db_label.id for db_label in cls.task.label_set.all()}
+
+    def test_activities_with_same_hash_are_written_once(self):
+        _write_activities([
+            _make_activity(self.owner, {"task_id": 1}, time="2022-01-01T00:00:00"),
+            _make_activity(self.owner, {"task_id": 1}, time="2022-01-02T00:00:00"),
+            _make_activity(self.annotator, {"task_id": 1}),
+        ])
+
+        self.assertEqual(ActivityLog.objects.count(), 2)
+        db_activity = ActivityLog.objects.get(user=self.owner)
+        self.assertEqual(db_activity.options["time"], "2022-01-02T00:00:00")
+
+    def test_existing_activity_is_updated(self):
+        _write_activities([_make_activity(self.owner, {"task_id": 1}, extra={"count": 1})])
+        activity_id = ActivityLog.objects.get().id
+
+        _write_activities([_make_activity(self.owner, {"task_id": 1}, extra={"count": 2})])
+
+        db_activity = ActivityLog.objects.get()
+        self.assertEqual(db_activity.id, activity_id)
+        self.assertEqual(db_activity.options["count"], 2)
+
+    def test_label_names_are_added(self):
+        _write_activities([_make_activity(self.owner, {"task_id": 1},
+            label_ids=[self.labels["person"], self.labels["car"], self.labels["car"], -1])])
+
+        db_activity = ActivityLog.objects.get()
+        self.assertEqual(db_activity.options["labels"], ["car", "person"])
+
+class WriteAnnotationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+        cls.task = _create_task(cls.owner)
+        cls.labels = {db_label.name: db_label.id for db_label in cls.task.label_set.all()}
+        cls.jobs = list(Job.objects.filter(segment__task_id=cls.task.id).order_by('id'))
+
+    def test_images_and_labels_are_resolved(self):
+        _write_annotations([
+            AnnotationEvent(user_id=self.owner.id, job_id=self.jobs[0].id, action="create",
+                shapes=[(0, self.labels["car"]), (1, self.labels["person"])]),
+            AnnotationEvent(user_id=self.annotator.id, job_id=self.jobs[1].id, action="update",
+                shapes=[(2, self.labels["car"])]),
+        ])
+
+        self.assertEqual(sorted(AnnotationLog.objects.values_list('order_id', 'certificate_id',
+            'orientation', 'user_id', 'action', 'label_id')), sorted([
+            ("ord1", "cert1", "front", self.owner.id, "create", self.labels["car"]),
+            ("ord1", "cert1", "back", self.owner.id, "create", self.labels["person"]),
+            ("ord2", "cert2", "front", self.annotator.id, "update", self.labels["car"]),
+        ]))
+
+    def test_shapes_without_image_or_label_are_skipped(self):
+        _write_annotations([
+            AnnotationEvent(user_id=self.owner.id, job_id=self.jobs[1].id, action="create",
+                # an image which doesn't match, an unknown label and an absent frame
+                shapes=[(3, self.labels["car"]), (2, -1), (10, self.labels["car"]),
+                    (2, self.labels["person"])]),
+        ])
+
+        self.assertEqual(list(AnnotationLog.objects.values_list('order_id', 'label_id')),
+            [("ord2", self.labels["person"])])
+
+# Events are queued when the transaction is committed, so the tests commit it
+class LogOnCommitTest(TransactionTestCase):
+    def setUp(self):
+        create_db_users(self)
+        self.task = _create_task(self.owner)
+        self.label_id = self.task.label_set.get(name="car").id
+        self.job = Job.objects.filter(segment__task_id=self.task.id).order_by('id').first()
+
+    def test_events_are_written_after_commit(self):
+        log_activity(Activities.TASK_UPDATED, self.owner, {"task_id": self.task.id})
+        log_annotation(self.owner, self.job.id, "create",
+            [{"frame": 0, "label_id": self.label_id}])
+
+        self.assertEqual(ActivityLog.objects.count(), 1)
+        self.assertEqual(AnnotationLog.objects.count(), 1)
+
+    def test_events_of_rolled_back_transaction_are_dropped(self):
+        class Rollback(Exception):
+            pass
+
+        try:
+            with transaction.atomic():
+                log_activity(Activities.TASK_UPDATED, self.owner, {"task_id": self.task.id})
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.assertEqual(ActivityLog.objects.count(), 0)
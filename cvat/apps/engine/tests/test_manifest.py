@@ -0,0 +1,242 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from PIL import Image
+
+from utils.dataset_manifest import ImageManifestManager
+
+
+def _make_images(names):
+    return [{'name': name, 'extension': '.jpg', 'width': 10, 'height': 20}
+        for name in names]
+
+class _ManifestTestCase(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _create_manifest(self, images, file_name='manifest.jsonl'):
+        manifest = ImageManifestManager(os.path.join(self._tmp_dir, file_name))
+        manifest.create(content=images)
+        return manifest
+
+class GetNamesTest(_ManifestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manifest = self._create_manifest(_make_images(
+            ['dir/b', 'a', 'dir/a', 'dir2/c', 'c']))
+
+    def tearDown(self):
+        self.manifest.close()
+        super().tearDown()
+
+    def test_pages_are_in_manifest_order(self):
+        for start, stop, expected in [
+            (0, None, ['dir/b.jpg', 'a.jpg', 'dir/a.jpg', 'dir2/c.jpg', 'c.jpg']),
+            (1, 3, ['a.jpg', 'dir/a.jpg']),
+            (3, 10, ['dir2/c.jpg', 'c.jpg']),
+            (5, 10, []),
+        ]:
+            with self.subTest(start=start, stop=stop):
+                count, names = self.manifest.get_names(start=start, stop=stop)
+
+                self.assertEqual(count, 5)
+                self.assertEqual(list(names), expected)
+
+    def test_names_with_prefix_are_sorted(self):
+        count, names = self.manifest.get_names(prefix='dir/')
+
+        self.assertEqual(count, 2)
+        self.assertEqual(list(names), ['dir/a.jpg', 'dir/b.jpg'])
+
+    def test_pages_of_names_with_prefix(self):
+        count, names = self.manifest.get_names(prefix='dir', start=1, stop=2)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(list(names), ['dir/b.jpg'])
+
+    def test_unknown_prefix(self):
+        count, names = self.manifest.get_names(prefix='x')
+
+        self.assertEqual(count, 0)
+        self.assertEqual(list(names), [])
+
+    def test_name_index_is_rebuilt_for_modified_manifest(self):
+        self.manifest.get_names(prefix='dir/')
+        self.manifest.close()
+        manifest = self._create_manifest(_make_images(['dir/c']))
+        # the modification time may have a coarse resolution
+        index_path = os.path.join(self._tmp_dir, 'name_index.bin')
+        os.utime(index_path, (0, 0))
+
+        count, names = manifest.get_names(prefix='dir/')
+
+        self.assertEqual((count, list(names)), (1, ['dir/c.jpg']))
+        manifest.close()
+
+    def test_empty_manifest(self):
+        # an empty list would be taken as no content
+        manifest = self._create_manifest(iter(()), file_name='empty.jsonl')
+
+        for prefix, stop in [(None, None), (None, 10), ('dir', None)]:
+            with self.subTest(prefix=prefix, stop=stop):
+                count, names = manifest.get_names(prefix=prefix, stop=stop)
+
+                self.assertEqual(count, 0)
+                self.assertEqual(list(names), [])
+        manifest.close()
+
+class IndexTest(_ManifestTestCase):
+    @staticmethod
+    def _read_index(manifest):
+        return [manifest.index[number] for number in range(len(manifest.index))]
+
+    def _get_offsets(self, manifest_path):
+        offsets = []
+        with open(manifest_path, 'rb') as manifest_file:
+            for number, line in enumerate(iter(manifest_file.readline, b'')):
+                if number >= 2:
+                    offsets.append(manifest_file.tell() - len(line))
+        return offsets
+
+    def test_index_keeps_line_offsets(self):
+        manifest = self._create_manifest(_make_images(['a', 'b', 'c']))
+        manifest.close()
+
+        manifest = ImageManifestManager(manifest.manifest.path, create_index=False)
+        manifest.init_index()
+
+        self.assertEqual(manifest.index.path, os.path.join(self._tmp_dir, 'index.bin'))
+        self.assertEqual(self._read_index(manifest), self._get_offsets(manifest.manifest.path))
+        self.assertEqual([manifest[number]['name'] for number in range(len(manifest))],
+            ['a', 'b', 'c'])
+        manifest.close()
+
+    def test_legacy_index_is_migrated(self):
+        names = ['image_{:02d}'.format(number) for number in range(12)]
+        manifest = self._create_manifest(_make_images(names))
+        manifest.close()
+        offsets = self._get_offsets(manifest.manifest.path)
+        os.remove(os.path.join(self._tmp_dir, 'index.bin'))
+        legacy_path = os.path.join(self._tmp_dir, 'index.json')
+        with open(legacy_path, 'w') as index_file:
+            # the keys of the JSON index are strings, so they must be sorted as numbers
+            json.dump({str(number): offset for number, offset in enumerate(offsets)},
+                index_file, sort_keys=True)
+
+        manifest = ImageManifestManager(manifest.manifest.path, create_index=False)
+        manifest.init_index()
+
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertTrue(os.path.exists(os.path.join(self._tmp_dir, 'index.bin')))
+        self.assertEqual(self._read_index(manifest), offsets)
+        self.assertEqual([manifest[number]['name'] for number in range(len(manifest))], names)
+        manifest.close()
+
+    def test_manifests_of_a_directory_have_own_indices(self):
+        default_manifest = self._create_manifest(_make_images(['a', 'b']))
+        other_manifest = self._create_manifest(_make_images(['c']), file_name='other.jsonl')
+
+        self.assertEqual(other_manifest.index.path,
+            os.path.join(self._tmp_dir, 'other.jsonl.index.bin'))
+        self.assertEqual([len(default_manifest), len(other_manifest)], [2, 1])
+        self.assertEqual(default_manifest[1]['name'], 'b')
+        self.assertEqual(other_manifest[0]['name'], 'c')
+        default_manifest.close()
+        other_manifest.close()
+
+    def test_empty_index(self):
+        manifest = self._create_manifest(iter(()))
+
+        self.assertEqual(len(manifest), 0)
+        manifest.close()
+
+class GetRangeTest(_ManifestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manifest = self._create_manifest(_make_images(
+            ['image_{}'.format(number) for number in range(10)]))
+
+    def tearDown(self):
+        self.manifest.close()
+        super().tearDown()
+
+    def test_range_is_equal_to_separate_lines(self):
+        for start, stop, step in [(0, 10, 1), (2, 5, 1), (1, 9, 3), (9, 10, 1), (5, 20, 2)]:
+            with self.subTest(start=start, stop=stop, step=step):
+                self.assertEqual(self.manifest.get_range(start, stop, step),
+                    [self.manifest[number] for number in range(start, min(stop, 10), step)])
+
+    def test_empty_range(self):
+        self.assertEqual(self.manifest.get_range(5, 5), [])
+        self.assertEqual(self.manifest.get_range(10, 12), [])
+
+class RefreshIndexTest(_ManifestTestCase):
+    def _set_mtime(self, path, mtime):
+        os.utime(path, (mtime, mtime))
+
+    def test_actual_index_is_loaded(self):
+        manifest = self._create_manifest(_make_images(['a', 'b']))
+        self._set_mtime(manifest.manifest.path, 1000)
+        self._set_mtime(manifest.index.path, 2000)
+        index_inode = os.stat(manifest.index.path).st_ino
+
+        manifest.refresh_index()
+
+        self.assertEqual(os.stat(manifest.index.path).st_ino, index_inode)
+        self.assertEqual(len(manifest), 2)
+        manifest.close()
+
+    def test_index_of_modified_manifest_is_rebuilt(self):
+        manifest = self._create_manifest(_make_images(['a', 'b']))
+        manifest.close()
+        reader = ImageManifestManager(manifest.manifest.path, create_index=False)
+        reader.init_index()
+        # the manifest is written again by another manager without the index
+        writer = ImageManifestManager(manifest.manifest.path, create_index=False)
+        writer.create(content=_make_images(['c', 'd', 'e']))
+        self._set_mtime(reader.index.path, 1000)
+        self._set_mtime(reader.manifest.path, 2000)
+
+        reader.refresh_index()
+
+        self.assertEqual([reader[number]['name'] for number in range(len(reader))],
+            ['c', 'd', 'e'])
+        reader.close()
+
+class ImageReaderWorkersTest(_ManifestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sources = []
+        for number in range(12):
+            path = os.path.join(self._tmp_dir, 'images', 'image_{:02d}.png'.format(number))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            Image.new('RGB', (10 + number, 20), (number * 20, 0, 0)).save(path)
+            self.sources.append(path)
+
+    def _create(self, workers, use_image_hash):
+        manifest = ImageManifestManager(os.path.join(self._tmp_dir,
+            'manifest_{}_{}.jsonl'.format(workers, use_image_hash)))
+        manifest.link(sources=self.sources, use_image_hash=use_image_hash,
+            data_dir=os.path.join(self._tmp_dir, 'images'))
+        manifest.create(workers=workers)
+        manifest.close()
+        with open(manifest.manifest.path) as manifest_file:
+            return manifest_file.read()
+
+    def test_workers_produce_identical_manifests(self):
+        for use_image_hash in [False, True]:
+            with self.subTest(use_image_hash=use_image_hash):
+                expected = self._create(1, use_image_hash)
+
+                self.assertEqual(self._create(3, use_image_hash), expected)
+                self.assertEqual(len(expected.splitlines()), 2 + len(self.sources))
@@ -0,0 +1,108 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import av
+import numpy as np
+
+from cvat.apps.engine.media_extractors import SeekableVideoReader
+
+
+def _write_video(path, frame_count, gop_size):
+    with av.open(path, 'w') as container:
+        stream = container.add_stream('mpeg4', rate=25)
+        stream.width, stream.height = 64, 48
+        stream.pix_fmt = 'yuv420p'
+        stream.codec_context.gop_size = gop_size
+        for number in range(frame_count):
+            image = np.full((48, 64, 3), number * 10, dtype=np.uint8)
+            image[number % 48, :, :] = 255
+            frame = av.VideoFrame.from_ndarray(image, format='rgb24')
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+def _decode_sequentially(path):
+    with av.open(path) as container:
+        return [frame.to_ndarray(format='rgb24')
+            for frame in container.decode(container.streams.video[0])]
+
+class _SeekToStartOnly:
+    """Wraps a container and ignores seeks to other frames than the first one,
+    like it happens for videos with broken timestamps"""
+
+    def __init__(self, container):
+        self._container = container
+
+    def seek(self, offset, *args, **kwargs):
+        if not offset:
+            self._container.seek(offset, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._container, name)
+
+class SeekableVideoReaderTest(TestCase):
+    FRAME_COUNT = 23
+    GOP_SIZE = 5
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._tmp_dir, 'video.mp4')
+        _write_video(self.path, self.FRAME_COUNT, self.GOP_SIZE)
+        self.expected = _decode_sequentially(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _read(self, reader, numbers):
+        for number in numbers:
+            frame, _, _ = reader[number]
+            yield number, frame.to_ndarray(format='rgb24')
+
+    def _check_frames(self, reader, numbers):
+        for number, image in self._read(reader, numbers):
+            with self.subTest(frame=number):
+                np.testing.assert_array_equal(image, self.expected[number])
+
+    def test_frames_are_equal_to_sequential_decoding(self):
+        reader = SeekableVideoReader(self.path)
+
+        self.assertEqual(len(reader), self.FRAME_COUNT)
+        self._check_frames(reader, range(self.FRAME_COUNT))
+
+    def test_frames_after_seek(self):
+        reader = SeekableVideoReader(self.path)
+
+        # forward and backward, inside and across GOPs
+        self._check_frames(reader, [17, 3, 4, 12, 0, 22, 8, 7, 21, 10])
+
+    def test_number_of_decoded_frames_is_bounded(self):
+        reader = SeekableVideoReader(self.path)
+        frame, _, _ = reader[0]
+        frame_nbytes = sum(plane.buffer_size for plane in frame.planes)
+
+        for number in range(self.FRAME_COUNT):
+            reader[number]
+            self.assertLessEqual(reader.decoded_nbytes,
+                SeekableVideoReader.MAX_DECODED_FRAMES * frame_nbytes)
+
+    def test_frames_are_decoded_from_start_if_seek_fails(self):
+        open_container = av.open
+        with mock.patch.object(av, 'open',
+                lambda *args, **kwargs: _SeekToStartOnly(open_container(*args, **kwargs))):
+            reader = SeekableVideoReader(self.path)
+
+            self._check_frames(reader, [17, 3, 12, 22])
+
+    def test_reader_from_bytes(self):
+        with open(self.path, 'rb') as video_file:
+            reader = SeekableVideoReader(io.BytesIO(video_file.read()))
+
+        self._check_frames(reader, [12, 2])
@@ -0,0 +1,131 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from unittest import TestCase as UnitTestCase
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from cvat.apps.engine.models import (Job, LabeledShape, LabeledTrack,
+    PackedFloatArrayField, TrackedShape)
+from cvat.apps.engine.tests.test_rest_api import create_db_task, create_db_users
+
+
+POINTS = [0.1, -2.25, 1e-300, 1.7976931348623157e308, 12345678.123456789]
+
+def _create_task(owner):
+    return create_db_task({
+        "name": "points task",
+        "owner": owner,
+        "overlap": 0,
+        "segment_size": 10,
+        "image_quality": 75,
+        "size": 10,
+        "labels": [{"name": "car"}],
+    })
+
+def _create_shapes(db_task, points):
+    db_job = Job.objects.get(segment__task_id=db_task.id)
+    db_label = db_task.label_set.get()
+    db_shapes = [LabeledShape.objects.create(job=db_job, label=db_label, frame=frame,
+        type="polygon", points=shape_points) for frame, shape_points in enumerate(points)]
+    db_track = LabeledTrack.objects.create(job=db_job, label=db_label, frame=0)
+    db_tracked_shapes = [TrackedShape.objects.create(track=db_track, frame=frame,
+        type="polygon", points=shape_points) for frame, shape_points in enumerate(points)]
+    return db_shapes, db_tracked_shapes
+
+class PackedFloatArrayFieldTest(UnitTestCase):
+    def setUp(self):
+        self.field = PackedFloatArrayField()
+
+    def _round_trip(self, value):
+        return self.field.from_db_value(self.field.get_prep_value(value), None, None)
+
+    def test_values_are_kept_exactly(self):
+        self.assertEqual(self._round_trip(POINTS), POINTS)
+
+    def test_empty_list(self):
+        self.assertEqual(self.field.get_prep_value([]), b'')
+        self.assertEqual(self._round_trip([]), [])
+
+    def test_null(self):
+        self.assertIsNone(self.field.get_prep_value(None))
+        self.assertIsNone(self.field.from_db_value(None, None, None))
+        self.assertIsNone(self.field.to_python(None))
+
+    def test_database_buffer(self):
+        # PostgreSQL returns memoryview objects for binary columns
+        value = memoryview(self.field.get_prep_value(POINTS))
+
+        self.assertIs(self.field.get_prep_value(value), value)
+        self.assertEqual(self.field.from_db_value(value, None, None), POINTS)
+
+    def test_serialization(self):
+        field = LabeledShape._meta.get_field('points')
+        for points in [POINTS, []]:
+            with self.subTest(points=points):
+                value = field.value_to_string(LabeledShape(points=points))
+
+                self.assertIsInstance(value, str)
+                self.assertEqual(field.to_python(value), points)
+
+class PackedPointsStorageTest(TestCase):
+    def setUp(self):
+        create_db_users(self)
+        self.task = _create_task(self.owner)
+
+    def test_points_are_read_back(self):
+        points = [POINTS, [], [1.0, 2.0]]
+        db_shapes, db_tracked_shapes = _create_shapes(self.task, points)
+
+        for model, db_objects in [
+            (LabeledShape, db_shapes), (TrackedShape, db_tracked_shapes)
+        ]:
+            with self.subTest(model=model.__name__):
+                self.assertEqual([model.objects.get(id=db_object.id).points
+                    for db_object in db_objects], points)
+                self.assertEqual(list(model.objects.filter(id__in=[o.id for o in db_objects])
+                    .order_by('frame').values_list('points', flat=True)), points)
+
+# Migrations change the schema, which can't be done inside of a test transaction
+class PackedPointsMigrationTest(TransactionTestCase):
+    text_points_migration = ('engine', '0051_certificateimage')
+    packed_points_migration = ('engine', '0053_remove_text_shape_points')
+
+    def setUp(self):
+        create_db_users(self)
+        self.task = _create_task(self.owner)
+
+    def tearDown(self):
+        self._migrate(self.packed_points_migration)
+
+    @staticmethod
+    def _migrate(target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def test_points_are_converted_in_both_directions(self):
+        points = [POINTS, [], [1.0, 2.0]]
+        db_shapes, db_tracked_shapes = _create_shapes(self.task, points)
+
+        old_apps = self._migrate(self.text_points_migration)
+        for model_name, db_objects in [
+            ('labeledshape', db_shapes), ('trackedshape', db_tracked_shapes)
+        ]:
+            old_model = old_apps.get_model('engine', model_name)
+            with self.subTest(model=model_name):
+                text_points = [old_model.objects.get(id=db_object.id).points
+                    for db_object in db_objects]
+                # The text field reads an empty value as is
+                self.assertEqual(text_points, [POINTS, '', [1.0, 2.0]])
+        old_apps.get_model('engine', 'labeledshape').objects \
+            .filter(id=db_shapes[-1].id).update(points=[0.5, 1e-05, -3.0])
+
+        self._migrate(self.packed_points_migration)
+        self.assertEqual([LabeledShape.objects.get(id=db_shape.id).points
+            for db_shape in db_shapes], [POINTS, [], [0.5, 1e-05, -3.0]])
+        self.assertEqual([TrackedShape.objects.get(id=db_shape.id).points
+            for db_shape in db_tracked_shapes], points)
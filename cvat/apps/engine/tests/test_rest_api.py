@@ -4091,6 +4091,87 @@ class JobAnnotationAPITestCase(APITestCase):
     def test_api_v1_jobs_id_annotations_no_auth(self):
         self._run_api_v1_jobs_id_annotations(self.user, self.assignee, None)
 
+    def test_api_v1_jobs_id_annotations_update_keeps_ids(self):
+        task, jobs = self._create_task(self.user, self.assignee)
+        job = jobs[0]
+        label = task["labels"][0]
+        data = {
+            "version": 0,
+            "tags": [],
+            "shapes": [
+                {
+                    "frame": 0,
+                    "label_id": label["id"],
+                    "group": None,
+                    "source": "manual",
+                    "attributes": [
+                        {
+                            "spec_id": label["attributes"][0]["id"],
+                            "value": label["attributes"][0]["values"][0]
+                        },
+                    ],
+                    "points": [1.0, 2.1, 100, 300.222],
+                    "type": "rectangle",
+                    "occluded": False,
+                },
+            ],
+            "tracks": [
+                {
+                    "frame": 0,
+                    "label_id": label["id"],
+                    "group": None,
+                    "source": "manual",
+                    "attributes": [],
+                    "shapes": [
+                        {
+                            "frame": 0,
+                            "attributes": [],
+                            "points": [1.0, 2.1, 100, 300.222],
+                            "type": "rectangle",
+                            "occluded": False,
+                            "outside": False
+                        },
+                        {
+                            "frame": 2,
+                            "attributes": [],
+                            "points": [2.0, 4.1, 120, 400.0],
+                            "type": "rectangle",
+                            "occluded": True,
+                            "outside": True
+                        },
+                    ]
+                },
+            ]
+        }
+        response = self._patch_api_v1_jobs_id_data(job["id"], self.assignee,
+            "create", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.data
+        shape_id = data["shapes"][0]["id"]
+        track_id = data["tracks"][0]["id"]
+        tracked_shape_id = data["tracks"][0]["shapes"][0]["id"]
+        data["shapes"][0]["points"] = [5.0, 6.0, 105.0, 306.0]
+        data["shapes"][0]["attributes"][0]["value"] = label["attributes"][0]["values"][1]
+        data["tracks"][0]["shapes"][0]["occluded"] = True
+        del data["tracks"][0]["shapes"][1]
+        response = self._patch_api_v1_jobs_id_data(job["id"], self.assignee,
+            "update", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self._get_api_v1_jobs_id_data(job["id"], self.assignee)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["shapes"][0]["id"], shape_id)
+        self.assertEqual(response.data["shapes"][0]["points"], [5.0, 6.0, 105.0, 306.0])
+        self.assertIn({
+            "spec_id": label["attributes"][0]["id"],
+            "value": label["attributes"][0]["values"][1]
+        }, response.data["shapes"][0]["attributes"])
+        self.assertEqual(response.data["tracks"][0]["id"], track_id)
+        self.assertEqual(len(response.data["tracks"][0]["shapes"]), 1)
+        self.assertEqual(response.data["tracks"][0]["shapes"][0]["id"], tracked_shape_id)
+        self.assertTrue(response.data["tracks"][0]["shapes"][0]["occluded"])
+
 class TaskAnnotationAPITestCase(JobAnnotationAPITestCase):
     def _put_api_v1_tasks_id_annotations(self, pk, user, data):
         with ForceLogin(user, self.client):
@@ -0,0 +1,47 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import time
+from types import SimpleNamespace
+from unittest import TestCase
+
+from cvat.apps.engine.task import _save_chunks
+
+
+class _SlowChunkWriter:
+    """Makes early chunks finish last, so the output order can't be the order of completion"""
+
+    def save_as_chunk(self, images, chunk_path):
+        time.sleep(0.05 / (1 + images[0]))
+        return [(os.getpid(), image) for image in images]
+
+class SaveChunksTest(TestCase):
+    def setUp(self):
+        self.db_data = SimpleNamespace(
+            get_original_chunk_path=lambda chunk_idx: 'original/{}'.format(chunk_idx),
+            get_compressed_chunk_path=lambda chunk_idx: 'compressed/{}'.format(chunk_idx),
+        )
+        self.chunks = [(chunk_idx, [chunk_idx * 3, chunk_idx * 3 + 1, chunk_idx * 3 + 2])
+            for chunk_idx in range(10)]
+
+    def _save(self, workers):
+        writer = _SlowChunkWriter()
+        return list(_save_chunks(iter(self.chunks), self.db_data, writer, writer, workers))
+
+    def test_chunks_are_yielded_in_order(self):
+        for workers in [1, 3]:
+            with self.subTest(workers=workers):
+                saved = self._save(workers)
+
+                self.assertEqual([(chunk_idx, chunk_data) for chunk_idx, chunk_data, _ in saved],
+                    self.chunks)
+                self.assertEqual([[image for _, image in sizes] for _, _, sizes in saved],
+                    [chunk_data for _, chunk_data in self.chunks])
+
+    def test_chunks_are_encoded_by_other_processes(self):
+        saved = self._save(workers=3)
+
+        pids = set(pid for _, _, sizes in saved for pid, _ in sizes)
+        self.assertNotIn(os.getpid(), pids)
@@ -76,6 +76,7 @@ urlpatterns = [
     path('api/v1/', include((router.urls, 'cvat'), namespace='v1')),
     path('api/v1/cvat-grades', views.post_grades),
     path('api/v1/grade-parameters', views.GradeParametersFromCertificateView.as_view(), name="cron-helper"),
+    path('api/v1/grade-parameters-bulk', views.GradeParametersBulkView.as_view(), name="grade-parameters-bulk"),
     path('api/v1/grade-parameters-filename', views.GradeParametersFromFileNameView.as_view(), name="grade-parameters-filename"),
     path('api/v1/check-duplicate-certificates', views.CheckDuplicateCertificatesView.as_view(), name="check-duplicate-certificates"),
     path('api/v1/grade-parameters-task-name', views.GradeParametersFromTaskNameView.as_view(), name="grade-parameters-task-name"),
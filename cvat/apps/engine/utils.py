@@ -3,7 +3,7 @@
 # SPDX-License-Identifier: MIT
 
 import ast
-from datetime import datetime
+from io import BytesIO
 
 import cv2 as cv
 from collections import namedtuple
@@ -108,35 +108,11 @@ def rotate_image(image, angle):
 def md5_hash(frame):
     if isinstance(frame, VideoFrame):
         frame = frame.to_image()
-    elif isinstance(frame, str):
+    elif isinstance(frame, (str, BytesIO)):
         frame = Image.open(frame, 'r')
     return hashlib.md5(frame.tobytes()).hexdigest() # nosec
 
 
-def log_activity(activity_type, user, options=None, extra=None):
-    if options is None:
-        options = {}
-    if extra is None:
-        extra = {}
-
-    hash_content = hashlib.sha1("{}:{}:{}".format(activity_type, user.id, options).encode('utf-8')).hexdigest()
-    options['time'] = datetime.now().isoformat()
-    options = {**options, **extra}
-
-    defaults = {
-        'activity_type': activity_type,
-        'user': user,
-        'options': options,
-        'hash': hash_content,
-    }
-
-    models.ActivityLog.objects.update_or_create(
-        activity_type=activity_type,
-        user=user,
-        hash=hash_content,
-        defaults=defaults,
-    )
-
 def parse_specific_attributes(specific_attributes):
     assert isinstance(specific_attributes, str), 'Specific attributes must be a string'
     return {
@@ -144,26 +120,45 @@ def parse_specific_attributes(specific_attributes):
             for item in specific_attributes.split('&')
     } if specific_attributes else dict()
 
-def log_annotation(user, job_id, action, shapes):
-    try:
-        segment = models.Segment.objects.select_related('task').get(id=job_id)
-        data_id = segment.task.data_id
-
-        for shape in shapes:
-            image = models.Image.objects.get(data_id=data_id, frame=shape.get('frame'))
-            regex_match = re.match(r"^([^_+-]*)[_+-]*([^_+-]*)[_+-]*(front|back)[_-](laser|cam)\.(.*)$", image.path)
-            order_id = regex_match[1]
-            certificate_id = regex_match[2]
-            orientation = regex_match[3]
-            label = models.Label.objects.get(id=shape.get('label_id'))
-
-            models.AnnotationLog.objects.create(
-                order_id=order_id,
-                certificate_id=certificate_id,
-                orientation=orientation,
-                user=user,
-                action=action,
-                label=label
-            )
-    except Exception as err:
-        raise err
\ No newline at end of file
+
+CERTIFICATE_IMAGE_REGEX = re.compile(
+    r"^(?P<order_id>.*?)-\+(?P<certificate_id>[^_+]+?)(?:-\+|_)"
+    r"(?P<orientation>front|back)[_-](?P<image_type>laser|cam)\.[^.]*$",
+    re.IGNORECASE)
+
+def parse_certificate_image_path(path):
+    match = CERTIFICATE_IMAGE_REGEX.match(path)
+    if not match:
+        return None
+
+    return {
+        'order_id': match['order_id'],
+        'certificate_id': match['certificate_id'],
+        'orientation': match['orientation'].lower(),
+        'image_type': match['image_type'].lower(),
+    }
+
+def update_certificate_index(db_data):
+    db_segments = models.Segment.objects.filter(task__data_id=db_data.id) \
+        .prefetch_related('job_set').order_by('start_frame')
+    segments = [
+        (db_segment.start_frame, db_segment.stop_frame, db_job.id)
+        for db_segment in db_segments for db_job in db_segment.job_set.all()
+    ]
+
+    def find_job(frame):
+        return next((job_id for start, stop, job_id in segments if start <= frame <= stop), None)
+
+    db_certificate_images = []
+    for image_id, path, frame in models.Image.objects.filter(data_id=db_data.id) \
+            .values_list('id', 'path', 'frame').iterator():
+        fields = parse_certificate_image_path(path)
+        if fields is None:
+            continue
+        db_certificate_images.append(models.CertificateImage(
+            image_id=image_id, data_id=db_data.id, job_id=find_job(frame), frame=frame, **fields))
+
+    models.CertificateImage.objects.filter(data_id=db_data.id).delete()
+    models.CertificateImage.objects.bulk_create(db_certificate_images, batch_size=1000)
+
+    return len(db_certificate_images)
@@ -5,6 +5,8 @@ import errno
 import hashlib
 import hmac
 import io
+import itertools
+import json
 import os
 import os.path as osp
 import shutil
@@ -22,9 +24,10 @@ from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import IntegrityError
-from django.db.models import Q
+from django.db.models import Count
 from django.db.models.query import Prefetch
-from django.http import HttpResponse, HttpResponseNotFound, HttpResponseBadRequest
+from django.http import (HttpResponse, HttpResponseNotFound, HttpResponseBadRequest,
+    StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -40,6 +43,7 @@ from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from sendfile import sendfile
 
 import cvat.apps.dataset_manager as dm
@@ -48,15 +52,18 @@ from cvat.apps.authentication import auth
 from cvat.apps.dataset_manager.bindings import CvatImportError
 from cvat.apps.dataset_manager.serializers import DatasetFormatsSerializer
 from cvat.apps.engine.backup import import_task
-from cvat.apps.engine.cloud_provider import get_cloud_storage_instance, Credentials, Status
+from cvat.apps.engine.cache import enqueue_chunk_prefetch
+from cvat.apps.engine.cloud_provider import (get_cloud_object_cache,
+    get_db_storage_instance, Status)
 from cvat.apps.engine.frame_provider import FrameProvider
 from cvat.apps.engine.media_extractors import ImageListReader
 from cvat.apps.engine.mime_types import mimetypes
 from cvat.apps.engine.models import CloudStorage as CloudStorageModel
+from cvat.apps.engine.pagination import CustomPagination
 from cvat.apps.engine.models import (
     Job, StatusChoice, Task, Project, Review, Issue,
     Comment, StorageMethodChoice, ReviewStatus, StorageChoice, Image,
-    CredentialsTypeChoice, CloudProviderChoice, Activities, LabeledShape, Label
+    CredentialsTypeChoice, CloudProviderChoice, Activities, LabeledShape, Label, CertificateImage
 )
 from cvat.apps.engine.serializers import (
     AboutSerializer, AnnotationFileSerializer, BasicUserSerializer,
@@ -65,11 +72,12 @@ from cvat.apps.engine.serializers import (
     LogEventSerializer, ProjectSerializer, ProjectSearchSerializer,
     RqStatusSerializer, TaskSerializer, UserSerializer, PluginsSerializer, ReviewSerializer,
     CombinedReviewSerializer, IssueSerializer, CombinedIssueSerializer, CommentSerializer,
-    CloudStorageSerializer, BaseCloudStorageSerializer, TaskFileSerializer, ActivitySerializer, GradeParametersSerializer, GradeParametersFromFileNameSerializer, CheckDuplicateCertificatesSerializer, GradeParametersFromTaskNameSerializer)
-from cvat.apps.engine.utils import av_scan_paths, log_activity, log_annotation
+    CloudStorageSerializer, BaseCloudStorageSerializer, TaskFileSerializer, ActivitySerializer, GradeParametersSerializer, GradeParametersBulkSerializer, GradeParametersFromFileNameSerializer, CheckDuplicateCertificatesSerializer, GradeParametersFromTaskNameSerializer)
+from cvat.apps.engine.choices import CARD_ORIENTATION_BACK, CARD_ORIENTATION_FRONT
+from cvat.apps.engine.utils import av_scan_paths, parse_certificate_image_path
 from utils.dataset_manifest import ImageManifestManager
 from . import models, task
-from .log import clogger, slogger
+from .log import clogger, log_activity, log_annotation, slogger
 
 
 class ServerViewSet(viewsets.ViewSet):
@@ -694,6 +702,10 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
                     # TODO: av.FFmpegError processing
                     if settings.USE_CACHE and db_data.storage_method == StorageMethodChoice.CACHE:
                         buff, mime_type = frame_provider.get_chunk(data_id, data_quality)
+                        try:
+                            enqueue_chunk_prefetch(db_data, data_id, data_quality, db_task.dimension)
+                        except Exception as ex:
+                            slogger.task[pk].warning('Failed to schedule chunk prefetch: {}'.format(ex))
                         return HttpResponse(buff.getvalue(), content_type=mime_type)
 
                     # Follow symbol links if the chunk is a link on a real image otherwise
@@ -829,8 +841,7 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
                     'shapes_no': len(request.data['shapes']),
                     'tags_no': len(request.data['tags']),
                     'tracks_no': len(request.data['tracks']),
-                    'labels': list(models.Label.objects.filter(id__in=list(set([shape.get('label_id') for shape in request.data['shapes']]))).values_list("name", flat=True)),
-                })
+                }, label_ids=[shape.get('label_id') for shape in request.data['shapes']])
                 try:
                     log_annotation(user=self.request.user, job_id=pk, action=action, shapes=request.data['shapes'])
                 except Exception as err:
@@ -1006,8 +1017,7 @@ class JobViewSet(viewsets.GenericViewSet,
                     'shapes_no': len(request.data['shapes']),
                     'tags_no': len(request.data['tags']),
                     'tracks_no': len(request.data['tracks']),
-                    'labels': list(models.Label.objects.filter(id__in=list(set([shape.get('label_id') for shape in request.data['shapes']]))).values_list("name", flat=True)),
-                })
+                }, label_ids=[shape.get('label_id') for shape in request.data['shapes']])
                 try:
                     log_annotation(user=self.request.user, job_id=pk, action=action, shapes=request.data['shapes'])
                 except Exception as err:
@@ -1262,6 +1272,17 @@ class CloudStorageFilter(filters.FilterSet):
         model = models.CloudStorage
         fields = ('id', 'display_name', 'provider_type', 'resource', 'credentials_type', 'description', 'owner')
 
+def _stream_json_list(items, head='[', tail=']'):
+    """Yields a JSON list of the items in parts, so a long list is neither
+    kept in memory nor sent at once"""
+    yield head
+    items = iter(items)
+    separator = ''
+    for batch in iter(lambda: list(itertools.islice(items, 1000)), []):
+        yield separator + ', '.join(json.dumps(item) for item in batch)
+        separator = ', '
+    yield tail
+
 
 @method_decorator(
     name='retrieve',
@@ -1373,10 +1394,19 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
         manual_parameters=[
             openapi.Parameter('manifest_path', openapi.IN_QUERY,
                               description="Path to the manifest file in a cloud storage",
-                              type=openapi.TYPE_STRING)
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('prefix', openapi.IN_QUERY,
+                              description="Return only files which names start with the prefix, sorted by name",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY,
+                              description="A page number within the paginated result set",
+                              type=openapi.TYPE_INTEGER),
+            openapi.Parameter('page_size', openapi.IN_QUERY,
+                              description="Number of results to return per page",
+                              type=openapi.TYPE_INTEGER),
         ],
         responses={
-            '200': openapi.Response(description='A manifest content'),
+            '200': openapi.Response(description='A manifest content. It is paginated if page or page_size is specified'),
         },
         tags=['cloud storages']
     )
@@ -1385,17 +1415,7 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
         storage = None
         try:
             db_storage = CloudStorageModel.objects.get(pk=pk)
-            credentials = Credentials()
-            credentials.convert_from_db({
-                'type': db_storage.credentials_type,
-                'value': db_storage.credentials,
-            })
-            details = {
-                'resource': db_storage.resource,
-                'credentials': credentials,
-                'specific_attributes': db_storage.get_specific_attributes()
-            }
-            storage = get_cloud_storage_instance(cloud_provider=db_storage.provider_type, **details)
+            storage = get_db_storage_instance(db_storage)
             if not db_storage.manifests.count():
                 raise Exception('There is no manifest file')
             manifest_path = request.query_params.get('manifest_path', 'manifest.jsonl')
@@ -1412,10 +1432,32 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
                 datetime.utcfromtimestamp(os.path.getmtime(full_manifest_path)).replace(tzinfo=pytz.UTC) < storage.get_file_last_modified(manifest_path):
                 storage.download_file(manifest_path, full_manifest_path)
             manifest = ImageManifestManager(full_manifest_path, db_storage.get_storage_dirname())
-            # need to update index
-            manifest.set_index()
-            manifest_files = manifest.data
-            return Response(data=manifest_files, content_type="text/plain")
+            # the index is built again only if the manifest was updated
+            manifest.refresh_index()
+            prefix = request.query_params.get('prefix')
+            if 'page' not in request.query_params and 'page_size' not in request.query_params:
+                _, manifest_files = manifest.get_names(prefix)
+                return StreamingHttpResponse(_stream_json_list(manifest_files),
+                    content_type='application/json')
+
+            page_size = CustomPagination().get_page_size(request)
+            try:
+                page_number = int(request.query_params.get('page', 1))
+            except ValueError:
+                page_number = 0
+            if page_number < 1:
+                raise ValidationError('Invalid page number: {}'.format(request.query_params.get('page')))
+            start = (page_number - 1) * page_size
+            count, manifest_files = manifest.get_names(prefix, start, start + page_size)
+            url = request.build_absolute_uri()
+            next_url = replace_query_param(url, 'page', page_number + 1) \
+                if start + page_size < count else None
+            previous_url = replace_query_param(url, 'page', page_number - 1) \
+                if page_number > 1 else None
+            head = '{{"count": {}, "next": {}, "previous": {}, "results": ['.format(
+                count, json.dumps(next_url), json.dumps(previous_url))
+            return StreamingHttpResponse(_stream_json_list(manifest_files, head, ']}'),
+                content_type='application/json')
 
         except CloudStorageModel.DoesNotExist:
             message = f"Storage {pk} does not exist"
@@ -1425,6 +1467,8 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
             msg = f"{ex.strerror} {ex.filename}"
             slogger.cloud_storage[pk].info(msg)
             return Response(data=msg, status=status.HTTP_404_NOT_FOUND)
+        except ValidationError as ex:
+            return Response(data=ex.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as ex:
             # check that cloud storage was not deleted
             storage_status = storage.get_status() if storage else None
@@ -1450,17 +1494,7 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
         try:
             db_storage = CloudStorageModel.objects.get(pk=pk)
             if not os.path.exists(db_storage.get_preview_path()):
-                credentials = Credentials()
-                credentials.convert_from_db({
-                    'type': db_storage.credentials_type,
-                    'value': db_storage.credentials,
-                })
-                details = {
-                    'resource': db_storage.resource,
-                    'credentials': credentials,
-                    'specific_attributes': db_storage.get_specific_attributes()
-                }
-                storage = get_cloud_storage_instance(cloud_provider=db_storage.provider_type, **details)
+                storage = get_db_storage_instance(db_storage)
                 if not db_storage.manifests.count():
                     raise Exception('Cannot get the cloud storage preview. There is no manifest file')
                 preview_path = None
@@ -1473,8 +1507,8 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
                         os.path.join(db_storage.get_storage_dirname(), manifest_model.filename),
                         db_storage.get_storage_dirname()
                     )
-                    # need to update index
-                    manifest.set_index()
+                    # the index is built again only if the manifest was updated
+                    manifest.refresh_index()
                     if not len(manifest):
                         continue
                     preview_info = manifest[0]
@@ -1493,7 +1527,8 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
                     raise PermissionError(errno.EACCES,
                                           "Access to the file on the '{}' cloud storage is denied".format(db_storage.display_name), preview_path)
                 with NamedTemporaryFile() as temp_image:
-                    storage.download_file(preview_path, temp_image.name)
+                    get_cloud_object_cache().download_file(db_storage.id, storage,
+                        preview_path, temp_image.name)
                     reader = ImageListReader([temp_image.name])
                     preview = reader.get_preview()
                     preview.save(db_storage.get_preview_path())
@@ -1526,17 +1561,7 @@ class CloudStorageViewSet(auth.CloudStorageGetQuerySetMixin, viewsets.ModelViewS
     def status(self, request, pk):
         try:
             db_storage = CloudStorageModel.objects.get(pk=pk)
-            credentials = Credentials()
-            credentials.convert_from_db({
-                'type': db_storage.credentials_type,
-                'value': db_storage.credentials,
-            })
-            details = {
-                'resource': db_storage.resource,
-                'credentials': credentials,
-                'specific_attributes': db_storage.get_specific_attributes()
-            }
-            storage = get_cloud_storage_instance(cloud_provider=db_storage.provider_type, **details)
+            storage = get_db_storage_instance(db_storage)
             storage_status = storage.get_status()
             return HttpResponse(storage_status)
         except CloudStorageModel.DoesNotExist:
@@ -1748,6 +1773,24 @@ class ActivityViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
 
         return Response(data.data)
 
+def _make_grade_parameters_result(certificate_image, labeled_shapes):
+    # The fields parsed from the file name are taken from the lookup table
+    certificate_id = certificate_image.certificate_id
+    order_id = certificate_image.order_id
+    orientation = certificate_image.orientation
+    image_type = certificate_image.image_type
+    image = certificate_image.image
+    data_id = image.data_id
+    filename = image.path
+    image_path = f"data/data/{data_id}/raw/{filename}"
+    width = image.width
+    height = image.height
+    image_url = f"https://ags-cvat-storage.s3.us-west-2.amazonaws.com/{order_id}-%2B{certificate_id}-%2B{orientation}_laser.png"
+    image_url_legacy = f"https://pokemon-statics.s3.amazonaws.com/media/{orientation}/{certificate_id}_{orientation}.jpg"
+    objects = [{"points": labeled_shape.points, "label": labeled_shape.label.name, "shape": labeled_shape.type} for labeled_shape in labeled_shapes]
+    payload = {"filename": filename, "objects": objects, "image": {"width": width, "height": height}}
+    return {"payload": payload, "orientation": orientation, "certificate_id": certificate_id, "image_type": image_type, "image_path": image_path, "image_url": image_url, "image_url_legacy": image_url_legacy}
+
 class GradeParametersFromCertificateView(APIView):
     def post(self, request):
         try:
@@ -1758,41 +1801,99 @@ class GradeParametersFromCertificateView(APIView):
                 image_type = serializer.data.get("image_type")
                 task_status = serializer.data.get("task_status")
 
-                image = Image.objects.filter(
-                    (Q(path__icontains=f"-+{certificate_id}-+") | Q(path__icontains=f"-+{certificate_id}_")) &
-                    Q(path__icontains=f"{orientation}_") &
-                    Q(path__icontains=f"_{image_type}")
-                ).latest('id')
-                data_id = image.data_id
-                order_id = image.path.split('-+')[0]
+                certificate_image = CertificateImage.objects.select_related('image', 'job__segment__task').filter(
+                    certificate_id=certificate_id, orientation=orientation, image_type=image_type
+                ).latest('image_id')
+                image = certificate_image.image
+                data_id = certificate_image.data_id
+                order_id = certificate_image.order_id
+                job = certificate_image.job
+                if job is None:
+                    job = Job.objects.select_related('segment__task').get(segment__task__data_id=data_id)
                 if task_status:
-                    task = Task.objects.get(data_id=data_id)
+                    task = job.segment.task
                     if task.status != task_status:
                         return Response({"order_id": order_id, "certificate_id": certificate_id, "result": None})
 
-                job = Job.objects.get(segment__task__data_id=data_id)
-                filename = image.path
-                image_path = f"data/data/{data_id}/raw/{filename}"
-                width = image.width
-                height = image.height
-                filename_regex = re.match(r"^((.*)[_-])?(front|back)[_-](laser|cam)\.(.*)$", filename.split('-+')[-1])
-                orientation = filename_regex[3]
-                image_type = filename_regex[4]
-                image_url = f"https://ags-cvat-storage.s3.us-west-2.amazonaws.com/{order_id}-%2B{certificate_id}-%2B{orientation}_laser.png"
-                image_url_legacy = f"https://pokemon-statics.s3.amazonaws.com/media/{orientation}/{certificate_id}_{orientation}.jpg"
                 labeled_shapes = LabeledShape.objects.select_related('label').filter(job_id=job.id, frame=image.frame)
-                objects = [{"points": labeled_shape.points, "label": labeled_shape.label.name, "shape": labeled_shape.type} for labeled_shape in labeled_shapes]
-                payload = {"filename": filename, "objects": objects, "image": {"width": width, "height": height}}
-                result = {"payload": payload, "orientation": orientation, "certificate_id": certificate_id, "image_type": image_type, "image_path": image_path, "image_url": image_url, "image_url_legacy": image_url_legacy}
+                result = _make_grade_parameters_result(certificate_image, labeled_shapes)
 
                 return Response({"order_id": order_id, "certificate_id": certificate_id, "result": result})
 
-        except Image.DoesNotExist:
+        except CertificateImage.DoesNotExist:
             message = 'No suitable image found for the certificate'
             return HttpResponseNotFound(message)
         except Exception as e:
             return HttpResponseBadRequest(str(e))
 
+class GradeParametersBulkView(APIView):
+    def post(self, request):
+        try:
+            serializer = GradeParametersBulkSerializer(data=request.data)
+            if serializer.is_valid(raise_exception=True):
+                certificates = serializer.validated_data.get("certificates")
+                image_type = serializer.validated_data.get("image_type")
+                task_status = serializer.validated_data.get("task_status")
+
+                # The latest image wins if a certificate was scanned several times
+                certificate_images = {}
+                for certificate_image in CertificateImage.objects.select_related('image', 'job__segment__task').filter(
+                    certificate_id__in={c["certificate_id"] for c in certificates},
+                    orientation__in={c["orientation"] for c in certificates},
+                    image_type=image_type,
+                ).order_by('image_id'):
+                    certificate_images[(certificate_image.certificate_id, certificate_image.orientation)] = certificate_image
+
+                # Rows indexed before their jobs were created are resolved with one extra query
+                missing_job_data_ids = {ci.data_id for ci in certificate_images.values() if ci.job_id is None}
+                data_jobs = {}
+                if missing_job_data_ids:
+                    for db_job in Job.objects.select_related('segment__task').filter(
+                            segment__task__data_id__in=missing_job_data_ids).order_by('segment__start_frame'):
+                        data_jobs.setdefault(db_job.segment.task.data_id, db_job)
+
+                jobs = {}
+                for key, certificate_image in certificate_images.items():
+                    job = certificate_image.job or data_jobs.get(certificate_image.data_id)
+                    if job is not None and (not task_status or job.segment.task.status == task_status):
+                        jobs[key] = job
+
+                shapes = {}
+                if jobs:
+                    for labeled_shape in LabeledShape.objects.select_related('label').filter(
+                        job_id__in={job.id for job in jobs.values()},
+                        frame__in={certificate_images[key].frame for key in jobs},
+                    ):
+                        shapes.setdefault((labeled_shape.job_id, labeled_shape.frame), []).append(labeled_shape)
+
+                results = []
+                for certificate in certificates:
+                    certificate_id = certificate["certificate_id"]
+                    orientation = certificate["orientation"]
+                    key = (certificate_id, orientation)
+                    certificate_image = certificate_images.get(key)
+                    if certificate_image is None:
+                        results.append({"order_id": None, "certificate_id": certificate_id,
+                            "orientation": orientation, "result": None, "error": "not_found"})
+                        continue
+
+                    order_id = certificate_image.order_id
+                    job = jobs.get(key)
+                    if job is None:
+                        results.append({"order_id": order_id, "certificate_id": certificate_id,
+                            "orientation": orientation, "result": None})
+                        continue
+
+                    result = _make_grade_parameters_result(certificate_image,
+                        shapes.get((job.id, certificate_image.frame), []))
+                    results.append({"order_id": order_id, "certificate_id": certificate_id,
+                        "orientation": orientation, "result": result})
+
+                return Response({"results": results})
+
+        except Exception as e:
+            return HttpResponseBadRequest(str(e))
+
 class GradeParametersFromFileNameView(APIView):
     def post(self, request):
         try:
@@ -1800,11 +1901,25 @@ class GradeParametersFromFileNameView(APIView):
             if serializer.is_valid(raise_exception=True):
                 filename = serializer.data.get("filename")
 
-                images = Image.objects.filter(path__icontains=filename)
+                # Full certificate file names are resolved through the lookup table,
+                # only arbitrary fragments of a path need a scan of the image table
+                fields = parse_certificate_image_path(filename)
+                if fields is not None:
+                    images = Image.objects.select_related('certificate').filter(
+                        certificate__certificate_id=fields['certificate_id'],
+                        certificate__orientation=fields['orientation'],
+                        certificate__image_type=fields['image_type'],
+                        path__icontains=filename)
+                else:
+                    images = Image.objects.select_related('certificate').filter(path__icontains=filename)
                 results = []
                 for image in images:
                     data_id = image.data_id
-                    job = Job.objects.get(segment__task__data_id=data_id)
+                    certificate_image = getattr(image, 'certificate', None)
+                    if certificate_image is not None and certificate_image.job_id is not None:
+                        job_id = certificate_image.job_id
+                    else:
+                        job_id = Job.objects.get(segment__task__data_id=data_id).id
                     filename = image.path
                     image_path = f"data/data/{data_id}/raw/{filename}"
                     width = image.width
@@ -1830,7 +1945,7 @@ class GradeParametersFromFileNameView(APIView):
                         # Handle URLs for filenames that don't match the pattern
                         image_url = f"https://ags-cvat-storage.s3.us-west-2.amazonaws.com/{filename}"
                         image_url_legacy = f"https://pokemon-statics.s3.amazonaws.com/media/{orientation}/{filename}"
-                    labeled_shapes = LabeledShape.objects.select_related('label').filter(job_id=job.id, frame=image.frame)
+                    labeled_shapes = LabeledShape.objects.select_related('label').filter(job_id=job_id, frame=image.frame)
                     objects = [{"points": labeled_shape.points, "label": labeled_shape.label.name, "shape": labeled_shape.type} for labeled_shape in labeled_shapes]
                     payload = {"filename": filename, "objects": objects, "image": {"width": width, "height": height}}
                     result = {"payload": payload, "order_id": order_id, "certificate_id": certificate_id, "orientation": orientation, "image_type": image_type, "image_path": image_path, "image_url": image_url, "image_url_legacy": image_url_legacy}
@@ -1892,14 +2007,17 @@ class CheckDuplicateCertificatesView(APIView):
             if serializer.is_valid(raise_exception=True):
                 certificate_ids = serializer.data.get("certificate_ids")
 
+                certificate_ids = certificate_ids.split(',')
+                image_counts = {
+                    (row['certificate_id'], row['orientation']): row['count']
+                    for row in CertificateImage.objects.filter(certificate_id__in=certificate_ids) \
+                        .values('certificate_id', 'orientation').annotate(count=Count('id')).order_by()
+                }
+
                 results = []
-                for certificate_id in certificate_ids.split(','):
-                    front_image_count = Image.objects.filter(
-                        Q(path__icontains=f"-+{certificate_id}-+front") | Q(path__icontains=f"-+{certificate_id}_front")
-                    ).count()
-                    back_image_count = Image.objects.filter(
-                        Q(path__icontains=f"-+{certificate_id}-+back") | Q(path__icontains=f"-+{certificate_id}_back")
-                    ).count()
+                for certificate_id in certificate_ids:
+                    front_image_count = image_counts.get((certificate_id, CARD_ORIENTATION_FRONT), 0)
+                    back_image_count = image_counts.get((certificate_id, CARD_ORIENTATION_BACK), 0)
 
                     payload = None
                     if front_image_count > 1 and back_image_count > 1:
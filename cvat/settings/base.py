@@ -374,6 +374,13 @@ os.makedirs(MIGRATIONS_LOGS_ROOT, exist_ok=True)
 CLOUD_STORAGE_ROOT = os.path.join(DATA_ROOT, 'storages')
 os.makedirs(CLOUD_STORAGE_ROOT, exist_ok=True)
 
+# Local copies of cloud storage objects used to build chunks and previews
+CLOUD_OBJECT_CACHE_ROOT = os.path.join(DATA_ROOT, 'cloud_cache')
+os.makedirs(CLOUD_OBJECT_CACHE_ROOT, exist_ok=True)
+CLOUD_OBJECT_CACHE_SIZE = int(os.getenv('CVAT_CLOUD_OBJECT_CACHE_SIZE', 2 ** 35)) # 32 Gb
+# Seconds during which a cached object is used without checking its ETag
+CLOUD_OBJECT_CACHE_ETAG_TTL = int(os.getenv('CVAT_CLOUD_OBJECT_CACHE_ETAG_TTL', 60))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -482,4 +489,38 @@ CACHES = {
 
 USE_CACHE = True
 
+# Upper bound (in bytes) of opened chunks kept by every server process
+# to serve sequential frame requests without decoding a chunk again
+FRAME_PROVIDER_CACHE_SIZE = int(os.getenv('CVAT_FRAME_PROVIDER_CACHE_SIZE', 256 * 1024 * 1024))
+
+# Chunks are prepared in advance on the 'low' queue: the first chunk of every job
+# after a task is created and the next chunks when a chunk is requested.
+# The budget limits the number of queued and running warm-up jobs.
+CHUNK_WARM_UP_MAX_JOBS = int(os.getenv('CVAT_CHUNK_WARM_UP_MAX_JOBS', 4))
+CHUNK_PREFETCH_DEPTH = int(os.getenv('CVAT_CHUNK_PREFETCH_DEPTH', 2))
+
+# Number of processes which encode image chunks during task creation. Every
+# RQ worker creates its own pool, so the default is small.
+CHUNK_ENCODING_WORKERS = int(os.getenv('CVAT_CHUNK_ENCODING_WORKERS', 2))
+
+# Number of workers which read image headers while a manifest is created.
+# Every RQ worker creates its own pool, so the default is small.
+MANIFEST_CREATION_WORKERS = int(os.getenv('CVAT_MANIFEST_CREATION_WORKERS', 2))
+
+# Number of threads which download images of a chunk from a cloud storage
+CLOUD_STORAGE_DOWNLOAD_WORKERS = int(os.getenv('CVAT_CLOUD_STORAGE_DOWNLOAD_WORKERS', 8))
+
+# Number of cloud storage clients which a process keeps open for reuse
+CLOUD_STORAGE_MAX_CLIENTS = int(os.getenv('CVAT_CLOUD_STORAGE_MAX_CLIENTS', 32))
+
+# Videos on cloud storages are read by ranged requests of CLOUD_STORAGE_READ_BLOCK_SIZE
+# bytes, and a reader keeps CLOUD_STORAGE_READ_CACHED_BLOCKS last read blocks in memory
+CLOUD_STORAGE_READ_BLOCK_SIZE = int(os.getenv('CVAT_CLOUD_STORAGE_READ_BLOCK_SIZE', 2 ** 20)) # 1 Mb
+CLOUD_STORAGE_READ_CACHED_BLOCKS = int(os.getenv('CVAT_CLOUD_STORAGE_READ_CACHED_BLOCKS', 64))
+
+# Activity and annotation logs are written in batches by a background thread
+# at least every LOG_BUFFER_FLUSH_INTERVAL seconds. 0 writes them synchronously.
+LOG_BUFFER_FLUSH_INTERVAL = float(os.getenv('CVAT_LOG_BUFFER_FLUSH_INTERVAL', 2))
+LOG_BUFFER_BATCH_SIZE = int(os.getenv('CVAT_LOG_BUFFER_BATCH_SIZE', 500))
+
 REVIEWER_SPECIAL_LABELS = os.getenv("REVIEWER_SPECIAL_LABELS", "reviewer,grader-minor,grader-major").split(",")
\ No newline at end of file
@@ -29,6 +29,12 @@ os.makedirs(MODELS_ROOT, exist_ok=True)
 CACHE_ROOT = os.path.join(DATA_ROOT, 'cache')
 os.makedirs(CACHE_ROOT, exist_ok=True)
 
+CLOUD_STORAGE_ROOT = os.path.join(DATA_ROOT, 'storages')
+os.makedirs(CLOUD_STORAGE_ROOT, exist_ok=True)
+
+CLOUD_OBJECT_CACHE_ROOT = os.path.join(DATA_ROOT, 'cloud_cache')
+os.makedirs(CLOUD_OBJECT_CACHE_ROOT, exist_ok=True)
+
 # To avoid ERROR django.security.SuspiciousFileOperation:
 # The joined path (...) is located outside of the base path component
 MEDIA_ROOT = BASE_DIR
@@ -40,6 +46,8 @@ for logger in LOGGING["loggers"].values():
 
 LOGGING["handlers"]["server_file"] = LOGGING["handlers"]["console"]
 
+LOG_BUFFER_FLUSH_INTERVAL = 0
+
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.MD5PasswordHasher',
 )
@@ -0,0 +1,101 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import cronjob
+
+
+class _ScanLogs:
+    def add(self, *args):
+        pass
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._tmp_dir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def test_marks_of_the_same_day_are_restored(self):
+        checkpoint = cronjob.Checkpoint(self.path, date=datetime.date(2022, 3, 1))
+        checkpoint.mark(1, 'front', 'completed')
+        checkpoint.flush()
+
+        checkpoint = cronjob.Checkpoint(self.path, date=datetime.date(2022, 3, 1))
+
+        self.assertEqual(checkpoint.get(1, 'front'), 'completed')
+        self.assertEqual(checkpoint.scanned('front'), 1)
+
+    def test_checkpoint_of_another_day_is_discarded(self):
+        checkpoint = cronjob.Checkpoint(self.path, date=datetime.date(2022, 3, 1))
+        checkpoint.mark(1, 'front', 'completed')
+        checkpoint.flush()
+
+        checkpoint = cronjob.Checkpoint(self.path, date=datetime.date(2022, 3, 2))
+
+        self.assertIsNone(checkpoint.get(1, 'front'))
+        self.assertEqual(checkpoint.scanned('front'), 0)
+
+    def test_checkpoint_without_date_is_discarded(self):
+        with open(self.path, 'w') as f:
+            json.dump({'front': {'1': 'completed'}, 'back': {}}, f)
+
+        checkpoint = cronjob.Checkpoint(self.path)
+
+        self.assertEqual(checkpoint.scanned('front'), 0)
+
+class ScanSideTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._tmp_dir, 'checkpoint.json')
+        self.uploaded = []
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _get_grade_parameters_bulk(self, cert_ids, orientation, session):
+        return [{"certificate_id": cert_id, "order_id": "ORD", "result": {}}
+            for cert_id in cert_ids]
+
+    def _upload_one_side(self, item, orientation, session, scan_logs, stats):
+        self.uploaded.append(item["certificate_id"])
+        return 'completed'
+
+    def _scan(self, checkpoint, missing_list, daily_scan_amount):
+        with mock.patch.object(cronjob, 'get_grade_parameters_bulk', self._get_grade_parameters_bulk), \
+                mock.patch.object(cronjob, 'upload_one_side', self._upload_one_side), \
+                ThreadPoolExecutor(max_workers=2) as executor:
+            cronjob.scan_side(missing_list, 'front', daily_scan_amount, executor, None,
+                _ScanLogs(), checkpoint, cronjob.Stats(), batch_size=2)
+        checkpoint.flush()
+
+    def test_interrupted_run_is_resumed(self):
+        today = datetime.date(2022, 3, 1)
+        checkpoint = cronjob.Checkpoint(self.path, date=today)
+        checkpoint.mark(1, 'front', 'completed')
+        checkpoint.mark(2, 'front', 'cvat-missing')
+        checkpoint.flush()
+
+        self._scan(cronjob.Checkpoint(self.path, date=today), [1, 2, 3, 4, 5], 4)
+
+        # the marked certificates are skipped and count against the quota
+        self.assertEqual(self.uploaded, [3, 4])
+
+    def test_stale_checkpoint_does_not_count_against_the_quota(self):
+        checkpoint = cronjob.Checkpoint(self.path, date=datetime.date(2022, 3, 1))
+        checkpoint.mark(1, 'front', 'completed')
+        checkpoint.mark(2, 'front', 'completed')
+        checkpoint.flush()
+
+        self._scan(cronjob.Checkpoint(self.path, date=datetime.date(2022, 3, 2)), [1, 2, 3], 3)
+
+        self.assertEqual(self.uploaded, [1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,16 @@
 # SPDX-License-Identifier: MIT
 
 import av
+import itertools
 import json
+import mmap
 import os
 from abc import ABC, abstractmethod, abstractproperty
+import functools
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import closing
 from tempfile import NamedTemporaryFile
 
@@ -142,6 +149,13 @@ class KeyFramesVideoStreamReader(VideoStreamReader):
                                 yield (index, key_frame['pts'], key_frame['md5'])
                     index += 1
 
+def _get_image_properties(image, use_image_hash):
+    # Image.open() reads only the header, pixel data is decoded only to compute the checksum
+    with Image.open(image, mode='r') as img:
+        width, height = img.width, img.height
+        checksum = md5_hash(img) if use_image_hash else None
+    return width, height, checksum
+
 class DatasetImagesReader:
     def __init__(self,
                 sources,
@@ -151,6 +165,7 @@ class DatasetImagesReader:
                 start = 0,
                 step = 1,
                 stop = None,
+                workers = 1,
                 *args,
                 **kwargs):
         self._sources = sources if is_sorted else sorted(sources)
@@ -160,6 +175,7 @@ class DatasetImagesReader:
         self._start = start
         self._stop = stop if stop else len(sources)
         self._step = step
+        self._workers = max(int(workers or 1), 1)
 
     @property
     def start(self):
@@ -185,25 +201,54 @@ class DatasetImagesReader:
     def step(self, value):
         self._step = int(value)
 
+    @property
+    def workers(self):
+        return self._workers
+
+    @workers.setter
+    def workers(self, value):
+        self._workers = max(int(value or 1), 1)
+
+    def _read_properties(self, images):
+        """Yields (image, (width, height, checksum)) in the order of images"""
+        if self._workers <= 1:
+            for image in images:
+                yield image, _get_image_properties(image, self._use_image_hash)
+            return
+
+        # Reading headers is I/O bound, but hashing requires decoding of the whole image
+        Executor = ProcessPoolExecutor if self._use_image_hash else ThreadPoolExecutor
+        with Executor(max_workers=self._workers) as executor:
+            pending = deque()
+            for image in images:
+                pending.append((image,
+                    executor.submit(_get_image_properties, image, self._use_image_hash)))
+                # Limit the number of submitted tasks for large datasets
+                if len(pending) >= 4 * self._workers:
+                    image, future = pending.popleft()
+                    yield image, future.result()
+            while pending:
+                image, future = pending.popleft()
+                yield image, future.result()
+
     def __iter__(self):
-        sources = (i for i in self._sources)
+        images = self._read_properties(itertools.islice(self._sources, len(self.range_)))
         for idx in range(self._stop):
             if idx in self.range_:
-                image = next(sources)
-                img = Image.open(image, mode='r')
+                image, (width, height, checksum) = next(images)
                 img_name = os.path.relpath(image, self._data_dir) if self._data_dir \
                     else os.path.basename(image)
                 name, extension = os.path.splitext(img_name)
                 image_properties = {
                     'name': name.replace('\\', '/'),
                     'extension': extension,
-                    'width': img.width,
-                    'height': img.height,
+                    'width': width,
+                    'height': height,
                 }
                 if self._meta and img_name in self._meta:
                     image_properties['meta'] = self._meta[img_name]
                 if self._use_image_hash:
-                    image_properties['checksum'] = md5_hash(img)
+                    image_properties['checksum'] = checksum
                 yield image_properties
             else:
                 yield dict()
@@ -255,66 +300,160 @@ class _Manifest:
         return os.path.basename(self._path) if not self._upload_dir \
             else os.path.relpath(self._path, self._upload_dir)
 
-# Needed for faster iteration over the manifest file, will be generated to work inside CVAT
-# and will not be generated when manually creating a manifest
-class _Index:
-    FILE_NAME = 'index.json'
+def _get_index_path(manifest_path, file_name):
+    """ Indices of the default manifest keep their names, and indices of other
+    manifests in the same directory are prefixed by the manifest names """
+    directory, manifest_name = os.path.split(manifest_path)
+    assert directory and os.path.isdir(directory), 'No index directory path'
+    if manifest_name != _Manifest.FILE_NAME:
+        file_name = '{}.{}'.format(manifest_name, file_name)
+    return os.path.join(directory, file_name)
+
+# A flat array of 64-bit line offsets of a manifest (native byte order) stored in a file.
+# The file is mapped into memory, so it is loaded in O(1) and shared by all processes reading it.
+class _LineOffsets:
+    TYPECODE = 'Q'
 
     def __init__(self, path):
-        assert path and os.path.isdir(path), 'No index directory path'
-        self._path = os.path.join(path, self.FILE_NAME)
-        self._index = {}
+        self._path = path
+        self._index = array(self.TYPECODE)
 
     @property
     def path(self):
         return self._path
 
+    def exists(self):
+        return os.path.exists(self._path)
+
+    def is_actual(self, manifest):
+        """ The offsets are actual if they were written after the manifest had been modified """
+        return os.path.exists(self._path) and \
+            os.path.getmtime(self._path) >= os.path.getmtime(manifest)
+
     def dump(self):
-        with open(self._path, 'w') as index_file:
-            json.dump(self._index, index_file,  separators=(',', ':'))
+        # readers may have the previous file mapped, so it is replaced, not rewritten
+        with NamedTemporaryFile(mode='wb', dir=os.path.dirname(self._path),
+                prefix=os.path.basename(self._path), delete=False) as index_file:
+            index_file.write(memoryview(self._index).cast('B'))
+        os.replace(index_file.name, self._path)
+
+    def load(self):
+        with open(self._path, 'rb') as index_file:
+            if os.fstat(index_file.fileno()).st_size:
+                mapped_file = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._index = memoryview(mapped_file).cast(self.TYPECODE)
+            else:
+                self._index = array(self.TYPECODE)
+
+    def remove(self):
+        self._index = array(self.TYPECODE)
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+    def __getitem__(self, number):
+        assert 0 <= number < len(self), \
+            'A invalid index number: {}\nMax: {}'.format(number, len(self))
+        return self._index[number]
+
+    def __len__(self):
+        return len(self._index)
+
+# Needed for faster iteration over the manifest file, will be generated to work inside CVAT
+# and will not be generated when manually creating a manifest.
+# The index keeps the offsets of the manifest lines in the order of the lines.
+class _Index(_LineOffsets):
+    FILE_NAME = 'index.bin'
+    LEGACY_FILE_NAME = 'index.json'
+
+    def __init__(self, manifest_path):
+        super().__init__(_get_index_path(manifest_path, self.FILE_NAME))
+        # only the default manifest had a JSON index
+        self._legacy_path = os.path.join(os.path.dirname(manifest_path), self.LEGACY_FILE_NAME) \
+            if os.path.basename(manifest_path) == _Manifest.FILE_NAME else None
+
+    def exists(self):
+        return super().exists() or bool(self._legacy_path and os.path.exists(self._legacy_path))
 
     def load(self):
-        with open(self._path, 'r') as index_file:
-            self._index = json.load(index_file,
-                object_hook=lambda d: {int(k): v for k, v in d.items()})
+        if not os.path.exists(self._path) and self._legacy_path and \
+                os.path.exists(self._legacy_path):
+            self._migrate_legacy_index()
+        super().load()
+
+    def _migrate_legacy_index(self):
+        with open(self._legacy_path, 'r') as index_file:
+            legacy_index = json.load(index_file)
+        self._index = array(self.TYPECODE,
+            (legacy_index[key] for key in sorted(legacy_index, key=int)))
+        self.dump()
+        try:
+            os.remove(self._legacy_path)
+        except FileNotFoundError:
+            pass # migrated by another process
 
     def remove(self):
-        os.remove(self._path)
+        super().remove()
+        if self._legacy_path and os.path.exists(self._legacy_path):
+            os.remove(self._legacy_path)
 
     def create(self, manifest, skip):
         assert os.path.exists(manifest), 'A manifest file not exists, index cannot be created'
-        with open(manifest, 'r+') as manifest_file:
-            while skip:
-                manifest_file.readline()
-                skip -= 1
-            image_number = 0
-            position = manifest_file.tell()
-            line = manifest_file.readline()
-            while line:
-                if line.strip():
-                    self._index[image_number] = position
-                    image_number += 1
-                    position = manifest_file.tell()
-                line = manifest_file.readline()
+        self._index = array(self.TYPECODE)
+        with open(manifest, 'rb') as manifest_file:
+            position = 0
+            for line in manifest_file:
+                if skip:
+                    skip -= 1
+                elif line.strip():
+                    self._index.append(position)
+                position += len(line)
 
     def partial_update(self, manifest, number):
         assert os.path.exists(manifest), 'A manifest file not exists, index cannot be updated'
-        with open(manifest, 'r+') as manifest_file:
-            manifest_file.seek(self._index[number])
-            line = manifest_file.readline()
-            while line:
+        index = array(self.TYPECODE, self._index[:number])
+        with open(manifest, 'rb') as manifest_file:
+            position = self._index[number]
+            manifest_file.seek(position)
+            for line in manifest_file:
                 if line.strip():
-                    self._index[number] = manifest_file.tell()
-                    number += 1
-                line = manifest_file.readline()
+                    index.append(position)
+                position += len(line)
+        self._index = index
 
-    def __getitem__(self, number):
-        assert 0 <= number < len(self), \
-            'A invalid index number: {}\nMax: {}'.format(number, len(self))
-        return self._index[number]
+# The offsets of the image lines in the order of the file names. It allows
+# to find the images with a common prefix by a binary search.
+class _NameIndex(_LineOffsets):
+    FILE_NAME = 'name_index.bin'
+
+    def __init__(self, manifest_path):
+        super().__init__(_get_index_path(manifest_path, self.FILE_NAME))
+
+    def create(self, manifest, skip):
+        assert os.path.exists(manifest), 'A manifest file not exists, index cannot be created'
+        names = []
+        with open(manifest, 'rb') as manifest_file:
+            position = 0
+            for line in manifest_file:
+                if skip:
+                    skip -= 1
+                elif line.strip():
+                    image = json.loads(line)
+                    names.append((f"{image['name']}{image['extension']}", position))
+                position += len(line)
+        names.sort()
+        self._index = array(self.TYPECODE, (position for _, position in names))
+
+class _IndexedNames:
+    """ A lazy sequence of the file names in the order of a name index """
+    def __init__(self, manifest_manager, name_index):
+        self._manifest_manager = manifest_manager
+        self._name_index = name_index
 
     def __len__(self):
-        return len(self._index)
+        return len(self._name_index)
+
+    def __getitem__(self, number):
+        return self._manifest_manager._read_name(self._name_index[number])
 
 def _set_index(func):
     def wrapper(self, *args, **kwargs):
@@ -336,48 +475,93 @@ class _ManifestManager(ABC):
 
     def __init__(self, path, create_index, upload_dir=None, *args, **kwargs):
         self._manifest = _Manifest(path, upload_dir)
-        self._index = _Index(os.path.dirname(self._manifest.path))
+        self._index = _Index(self._manifest.path)
         self._reader = None
         self._create_index = create_index
+        self._manifest_file = None
+
+    def __del__(self):
+        self.close()
 
     @property
     def reader(self):
         return self._reader
 
+    def _get_manifest_file(self):
+        """ The manifest file is opened once and kept open for random access """
+        if self._manifest_file is None:
+            self._manifest_file = open(self._manifest.path, 'rb')
+        return self._manifest_file
+
+    def close(self):
+        if getattr(self, '_manifest_file', None) is not None:
+            self._manifest_file.close()
+            self._manifest_file = None
+
     def _parse_line(self, line):
         """ Getting a random line from the manifest file """
-        with open(self._manifest.path, 'r') as manifest_file:
-            if isinstance(line, str):
-                assert line in self.BASE_INFORMATION.keys(), \
-                    'An attempt to get non-existent information from the manifest'
-                for _ in range(self.BASE_INFORMATION[line]):
-                    fline = manifest_file.readline()
-                return json.loads(fline)[line]
-            else:
-                assert self._index, 'No prepared index'
-                offset = self._index[line]
-                manifest_file.seek(offset)
-                properties = manifest_file.readline()
-                parsed_properties = json.loads(properties)
-                self._json_item_is_valid(**parsed_properties)
-                return parsed_properties
+        manifest_file = self._get_manifest_file()
+        if isinstance(line, str):
+            assert line in self.BASE_INFORMATION.keys(), \
+                'An attempt to get non-existent information from the manifest'
+            manifest_file.seek(0)
+            for _ in range(self.BASE_INFORMATION[line]):
+                fline = manifest_file.readline()
+            return json.loads(fline)[line]
+        else:
+            assert self._index, 'No prepared index'
+            offset = self._index[line]
+            manifest_file.seek(offset)
+            properties = manifest_file.readline()
+            parsed_properties = json.loads(properties)
+            self._json_item_is_valid(**parsed_properties)
+            return parsed_properties
+
+    def get_range(self, start, stop, step=1):
+        """ Reads the lines [start, stop) with one sequential read """
+        assert self._index, 'No prepared index'
+        stop = min(stop, len(self._index))
+        if start >= stop:
+            return []
+        manifest_file = self._get_manifest_file()
+        manifest_file.seek(self._index[start])
+        content = manifest_file.read(self._index[stop - 1] - self._index[start])
+        content += manifest_file.readline()
+
+        items = []
+        lines = (line for line in content.splitlines() if line.strip())
+        for line in itertools.islice(lines, 0, None, step):
+            parsed_properties = json.loads(line)
+            self._json_item_is_valid(**parsed_properties)
+            items.append(parsed_properties)
+        return items
 
     def init_index(self):
-        if os.path.exists(self._index.path):
+        if self._index.exists():
             self._index.load()
         else:
             self._index.create(self._manifest.path, 3 if self._manifest.TYPE == 'video' else 2)
             self._index.dump()
 
     def reset_index(self):
-        if os.path.exists(self._index.path):
+        if self._index.exists():
             self._index.remove()
 
     def set_index(self):
         self.reset_index()
         self.init_index()
 
+    def refresh_index(self):
+        """ Loads the index and builds it again only if the manifest has been modified
+        after it. The index is replaced, so readers in other processes are not affected """
+        if self._index.is_actual(self._manifest.path):
+            self._index.load()
+        else:
+            self._index.create(self._manifest.path, 3 if self._manifest.TYPE == 'video' else 2)
+            self._index.dump()
+
     def remove(self):
+        self.close()
         self.reset_index()
         if os.path.exists(self.manifest.path):
             os.remove(self.manifest.path)
@@ -428,6 +612,18 @@ class _ManifestManager(ABC):
     def get_subset(self, subset_names):
         pass
 
+@functools.lru_cache(maxsize=64)
+def _read_key_frames(manifest_path, skip, mtime, size):
+    """ The modification time and the size are the part of the cache key only """
+    numbers, timestamps = [], []
+    with open(manifest_path, 'rb') as manifest_file:
+        for line in itertools.islice(manifest_file, skip, None):
+            if line.strip():
+                key_frame = json.loads(line)
+                numbers.append(key_frame['number'])
+                timestamps.append(key_frame['pts'])
+    return numbers, timestamps
+
 class VideoManifestManager(_ManifestManager):
     _requared_item_attributes = {'number', 'pts'}
 
@@ -473,6 +669,7 @@ class VideoManifestManager(_ManifestManager):
     @_set_index
     def create(self, _tqdm=None):
         """ Creating and saving a manifest file """
+        self.close()
         if not len(self._reader):
             with NamedTemporaryFile(mode='w', delete=False)as tmp_file:
                 self._write_core_part(tmp_file, _tqdm)
@@ -490,6 +687,13 @@ class VideoManifestManager(_ManifestManager):
     def partial_update(self, number, properties):
         pass
 
+    @property
+    def key_frames(self):
+        """ Frame numbers and timestamps of the key frames, cached per manifest file """
+        stat = os.stat(self._manifest.path)
+        return _read_key_frames(self._manifest.path, self.BASE_INFORMATION['properties'],
+            stat.st_mtime_ns, stat.st_size)
+
     @property
     def video_name(self):
         return self['properties']['name']
@@ -586,8 +790,11 @@ class ImageManifestManager(_ManifestManager):
             file.write(f"{json_line}\n")
 
     @_set_index
-    def create(self, content=None, _tqdm=None):
+    def create(self, content=None, _tqdm=None, workers=None):
         """ Creating and saving a manifest file for the specialized dataset"""
+        self.close()
+        if not content and workers is not None:
+            self._reader.workers = workers
         with open(self._manifest.path, 'w') as manifest_file:
             self._write_base_information(manifest_file)
             obj = content if content else self._reader
@@ -600,6 +807,40 @@ class ImageManifestManager(_ManifestManager):
     def data(self):
         return (f"{image['name']}{image['extension']}" for _, image in self)
 
+    def _read_name(self, offset):
+        manifest_file = self._get_manifest_file()
+        manifest_file.seek(offset)
+        image = json.loads(manifest_file.readline())
+        return f"{image['name']}{image['extension']}"
+
+    def get_names(self, prefix=None, start=0, stop=None):
+        """ Returns the number of files which names start with the prefix and
+        the names of the files [start, stop) of them. Without a prefix, files
+        go in the manifest order, otherwise in the order of their names. """
+        if not prefix:
+            count = len(self._index)
+            # the names are read lazily, so the empty manifest mustn't be read at all
+            if not count or start >= count:
+                return count, iter(())
+            if stop is None or stop >= count:
+                return count, itertools.islice(self.data, start, None)
+            return count, (f"{image['name']}{image['extension']}"
+                for image in self.get_range(start, stop))
+
+        name_index = _NameIndex(self._manifest.path)
+        if name_index.is_actual(self._manifest.path):
+            name_index.load()
+        else:
+            name_index.create(self._manifest.path, 2)
+            name_index.dump()
+
+        names = _IndexedNames(self, name_index)
+        first = bisect_left(names, prefix)
+        # all names with the prefix are less than the prefix followed by the greatest code point
+        last = bisect_left(names, prefix + chr(0x10FFFF), lo=first)
+        stop = last if stop is None else min(first + stop, last)
+        return last - first, (names[number] for number in range(first + start, stop))
+
     def get_subset(self, subset_names):
         return ({
             'name': f"{image['name']}",
@@ -17,6 +17,8 @@ def get_args():
              'if by default the video does not meet the requirements and a manifest file is not prepared')
     parser.add_argument('--output-dir',type=str, help='Directory where the manifest file will be saved',
         default=os.getcwd())
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+        help='Number of parallel workers used to read images (default: %(default)s)')
     parser.add_argument('source', type=str, help='Source paths')
     return parser.parse_args()
 
@@ -65,7 +67,7 @@ def main():
             manifest = ImageManifestManager(manifest_path=manifest_directory)
             manifest.link(sources=sources, meta=meta, is_sorted=False,
                     use_image_hash=True, data_dir=data_dir)
-            manifest.create(_tqdm=tqdm)
+            manifest.create(_tqdm=tqdm, workers=args.workers)
         except Exception as ex:
             sys.exit(str(ex))
     else: # video